@@ -4,7 +4,7 @@ Agent Orchestrator - Multi-agent coordination
 from typing import List, Optional, Dict
 import asyncio
 import time
-from app.services.ai_service import AIService
+from app.services.ai_service import AIService, get_ai_service
 from app.services.tools.web_search import WebSearchTool
 from app.services.tools.code_executor import CodeExecutor
 
@@ -12,8 +12,8 @@ from app.services.tools.code_executor import CodeExecutor
 class AgentOrchestrator:
     """Orchestrates multiple AI agents for complex tasks"""
     
-    def __init__(self):
-        self.ai_service = AIService()
+    def __init__(self, ai_service: Optional[AIService] = None):
+        self.ai_service = ai_service or get_ai_service()
         self.agents = {
             "researcher": self._research_agent,
             "coder": self._code_agent,
@@ -111,7 +111,7 @@ class AgentOrchestrator:
         """Code agent for code generation"""
         prompt = f"Generate code for: {task}. Provide only the code without explanations."
         response = ""
-        async for chunk in self.ai_service.stream_chat(prompt, model="gpt-4"):
+        async for chunk in self.ai_service.stream_chat(prompt, model="gpt-4", priority="batch"):
             response += chunk
         return response
     
@@ -119,7 +119,7 @@ class AgentOrchestrator:
         """Analysis agent for data analysis"""
         prompt = f"Analyze and provide insights for: {task}"
         response = ""
-        async for chunk in self.ai_service.stream_chat(prompt, model="gpt-4"):
+        async for chunk in self.ai_service.stream_chat(prompt, model="gpt-4", priority="batch"):
             response += chunk
         return response
     
@@ -127,7 +127,7 @@ class AgentOrchestrator:
         """Writing agent for content creation"""
         prompt = f"Write high-quality content for: {task}"
         response = ""
-        async for chunk in self.ai_service.stream_chat(prompt, model="gpt-4"):
+        async for chunk in self.ai_service.stream_chat(prompt, model="gpt-4", priority="batch"):
             response += chunk
         return response
     
@@ -1,11 +1,18 @@
 """
 Database configuration and initialization
 """
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
 from dotenv import load_dotenv
+from pathlib import Path
 import os
+import time
+import asyncio
 
 load_dotenv()
 
@@ -19,13 +26,122 @@ else:
     engine = create_engine(DATABASE_URL)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Async drivers for the same databases; request handling uses these so queries never block the loop
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+
+def async_database_url(url: str) -> str:
+    """DATABASE_URL with its driver swapped for the asyncio one"""
+    scheme, separator, rest = url.partition("://")
+    return ASYNC_DRIVERS.get(scheme.split("+")[0], scheme) + separator + rest
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or async_database_url(DATABASE_URL)
+
+if ASYNC_DATABASE_URL.startswith("sqlite"):
+    # aiosqlite defaults to NullPool, which would open a connection per session
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=int(os.getenv("DB_POOL_SIZE", 5)),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", 10))
+    )
+else:
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        pool_size=int(os.getenv("DB_POOL_SIZE", 10)),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", 20)),
+        pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", 30)),
+        pool_recycle=int(os.getenv("DB_POOL_RECYCLE", 1800)),
+        pool_pre_ping=True
+    )
+
+# Objects stay readable after commit; services turn them into dicts right away
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
+# High-concurrency SQLite profile: WAL lets readers run alongside the single
+# writer, and every write goes through one connection so they never contend
+# for the database lock
+SQLITE_WAL = ASYNC_DATABASE_URL.startswith("sqlite") and os.getenv("SQLITE_WAL", "true").lower() == "true"
+
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": int(float(os.getenv("SQLITE_MMAP_MB", 256)) * 1024 * 1024),
+    # Negative sizes are in KiB
+    "cache_size": -int(float(os.getenv("SQLITE_CACHE_MB", 64)) * 1024),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000)),
+}
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def _writer_connect(dbapi_connection, connection_record):
+    # Let SQLAlchemy issue BEGIN itself so savepoints nest inside the batch transaction
+    dbapi_connection.isolation_level = None
+
+
+def _writer_begin(conn):
+    # Take the write lock up front rather than upgrading a read lock mid-batch
+    conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+write_engine = None
+WriteSessionLocal = None
+if SQLITE_WAL:
+    for _engine in (engine, async_engine.sync_engine):
+        event.listen(_engine, "connect", _set_sqlite_pragmas)
+    # One persistent connection; the writer task is its only user
+    write_engine = create_async_engine(
+        ASYNC_DATABASE_URL, poolclass=AsyncAdaptedQueuePool, pool_size=1, max_overflow=0
+    )
+    event.listen(write_engine.sync_engine, "connect", _set_sqlite_pragmas)
+    event.listen(write_engine.sync_engine, "connect", _writer_connect)
+    event.listen(write_engine.sync_engine, "begin", _writer_begin)
+    WriteSessionLocal = async_sessionmaker(write_engine, expire_on_commit=False, autoflush=False)
+
+# Time spent in database calls by this process, for load tests and diagnostics
+query_stats = {"queries": 0, "seconds": 0.0}
+
+
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    query_stats["queries"] += 1
+    query_stats["seconds"] += time.perf_counter() - conn.info["query_started"].pop()
+
+
+for _engine in (engine, async_engine.sync_engine) + ((write_engine.sync_engine,) if write_engine else ()):
+    event.listen(_engine, "before_cursor_execute", _start_query_timer)
+    event.listen(_engine, "after_cursor_execute", _stop_query_timer)
+
 Base = declarative_base()
 
 
+MIGRATIONS_DIR = Path(__file__).resolve().parent / "migrations"
+
+
 def init_db():
-    """Initialize database tables"""
-    from app.models import conversation, memory, user
-    Base.metadata.create_all(bind=engine)
+    """Create or upgrade the schema by applying any pending migrations"""
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config()
+    config.set_main_option("script_location", str(MIGRATIONS_DIR))
+    command.upgrade(config, "head")
 
 
 def get_db():
@@ -36,3 +152,149 @@ def get_db():
     finally:
         db.close()
 
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """Get an async database session shared by everything in one request"""
+    async with AsyncSessionLocal() as session:
+        yield session
+
+
+@asynccontextmanager
+async def session_scope(session: Optional[AsyncSession] = None) -> AsyncIterator[AsyncSession]:
+    """Use the caller's session, or open one for this block.
+
+    A transaction still open at the end of the block is rolled back, so a shared
+    session only holds a pooled connection while an operation runs.
+    """
+    if session is None:
+        async with AsyncSessionLocal() as session:
+            yield session
+        return
+    try:
+        yield session
+    finally:
+        if session.in_transaction():
+            await session.rollback()
+
+
+WriteOp = Callable[[AsyncSession], Awaitable[Any]]
+
+
+class DatabaseWriter:
+    """Single task that applies every SQLite write over one connection.
+
+    Writes queue up while a commit is in progress; the task then applies up to
+    DB_WRITE_BATCH_MAX of them, each in its own savepoint so one failure only
+    fails its caller, and commits them together. With synchronous=NORMAL a WAL
+    commit is one append, so many small writes cost little more than one.
+    """
+
+    def __init__(self):
+        self.batch_max = int(os.getenv("DB_WRITE_BATCH_MAX", 64))
+        self.queue: "asyncio.Queue[Tuple[WriteOp, asyncio.Future]]" = asyncio.Queue()
+        self.task: Optional[asyncio.Task] = None
+        self.batch: List[Tuple[WriteOp, asyncio.Future]] = []
+        self.stats = {"writes": 0, "batches": 0, "failures": 0}
+
+    async def submit(self, op: WriteOp) -> Any:
+        """Run ``op`` with the writer's session and return its result once committed"""
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((op, future))
+        return await future
+
+    async def _run(self):
+        while True:
+            self.batch = [await self.queue.get()]
+            while len(self.batch) < self.batch_max and not self.queue.empty():
+                self.batch.append(self.queue.get_nowait())
+            await self._apply(self.batch)
+            self.batch = []
+
+    async def _apply(self, batch: List[Tuple[WriteOp, asyncio.Future]]):
+        done: List[Tuple[asyncio.Future, Any]] = []
+        try:
+            async with WriteSessionLocal() as db:
+                for op, future in batch:
+                    if future.cancelled():
+                        continue
+                    try:
+                        async with db.begin_nested():
+                            result = await op(db)
+                        done.append((future, result))
+                    except Exception as e:
+                        self.stats["failures"] += 1
+                        if not future.done():
+                            future.set_exception(e)
+                await db.commit()
+        except Exception as e:
+            # The commit itself failed, so none of the batch was saved
+            self.stats["failures"] += len(done)
+            for future, _ in done:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.stats["batches"] += 1
+        self.stats["writes"] += len(done)
+        for future, result in done:
+            if not future.done():
+                future.set_result(result)
+
+    async def close(self):
+        """Stop the task and fail every write it had not committed, so no caller waits forever"""
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        pending = self.batch
+        self.batch = []
+        while not self.queue.empty():
+            pending.append(self.queue.get_nowait())
+        for _, future in pending:
+            if not future.done():
+                future.set_exception(RuntimeError("Database writer closed before the write was committed"))
+
+    def snapshot(self) -> Dict:
+        return {**self.stats, "queue_depth": self.queue.qsize()}
+
+
+_db_writer: Optional[DatabaseWriter] = None
+
+
+def get_db_writer() -> Optional[DatabaseWriter]:
+    """Return the process-wide SQLite writer, or None when writes use the request's session"""
+    global _db_writer
+    if _db_writer is None and SQLITE_WAL:
+        _db_writer = DatabaseWriter()
+    return _db_writer
+
+
+async def run_write(op: WriteOp, session: Optional[AsyncSession] = None) -> Any:
+    """Apply ``op`` (which adds, updates or deletes rows but does not commit) and commit it.
+
+    In the SQLite profile this goes through the writer task; otherwise it runs
+    on the caller's session, or a new one.
+    """
+    writer = get_db_writer()
+    if writer is not None:
+        return await writer.submit(op)
+    async with session_scope(session) as db:
+        result = await op(db)
+        await db.commit()
+        return result
+
+
+async def close_db():
+    """Stop the writer and close pooled async connections"""
+    global _db_writer
+    if _db_writer is not None:
+        await _db_writer.close()
+        _db_writer = None
+    await async_engine.dispose()
+    if write_engine is not None:
+        await write_engine.dispose()
+
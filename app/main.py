@@ -3,17 +3,28 @@ Main FastAPI application for Advanced AI Agent
 """
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
 import uvicorn
+import asyncio
 from dotenv import load_dotenv
 import os
 from pathlib import Path
 
 from app.routers import chat, agents, plugins, memory, tools
 from app.services.websocket_manager import WebSocketManager
-from app.database import init_db
+from app.database import init_db, close_db, get_db_writer, query_stats
+from app.services.provider_registry import get_provider_registry, close_provider_registry
+from app.services.ai_service import get_ai_service
+from app.services.response_cache import close_response_cache, get_response_cache
+from app.services.semantic_cache import get_semantic_cache
+from app.services.history_cache import get_history_cache
+from app.services.history_builder import load_token_encoding
+from app.services.audio_cache import get_audio_cache
+from app.services.image_enhancer import close_image_enhancer
+from app.services.single_flight import get_single_flight
+from app.services import metrics
 
 load_dotenv()
 
@@ -25,6 +36,52 @@ UPLOAD_DIR.mkdir(exist_ok=True)
 ws_manager = WebSocketManager()
 
 
+def _component_samples():
+    """Export counters that the router, hedging, schedulers and caches already keep"""
+    registry = get_provider_registry()
+    for provider, health in registry.router.snapshot().items():
+        labels = {"provider": provider}
+        yield "ai_provider_circuit_open", "gauge", "1 while the provider's breaker is not closed", labels, int(health["state"] != "closed")
+        yield "ai_provider_error_rate", "gauge", "Error rate over the router's window", labels, health["error_rate"]
+        yield "ai_provider_latency_ewma_seconds", "gauge", "Smoothed time to first chunk", labels, health["latency_ewma"]
+    for name, value in registry.hedging.snapshot().items():
+        if name != "hedge_rate":
+            yield "ai_hedge_events_total", "counter", "Hedged request outcomes", {"event": name}, value
+    for provider, scheduler in registry.schedulers.items():
+        snapshot = scheduler.snapshot()
+        labels = {"provider": provider}
+        yield "ai_scheduler_in_flight", "gauge", "Calls holding a provider slot", labels, snapshot["in_flight"]
+        yield "ai_scheduler_queue_depth", "gauge", "Calls waiting for a provider slot", labels, snapshot["queue_depth"]
+        yield "ai_scheduler_timeouts_total", "counter", "Calls that gave up waiting for a slot", labels, snapshot["timeouts"]
+
+    caches = {
+        "response": get_response_cache().snapshot(),
+        "semantic": get_semantic_cache().snapshot(),
+        "history": get_history_cache().snapshot(),
+        "audio": get_audio_cache().snapshot(),
+    }
+    for cache, snapshot in caches.items():
+        for event in ("hits", "disk_hits", "misses", "partial_misses", "stores", "evictions"):
+            if event in snapshot:
+                yield "cache_events_total", "counter", "Cache lookups and evictions", {"cache": cache, "event": event}, snapshot[event]
+        size = snapshot.get("entries", snapshot.get("conversations"))
+        yield "cache_entries", "gauge", "Items held by each cache", {"cache": cache}, size
+
+    single_flight = get_single_flight().snapshot()
+    for event in ("leaders", "joined", "cancelled"):
+        yield "single_flight_events_total", "counter", "Coalesced request events", {"event": event}, single_flight[event]
+
+    writer = get_db_writer()
+    if writer is not None:
+        snapshot = writer.snapshot()
+        for event in ("writes", "batches", "failures"):
+            yield "db_writer_events_total", "counter", "Writes, commits and failures of the SQLite writer", {"event": event}, snapshot[event]
+        yield "db_writer_queue_depth", "gauge", "Writes waiting for the SQLite writer", {}, snapshot["queue_depth"]
+
+
+metrics.register_collector(_component_samples)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Startup and shutdown events"""
@@ -35,12 +92,39 @@ async def lifespan(app: FastAPI):
         print("Database initialized")
     except Exception as e:
         print(f"Database initialization warning: {e}")
+    # Token counting estimates until the tokenizer is ready; a slow download finishes in the background
+    try:
+        await asyncio.wait_for(
+            asyncio.to_thread(load_token_encoding),
+            float(os.getenv("TOKENIZER_STARTUP_TIMEOUT", 10))
+        )
+    except asyncio.TimeoutError:
+        print("Tokenizer still loading; estimating token counts until it is ready")
+    # Provider clients live for the whole process so HTTP connections are reused
+    registry = get_provider_registry()
+    if os.getenv("PROVIDER_WARMUP", "false").lower() == "true":
+        await registry.warm_up()
+    # Resolve available models once up front; routing then only reads the table
+    try:
+        await asyncio.wait_for(
+            registry.models.refresh(),
+            timeout=float(os.getenv("MODEL_REGISTRY_STARTUP_TIMEOUT", 10))
+        )
+    except asyncio.TimeoutError:
+        print("Model listing timed out; using default models until the next refresh")
+    registry.models.start()
+    app.state.ai_service = get_ai_service()
+    print("AI providers initialized")
     print("Server ready!")
     print(f"WebSocket endpoint: ws://localhost:8000/ws")
     print(f"API docs: http://localhost:8000/docs")
     yield
     # Shutdown
     print("Shutting down...")
+    await close_provider_registry()
+    close_response_cache()
+    close_image_enhancer()
+    await close_db()
 
 
 app = FastAPI(
@@ -58,6 +142,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Audio-Id"],  # Lets the UI replay cached speech by id
 )
 
 # Include routers
@@ -86,6 +171,37 @@ async def health_check():
     return {"status": "healthy"}
 
 
+def _rss_bytes() -> int:
+    """Current resident memory of this process"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import sys
+        import resource
+        # Peak rather than current on platforms without /proc; macOS reports bytes, others KiB
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus text-format metrics for this worker process"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/health/runtime")
+async def runtime_stats():
+    """Per-worker process stats used by the load benchmark"""
+    return {
+        "pid": os.getpid(),
+        "rss_bytes": _rss_bytes(),
+        "db_queries": query_stats["queries"],
+        "db_seconds": query_stats["seconds"],
+        "websocket_connections": len(ws_manager.active_connections),
+    }
+
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """WebSocket endpoint for real-time chat"""
@@ -0,0 +1,101 @@
+"""Initial schema
+
+The tables as init_db used to create them with create_all. Databases created
+that way already have them, so each table is only created if it is missing.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if "users" not in existing:
+        op.create_table(
+            "users",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("username", sa.String(100)),
+            sa.Column("email", sa.String(255), nullable=True),
+            sa.Column("preferences", sa.JSON()),
+            sa.Column("created_at", sa.DateTime()),
+            sa.Column("is_active", sa.Boolean()),
+        )
+        op.create_index("ix_users_id", "users", ["id"])
+        op.create_index("ix_users_username", "users", ["username"], unique=True)
+        op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    if "conversations" not in existing:
+        op.create_table(
+            "conversations",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=True),
+            sa.Column("title", sa.String(255)),
+            sa.Column("created_at", sa.DateTime()),
+            sa.Column("updated_at", sa.DateTime()),
+            sa.Column("extra_data", sa.JSON()),
+        )
+        op.create_index("ix_conversations_id", "conversations", ["id"])
+
+    if "messages" not in existing:
+        op.create_table(
+            "messages",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("conversation_id", sa.Integer(), sa.ForeignKey("conversations.id")),
+            sa.Column("role", sa.String(50)),
+            sa.Column("content", sa.Text()),
+            sa.Column("model", sa.String(100)),
+            sa.Column("meta_data", sa.JSON()),
+            sa.Column("created_at", sa.DateTime()),
+            sa.Column("updated_at", sa.DateTime()),
+        )
+        op.create_index("ix_messages_id", "messages", ["id"])
+
+    if "memories" not in existing:
+        op.create_table(
+            "memories",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=True),
+            sa.Column("key", sa.String(255)),
+            sa.Column("value", sa.Text()),
+            sa.Column("importance", sa.Float()),
+            sa.Column("access_count", sa.Integer()),
+            sa.Column("last_accessed", sa.DateTime()),
+            sa.Column("created_at", sa.DateTime()),
+            sa.Column("meta_data", sa.JSON()),
+        )
+        op.create_index("ix_memories_id", "memories", ["id"])
+        op.create_index("ix_memories_key", "memories", ["key"])
+
+    if "knowledge_base" not in existing:
+        op.create_table(
+            "knowledge_base",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=True),
+            sa.Column("title", sa.String(255)),
+            sa.Column("content", sa.Text()),
+            sa.Column("file_path", sa.String(500), nullable=True),
+            sa.Column("file_type", sa.String(50), nullable=True),
+            sa.Column("embedding", sa.JSON(), nullable=True),
+            sa.Column("created_at", sa.DateTime()),
+            sa.Column("meta_data", sa.JSON()),
+        )
+        op.create_index("ix_knowledge_base_id", "knowledge_base", ["id"])
+
+
+def downgrade() -> None:
+    for table in ("knowledge_base", "memories", "messages", "conversations", "users"):
+        op.drop_table(table)
@@ -0,0 +1,48 @@
+"""Denormalized message count and last message preview on conversations
+
+The conversation list shows both; keeping them on the row means listing never
+reads the messages table. Existing conversations are backfilled.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PREVIEW_CHARS = 120
+
+
+def upgrade() -> None:
+    op.add_column("conversations", sa.Column("message_count", sa.Integer(), server_default="0", nullable=False))
+    op.add_column("conversations", sa.Column("last_message_preview", sa.String(255), nullable=True))
+
+    conversations = sa.table("conversations", sa.column("id"), sa.column("message_count"), sa.column("last_message_preview"))
+    messages = sa.table("messages", sa.column("id"), sa.column("conversation_id"), sa.column("content"), sa.column("created_at"))
+    in_conversation = messages.c.conversation_id == conversations.c.id
+    op.execute(
+        conversations.update().values(
+            message_count=sa.select(sa.func.count(messages.c.id)).where(in_conversation).scalar_subquery(),
+            last_message_preview=sa.select(sa.func.substr(messages.c.content, 1, PREVIEW_CHARS))
+            .where(in_conversation)
+            .order_by(messages.c.created_at.desc(), messages.c.id.desc())
+            .limit(1)
+            .scalar_subquery()
+        )
+    )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("conversations") as batch_op:
+        batch_op.drop_column("last_message_preview")
+        batch_op.drop_column("message_count")
@@ -1,7 +1,7 @@
 """
 Conversation and Message models
 """
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.database import Base
@@ -16,9 +16,18 @@ class Conversation(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     extra_data = Column(JSON, default={})
+    # Kept in step with the messages by ConversationService so listing never loads them (migration 0003)
+    message_count = Column(Integer, default=0, server_default="0", nullable=False)
+    last_message_preview = Column(String(255), nullable=True)
 
     messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
 
+    # Conversation list, newest first (migration 0002)
+    __table_args__ = (
+        Index("ix_conversations_user_id_updated_at", "user_id", "updated_at"),
+        Index("ix_conversations_updated_at_id", "updated_at", "id"),
+    )
+
 
 class Message(Base):
     __tablename__ = "messages"
@@ -34,4 +43,7 @@ class Message(Base):
 
     conversation = relationship("Conversation", back_populates="messages")
 
+    # History and edits read one conversation's messages in time order (migration 0002)
+    __table_args__ = (Index("ix_messages_conversation_id_created_at", "conversation_id", "created_at"),)
+
 
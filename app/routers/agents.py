@@ -1,10 +1,11 @@
 """
 Multi-Agent router - Agent orchestration
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from typing import List, Dict, Optional
 from app.agents.agent_orchestrator import AgentOrchestrator
+from app.services.ai_service import AIService, get_ai_service
 
 router = APIRouter()
 
@@ -22,10 +23,10 @@ class AgentResponse(BaseModel):
 
 
 @router.post("/execute", response_model=AgentResponse)
-async def execute_with_agents(request: AgentRequest):
+async def execute_with_agents(request: AgentRequest, ai_service: AIService = Depends(get_ai_service)):
     """Execute task using multiple agents"""
     try:
-        orchestrator = AgentOrchestrator()
+        orchestrator = AgentOrchestrator(ai_service)
         result = await orchestrator.execute_task(
             task=request.task,
             agents=request.agents,
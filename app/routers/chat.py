@@ -1,18 +1,23 @@
 """
 Chat router - Main chat endpoints
 """
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form, Request, Query
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List
 import os
+import re
 import shutil
 from pathlib import Path
 import uuid
 from datetime import datetime
-from app.services.ai_service import AIService
-from app.database import get_db
-from sqlalchemy.orm import Session
+from app.services.ai_service import AIService, get_ai_service
+from app.services.response_cache import ResponseCache, get_response_cache, make_cache_key
+from app.services.audio_cache import get_audio_cache
+from app.services.tool_runner import tool_definitions
+from app.utils.ranged_file import ranged_file_response
+from app.database import get_async_db
+from sqlalchemy.ext.asyncio import AsyncSession
 
 router = APIRouter()
 
@@ -27,6 +32,11 @@ class ChatRequest(BaseModel):
     model: str = "gpt-4"
     system_prompt: Optional[str] = None
     stream: bool = True
+    hedge: Optional[bool] = None  # Race a backup provider when the primary is slow to start
+    cache: bool = True  # Set to false to bypass the response cache
+    semantic_cache: Optional[bool] = None  # Reuse answers to similar standalone prompts
+    coalesce: Optional[bool] = None  # Share one upstream stream with identical in-flight requests
+    tools: Optional[List[str]] = None  # Built-in tools the model may call: web_search, code_execute, image_generate
 
 
 class ChatResponse(BaseModel):
@@ -34,14 +44,18 @@ class ChatResponse(BaseModel):
     conversation_id: int
     model: str
     tokens_used: Optional[int] = None
+    cached: bool = False
 
 
 @router.post("/", response_model=ChatResponse)
-async def chat(request: ChatRequest, db: Session = Depends(get_db)):
+async def chat(
+    request: ChatRequest,
+    db: AsyncSession = Depends(get_async_db),
+    ai_service: AIService = Depends(get_ai_service),
+    response_cache: ResponseCache = Depends(get_response_cache)
+):
     """Send a chat message and get response"""
     try:
-        ai_service = AIService()
-        
         # For streaming, use WebSocket
         if request.stream:
             raise HTTPException(
@@ -49,15 +63,43 @@ async def chat(request: ChatRequest, db: Session = Depends(get_db)):
                 detail="Use WebSocket endpoint /ws for streaming"
             )
         
+        history = await ai_service.get_conversation_history(
+            request.conversation_id, request.model, request.system_prompt, request.message, db
+        )
+        # Tool results change between calls, so answers that may use tools are not cached
+        use_cache = request.cache and response_cache.enabled and not request.tools
+        cache_key = make_cache_key(request.model, request.system_prompt, request.message, history)
+        if use_cache:
+            cached_response = await response_cache.get(cache_key)
+            if cached_response is not None:
+                return ChatResponse(
+                    response=cached_response,
+                    conversation_id=request.conversation_id or 0,
+                    model=request.model,
+                    cached=True
+                )
+
         # Non-streaming response
-        response_text = ""
+        response_parts = []
+        outcome = {}
         async for chunk in ai_service.stream_chat(
             message=request.message,
             conversation_id=request.conversation_id,
             model=request.model,
-            system_prompt=request.system_prompt
+            system_prompt=request.system_prompt,
+            hedge=request.hedge,
+            history=history,
+            outcome=outcome,
+            semantic_cache=request.semantic_cache,
+            coalesce=request.coalesce,
+            tools=tool_definitions(request.tools)
         ):
-            response_text += chunk
+            response_parts.append(chunk)
+        response_text = "".join(response_parts)
+
+        # Provider failure notices are not answers, so only the successful provider's text is cached
+        if use_cache and outcome.get("success") and outcome.get("response"):
+            await response_cache.set(cache_key, outcome["response"])
         
         # TODO: Save to database
         # conversation_id = save_message(db, request.message, response_text, request.model)
@@ -67,45 +109,108 @@ async def chat(request: ChatRequest, db: Session = Depends(get_db)):
             conversation_id=request.conversation_id or 0,
             model=request.model
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/cache/stats")
+async def get_cache_stats(response_cache: ResponseCache = Depends(get_response_cache)):
+    """Get response cache hit and miss counters"""
+    from app.services.semantic_cache import get_semantic_cache
+    from app.services.history_cache import get_history_cache
+    from app.services.single_flight import get_single_flight
+    from app.services.image_cache import get_image_cache
+    from app.services.image_enhancer import get_image_enhancer
+    from app.services.generated_images import get_generated_images
+    return {
+        **response_cache.snapshot(),
+        "semantic": get_semantic_cache().snapshot(),
+        "history": get_history_cache().snapshot(),
+        "single_flight": get_single_flight().snapshot(),
+        "images": get_image_cache().snapshot(),
+        "audio": get_audio_cache().snapshot(),
+        "enhanced_images": get_image_enhancer().snapshot(),
+        "generated_images": get_generated_images().snapshot()
+    }
+
+
+@router.get("/providers")
+async def get_provider_health(ai_service: AIService = Depends(get_ai_service)):
+    """Get circuit-breaker state, health and scheduler queues of each AI provider"""
+    return {
+        "providers": ai_service.registry.router.snapshot(),
+        "hedging": ai_service.registry.hedging.snapshot(),
+        "schedulers": {
+            provider: scheduler.snapshot()
+            for provider, scheduler in ai_service.registry.schedulers.items()
+        }
+    }
+
+
+@router.get("/models")
+async def get_models(ai_service: AIService = Depends(get_ai_service)):
+    """Get the models each provider offers and what they can do"""
+    return ai_service.registry.models.snapshot()
+
+
 @router.get("/conversations")
-async def get_conversations(db: Session = Depends(get_db)):
-    """Get all conversations"""
+async def get_conversations(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get conversations, most recently updated first; pass next_cursor back as cursor for the next page"""
     from app.services.conversation_service import ConversationService
-    conv_service = ConversationService()
-    conversations = conv_service.get_all_conversations()
-    return {"conversations": conversations}
+    conv_service = ConversationService(db)
+    try:
+        return await conv_service.get_all_conversations(limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.get("/conversations/{conversation_id}")
-async def get_conversation(conversation_id: int, db: Session = Depends(get_db)):
-    """Get specific conversation"""
+async def get_conversation(
+    conversation_id: int,
+    limit: int = Query(100, ge=1, le=500),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get specific conversation with its newest messages.
+
+    Pass older_cursor as ``before`` to load older messages, or newer_cursor as
+    ``after`` to load newer ones.
+    """
     from app.services.conversation_service import ConversationService
-    conv_service = ConversationService()
-    conversation = conv_service.get_conversation(conversation_id)
+    if before and after:
+        raise HTTPException(status_code=400, detail="Pass either before or after, not both")
+    conv_service = ConversationService(db)
+    try:
+        conversation = await conv_service.get_conversation(conversation_id, limit=limit, before=before, after=after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if conversation:
         return conversation
     raise HTTPException(status_code=404, detail="Conversation not found")
 
 
 @router.post("/conversations")
-async def create_conversation(title: Optional[str] = None, db: Session = Depends(get_db)):
+async def create_conversation(title: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
     """Create a new conversation"""
     from app.services.conversation_service import ConversationService
-    conv_service = ConversationService()
-    conversation = conv_service.create_conversation(title=title)
+    conv_service = ConversationService(db)
+    conversation = await conv_service.create_conversation(title=title)
     return conversation
 
 
 @router.delete("/conversations/{conversation_id}")
-async def delete_conversation(conversation_id: int, db: Session = Depends(get_db)):
+async def delete_conversation(conversation_id: int, db: AsyncSession = Depends(get_async_db)):
     """Delete a conversation"""
     from app.services.conversation_service import ConversationService
-    conv_service = ConversationService()
-    success = conv_service.delete_conversation(conversation_id)
+    conv_service = ConversationService(db)
+    success = await conv_service.delete_conversation(conversation_id)
     if success:
         return {"message": "Conversation deleted"}
     raise HTTPException(status_code=404, detail="Conversation not found")
@@ -200,32 +305,48 @@ class TTSRequest(BaseModel):
     voice: str = "alloy"
 
 @router.post("/tts")
-async def text_to_speech(request: TTSRequest):
-    """Convert text to speech"""
+async def text_to_speech(request: TTSRequest, http_request: Request, ai_service: AIService = Depends(get_ai_service)):
+    """Convert text to speech.
+
+    Audio streams to the client as it is synthesized. Repeated requests are
+    served from the audio cache with range support; ``X-Audio-Id`` names the
+    clip for ``GET /tts/{audio_id}``.
+    """
     try:
-        ai_service = AIService()
-        audio_bytes = await ai_service.text_to_speech(request.text, request.voice)
-        from fastapi.responses import StreamingResponse
-        import io
-
-        return StreamingResponse(
-            io.BytesIO(audio_bytes),
-            media_type="audio/mpeg",
-            headers={"Content-Disposition": "attachment; filename=speech.mp3"}
-        )
+        audio_id, cached, chunks = await ai_service.text_to_speech(request.text, request.voice)
     except Exception as e:
         error_msg = str(e)
         if "insufficient_quota" in error_msg or "quota" in error_msg.lower():
             raise HTTPException(status_code=402, detail="TTS unavailable: OpenAI quota exceeded. Voice output disabled.")
         raise HTTPException(status_code=500, detail=f"TTS failed: {error_msg}")
 
+    headers = {"Content-Disposition": "attachment; filename=speech.mp3", "X-Audio-Id": audio_id}
+    if cached is not None:
+        return ranged_file_response(cached, http_request, "audio/mpeg", headers, etag=audio_id)
+    return StreamingResponse(chunks, media_type="audio/mpeg", headers=headers)
+
+
+@router.get("/tts/{audio_id}")
+async def get_speech(audio_id: str, request: Request):
+    """Replay a synthesized clip from the audio cache, with HTTP range support"""
+    if not re.fullmatch(r"[0-9a-f]{64}", audio_id):
+        raise HTTPException(status_code=404, detail="Audio not found")
+    cached = get_audio_cache().get(audio_id)
+    if cached is None:
+        raise HTTPException(status_code=404, detail="Audio not found")
+    # Clips are content-addressed, so a given id never changes
+    headers = {"Cache-Control": "public, max-age=31536000, immutable"}
+    return ranged_file_response(cached, request, "audio/mpeg", headers, etag=audio_id)
+
 
 @router.post("/enhance-image")
-async def enhance_image(image_url: str, enhancement_type: str = "upscale"):
+async def enhance_image(
+    image_url: str,
+    enhancement_type: str = "upscale",
+    ai_service: AIService = Depends(get_ai_service)
+):
     """Enhance an image"""
     try:
-        ai_service = AIService()
-
         # Convert URL to path
         if image_url.startswith("/uploads/"):
             image_path = UPLOAD_DIR / image_url.replace("/uploads/", "")
@@ -240,3 +361,43 @@ async def enhance_image(image_url: str, enhancement_type: str = "upscale"):
         return {"enhanced_url": enhanced_url}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Image enhancement failed: {str(e)}")
+
+
+class EnhanceItem(BaseModel):
+    image_url: str
+    enhancement_type: str = "upscale"
+
+
+class EnhanceBatchRequest(BaseModel):
+    items: List[EnhanceItem]
+
+
+@router.post("/enhance-images")
+async def enhance_images(request: EnhanceBatchRequest):
+    """Enhance several images in parallel across worker processes, reporting each item's status"""
+    from app.services.image_enhancer import get_image_enhancer
+    batch_max = int(os.getenv("IMAGE_ENHANCE_BATCH_MAX", 32))
+    if len(request.items) > batch_max:
+        raise HTTPException(status_code=400, detail=f"At most {batch_max} images per batch")
+
+    results: List[Optional[dict]] = [None] * len(request.items)
+    jobs = []
+    for index, item in enumerate(request.items):
+        image_path = UPLOAD_DIR / item.image_url.replace("/uploads/", "", 1)
+        if not item.image_url.startswith("/uploads/") or ".." in Path(item.image_url).parts:
+            results[index] = {"status": "error", "error": "Invalid image URL"}
+        elif not image_path.is_file():
+            results[index] = {"status": "error", "error": "Image not found"}
+        else:
+            jobs.append((index, image_path, item.enhancement_type))
+
+    outcomes = await get_image_enhancer().enhance_many([(path, kind) for _, path, kind in jobs])
+    for (index, _, _), outcome in zip(jobs, outcomes):
+        results[index] = outcome
+
+    return {
+        "results": [
+            {"image_url": item.image_url, "enhancement_type": item.enhancement_type, **result}
+            for item, result in zip(request.items, results)
+        ]
+    }
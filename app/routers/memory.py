@@ -1,10 +1,12 @@
 """
 Memory router - Memory management
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from typing import List, Optional
 from app.services.memory_service import MemoryService
+from app.database import get_async_db
+from sqlalchemy.ext.asyncio import AsyncSession
 
 router = APIRouter()
 
@@ -23,9 +25,9 @@ class MemoryResponse(BaseModel):
 
 
 @router.post("/", response_model=MemoryResponse)
-async def create_memory(request: MemoryRequest):
+async def create_memory(request: MemoryRequest, db: AsyncSession = Depends(get_async_db)):
     """Create a new memory"""
-    memory_service = MemoryService()
+    memory_service = MemoryService(db)
     memory = await memory_service.create_memory(
         key=request.key,
         value=request.value,
@@ -35,17 +37,17 @@ async def create_memory(request: MemoryRequest):
 
 
 @router.get("/search")
-async def search_memories(query: str, limit: int = 10):
+async def search_memories(query: str, limit: int = 10, db: AsyncSession = Depends(get_async_db)):
     """Search memories by query"""
-    memory_service = MemoryService()
+    memory_service = MemoryService(db)
     memories = await memory_service.search_memories(query, limit)
     return {"memories": memories}
 
 
 @router.get("/{memory_id}")
-async def get_memory(memory_id: int):
+async def get_memory(memory_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get specific memory"""
-    memory_service = MemoryService()
+    memory_service = MemoryService(db)
     memory = await memory_service.get_memory(memory_id)
     if not memory:
         raise HTTPException(status_code=404, detail="Memory not found")
@@ -1,12 +1,14 @@
 """
 Tools router - Tool integrations
 """
-from fastapi import APIRouter, HTTPException
+import os
+from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from typing import List, Dict, Any
 from app.services.tools.web_search import WebSearchTool
 from app.services.tools.code_executor import CodeExecutor
 from app.services.tools.image_generator import ImageGeneratorTool
+from app.services.ai_service import AIService, get_ai_service
 
 router = APIRouter()
 
@@ -17,7 +19,7 @@ class ToolRequest(BaseModel):
 
 
 @router.post("/execute")
-async def execute_tool(request: ToolRequest):
+async def execute_tool(request: ToolRequest, ai_service: AIService = Depends(get_ai_service)):
     """Execute a tool"""
     try:
         if request.tool == "web_search":
@@ -30,7 +32,7 @@ async def execute_tool(request: ToolRequest):
                 language=request.parameters.get("language", "python")
             )
         elif request.tool == "image_generate":
-            tool = ImageGeneratorTool()
+            tool = ImageGeneratorTool(ai_service)
             result = await tool.generate(request.parameters.get("prompt", ""))
         else:
             raise HTTPException(status_code=400, detail="Unknown tool")
@@ -40,6 +42,20 @@ async def execute_tool(request: ToolRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+class ImageBatchRequest(BaseModel):
+    prompts: List[str]
+    model: str = "dall-e-3"
+
+
+@router.post("/generate-images")
+async def generate_images(request: ImageBatchRequest, ai_service: AIService = Depends(get_ai_service)):
+    """Generate images for several prompts with bounded concurrency, reporting each prompt's status"""
+    batch_max = int(os.getenv("IMAGE_GEN_BATCH_MAX", 16))
+    if len(request.prompts) > batch_max:
+        raise HTTPException(status_code=400, detail=f"At most {batch_max} prompts per batch")
+    return {"results": await ai_service.generate_images(request.prompts, request.model)}
+
+
 @router.get("/list")
 async def list_tools():
     """List available tools"""
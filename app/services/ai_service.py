@@ -2,46 +2,64 @@
 AI Service - Multi-model AI integration
 """
 import os
-from typing import AsyncGenerator, Optional, Dict, List
+import json
+import time
+import base64
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, AsyncIterator, Optional, Dict, List, Callable, Iterable, Tuple
 from pathlib import Path
-from openai import AsyncOpenAI
-from anthropic import AsyncAnthropic
-try:
-    import google.generativeai as genai
-    GOOGLE_AVAILABLE = True
-except ImportError:
-    GOOGLE_AVAILABLE = False
 from dotenv import load_dotenv
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.services.provider_registry import ProviderRegistry, get_provider_registry
+from app.services.provider_router import FALLBACK_MODELS, provider_for_model, classify_error
+from app.services.history_builder import HistoryBuilder, count_tokens
+from app.services.conversation_summarizer import ConversationSummarizer
+from app.services.history_cache import get_history_cache
+from app.services.hedging import StreamPump
+from app.services.semantic_cache import get_semantic_cache, replay_chunks
+from app.services.single_flight import get_single_flight, make_flight_key
+from app.services.image_cache import get_image_cache, attachment_path
+from app.services.audio_cache import get_audio_cache, audio_key
+from app.services.image_enhancer import get_image_enhancer
+from app.services.generated_images import get_generated_images
+from app.services.tool_runner import ToolRunner, anthropic_tools
+from app.services.metrics import (
+    PROVIDER_TTFT_SECONDS,
+    PROVIDER_STREAM_SECONDS,
+    PROVIDER_OUTPUT_TOKENS,
+    PROVIDER_REQUESTS,
+    PROVIDER_ERRORS,
+)
+from app.utils.thread_stream import iterate_in_thread
 
 load_dotenv()
 
 UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", "./uploads"))
+GENERATED_IMAGE_SIZE = "1024x1024"
 
 
 class AIService:
     """Unified AI service supporting multiple providers"""
     
-    def __init__(self):
-        self.openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY")) if os.getenv("OPENAI_API_KEY") else None
-        self.anthropic_client = AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY")) if os.getenv("ANTHROPIC_API_KEY") else None
-        self.groq_client = AsyncOpenAI(
-            api_key=os.getenv("GROQ_API_KEY"),
-            base_url="https://api.groq.com/openai/v1"
-        ) if os.getenv("GROQ_API_KEY") else None
-
-        if GOOGLE_AVAILABLE and os.getenv("GOOGLE_API_KEY"):
-            genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-            # Use gemini-2.5-flash (latest fast model) or gemini-flash-latest
-            try:
-                self.gemini_model = genai.GenerativeModel('gemini-2.5-flash')
-            except:
-                try:
-                    self.gemini_model = genai.GenerativeModel('gemini-flash-latest')
-                except:
-                    # Fallback to any available model
-                    self.gemini_model = genai.GenerativeModel('gemini-pro-latest')
-        else:
-            self.gemini_model = None
+    def __init__(self, registry: Optional[ProviderRegistry] = None):
+        # Clients are owned by the shared registry so connections are pooled across requests
+        self.registry = registry or get_provider_registry()
+        self.openai_client = self.registry.openai_client
+        self.anthropic_client = self.registry.anthropic_client
+        self.groq_client = self.registry.groq_client
+        self.gemini_model = self.registry.gemini_model
+        self.semantic_cache = get_semantic_cache()
+        self.single_flight = get_single_flight()
+        self.image_cache = get_image_cache()
+        self.image_enhancer = get_image_enhancer()
+        self.generated_images = get_generated_images()
+        self.tool_runner = ToolRunner(self)
+        self.audio_cache = get_audio_cache()
+        self.tts_model = os.getenv("TTS_MODEL", "tts-1")
+        # Output tokens charged against a provider's token bucket until the real count is known
+        self.expected_output_tokens = int(os.getenv("SCHEDULER_EXPECTED_OUTPUT_TOKENS", 500))
+        self.history_builder = HistoryBuilder(ConversationSummarizer(self), get_history_cache())
 
     async def stream_chat(
         self,
@@ -50,94 +68,342 @@ class AIService:
         model: str = "gpt-4",
         system_prompt: Optional[str] = None,
         tools: Optional[List[Dict]] = None,
-        attachments: Optional[List[Dict]] = None
+        attachments: Optional[List[Dict]] = None,
+        hedge: Optional[bool] = None,
+        history: Optional[List[Dict]] = None,
+        outcome: Optional[Dict] = None,
+        semantic_cache: Optional[bool] = None,
+        coalesce: Optional[bool] = None,
+        priority: str = "interactive",
+        db: Optional[AsyncSession] = None
     ) -> AsyncGenerator[str, None]:
-        """Stream chat response from selected model with intelligent fallback"""
+        """Stream chat response from selected model with intelligent fallback.
+
+        With hedging on (per call, or HEDGE_ENABLED by default), a backup provider is
+        started when the primary is slow to produce its first chunk. Callers that already
+        loaded the history can pass it in, and an ``outcome`` dict is filled with the
+        provider, model and response text once a provider succeeds. Standalone prompts
+        can be answered from the semantic cache (per call, or SEMANTIC_CACHE_ENABLED).
+        Identical requests already in flight share one upstream stream (per call, or
+        SINGLE_FLIGHT_ENABLED); late joiners get the chunks produced so far first.
+        Upstream calls queue on each provider's scheduler in ``priority`` order
+        ("interactive", "default" or "batch"). When ``tools`` are given, tool calls the
+        model makes are run concurrently and their results fed back, for up to
+        TOOL_MAX_ROUNDS rounds (OpenAI, Groq and Anthropic). History is read with the
+        caller's ``db`` session when one is given.
+        """
 
         # Get conversation history
-        history = await self._get_conversation_history(conversation_id)
-
-        # Process attachments (images) if any
-        if attachments:
-            images = [att for att in attachments if att.get("type") == "image"]
-            if images and (model.startswith("gemini") or "gemini" in model.lower() or not self.openai_client):
-                # Use Gemini for image analysis
-                try:
-                    async for chunk in self._stream_gemini_with_images(message, history, images, system_prompt):
-                        yield chunk
+        if history is None:
+            history = await self._get_conversation_history(conversation_id, model, system_prompt, message, db)
+
+        images = [att for att in (attachments or []) if att.get("type") == "image"]
+        if images:
+            model = self._vision_model(model)
+
+        # Callers that save the user turn first (the WebSocket chat) get it back as the last history entry
+        prior_history = history
+        if history and history[-1] == {"role": "user", "content": message}:
+            prior_history = history[:-1]
+        use_semantic_cache = (
+            (self.semantic_cache.enabled if semantic_cache is None else semantic_cache)
+            and self.semantic_cache.available
+            # Only standalone prompts are comparable; history, images or tools change the answer
+            and not prior_history and not images and not tools
+        )
+        if use_semantic_cache:
+            cached_answer = self.semantic_cache.lookup(model, system_prompt, message)
+            if cached_answer is not None:
+                if outcome is not None:
+                    outcome.update(success=True, provider="semantic_cache", model=model, response=cached_answer)
+                # Replay in chunks so stream consumers see the usual protocol
+                for chunk in replay_chunks(cached_answer):
+                    yield chunk
+                    await asyncio.sleep(0)
+                return
+            if outcome is None:
+                outcome = {}
+
+        hedge = self.registry.hedging.enabled if hedge is None else hedge
+        stream_args = (message, history, system_prompt, tools, images)
+        coalesce = (self.single_flight.enabled if coalesce is None else coalesce) and not images
+        if coalesce:
+            key = make_flight_key(model, system_prompt, message, history, tools)
+            stream = self.single_flight.stream(
+                key,
+                lambda flight_outcome: self._stream_with_fallback(model, stream_args, hedge, flight_outcome, priority),
+                outcome
+            )
+        else:
+            stream = self._stream_with_fallback(model, stream_args, hedge, outcome, priority)
+        async for chunk in stream:
+            yield chunk
+
+        if use_semantic_cache and outcome.get("success") and not outcome.get("shared"):
+            self.semantic_cache.store(model, system_prompt, message, outcome["response"])
+
+    def _vision_model(self, model: str) -> str:
+        """Model to answer a turn with image attachments, from the capability table"""
+        models = self.registry.models
+        if provider_for_model(model) == "gemini":
+            if models.info(model).vision and models.is_available("gemini", model):
+                return model
+        elif self.openai_client:
+            return model
+        # Gemini is the only other provider that reads image attachments
+        return models.preferred("gemini", vision=True) or FALLBACK_MODELS["gemini"]
+
+    async def _stream_with_fallback(
+        self,
+        model: str,
+        stream_args: Tuple,
+        hedge: bool,
+        outcome: Optional[Dict],
+        priority: str = "interactive"
+    ) -> AsyncGenerator[str, None]:
+        """Try providers in the router's order until one completes a response"""
+        router = self.registry.router
+        candidates = router.plan(model, self._configured_providers())
+        while candidates:
+            provider, model_name = candidates.pop(0)
+            # An earlier attempt in this request may have just opened this provider's breaker
+            if not router.is_available(provider):
+                continue
+
+            backup = None
+            if hedge:
+                backup = next((c for c in candidates if c[0] != provider and router.is_available(c[0])), None)
+            if backup:
+                result = {"success": False, "backup_started": False}
+                async for chunk in self._stream_hedged((provider, model_name), backup, stream_args, result, priority):
+                    yield chunk
+                if result["success"]:
+                    if outcome is not None:
+                        outcome.update(
+                            success=True,
+                            provider=result["provider"],
+                            model=result["model"],
+                            response=result["response"]
+                        )
                     return
-                except Exception as e:
-                    if "quota" in str(e).lower() or "billing" in str(e).lower():
-                        yield "⚠️ Gemini API quota exceeded. Trying OpenAI as fallback...\n\n"
-                    else:
-                        yield f"❌ Gemini error: {str(e)}. Trying OpenAI...\n\n"
-
-        # Intelligent fallback logic with retry
-        models_to_try = []
-
-        # Primary model first
-        if (model.startswith("gpt") or "gpt" in model.lower()) and self.openai_client:
-            models_to_try.append(("openai", model))
-        elif (model.startswith("claude") or "claude" in model.lower()) and self.anthropic_client:
-            models_to_try.append(("anthropic", model))
-        elif (model.startswith("gemini") or "gemini" in model.lower()) and self.gemini_model:
-            models_to_try.append(("gemini", model))
-
-        # Add fallbacks - focus on reliable providers
-        if self.gemini_model and ("gemini", "gemini-2.5-flash") not in [(m[0], m[1]) for m in models_to_try]:
-            models_to_try.append(("gemini", "gemini-2.5-flash"))
-        if self.openai_client and ("openai", "gpt-3.5-turbo") not in [(m[0], m[1]) for m in models_to_try]:
-            models_to_try.append(("openai", "gpt-3.5-turbo"))
-        if self.gemini_model and ("gemini", "gemini-2.5-flash") not in [(m[0], m[1]) for m in models_to_try]:
-            models_to_try.append(("gemini", "gemini-2.5-flash"))
-        if self.openai_client and ("openai", "gpt-3.5-turbo") not in [(m[0], m[1]) for m in models_to_try]:
-            models_to_try.append(("openai", "gpt-3.5-turbo"))
-        if self.anthropic_client and ("anthropic", "claude-3-haiku") not in [(m[0], m[1]) for m in models_to_try]:
-            models_to_try.append(("anthropic", "claude-3-haiku"))
-
-        for provider, model_name in models_to_try:
+                if result["backup_started"]:
+                    candidates.remove(backup)
+                continue
+
+            router.begin(provider)
+            started = time.monotonic()
+            first_chunk_latency = None
+            response_parts = []
             try:
-                if provider == "openai":
-                    async for chunk in self._stream_openai(message, history, model_name, system_prompt, tools):
-                        yield chunk
-                elif provider == "anthropic":
-                    async for chunk in self._stream_anthropic(message, history, model_name, system_prompt, tools):
-                        yield chunk
-                elif provider == "groq":
-                    async for chunk in self._stream_groq(message, history, model_name, system_prompt, tools):
-                        yield chunk
-                elif provider == "gemini":
-                    if attachments and images:
-                        async for chunk in self._stream_gemini_with_images(message, history, images, system_prompt):
-                            yield chunk
-                    else:
-                        async for chunk in self._stream_gemini(message, history, system_prompt):
-                            yield chunk
+                async for chunk in self._scheduled_stream(provider, model_name, priority, *stream_args):
+                    if first_chunk_latency is None:
+                        first_chunk_latency = time.monotonic() - started
+                    if outcome is not None:
+                        response_parts.append(chunk)
+                    yield chunk
+                router.record_success(provider, first_chunk_latency or (time.monotonic() - started))
+                if outcome is not None:
+                    outcome.update(success=True, provider=provider, model=model_name, response="".join(response_parts))
                 return  # Success, exit
             except Exception as e:
-                error_msg = str(e).lower()
-                if "quota" in error_msg or "billing" in error_msg or "insufficient" in error_msg:
-                    yield f"⚠️ {provider.upper()} API quota exceeded. Trying next provider...\n\n"
-                    continue
-                elif "rate" in error_msg:
-                    yield f"⚠️ {provider.upper()} rate limit hit. Retrying in 2 seconds...\n\n"
-                    import asyncio
-                    await asyncio.sleep(2)
-                    continue
-                else:
-                    yield f"❌ {provider.upper()} error: {str(e)}. Trying next provider...\n\n"
-                    continue
-
-        # All providers failed
+                yield self._fallback_notice(provider, router.record_failure(provider, e), e)
+            finally:
+                router.release(provider)
+
+        # All providers failed or are cooling down
         yield "❌ All AI providers failed. Please check your API keys and billing status.\n\n💡 Try:\n- Adding credits to OpenAI\n- Checking Google AI Studio billing\n- Verifying API keys are correct"
 
+    async def _stream_hedged(
+        self,
+        primary: Tuple[str, str],
+        backup: Tuple[str, str],
+        stream_args: Tuple,
+        result: Dict,
+        priority: str = "interactive"
+    ) -> AsyncGenerator[str, None]:
+        """Race a backup provider against a primary that is slow to send its first chunk"""
+        router = self.registry.router
+        policy = self.registry.hedging
+        policy.stats["requests"] += 1
+
+        def start(candidate: Tuple[str, str]) -> StreamPump:
+            router.begin(candidate[0])
+            return StreamPump(candidate[0], candidate[1], self._scheduled_stream(*candidate, priority, *stream_args))
+
+        pumps = [start(primary)]
+        live = list(pumps)
+        winner = None
+        try:
+            try:
+                deadline = policy.deadline(router.latency_samples(primary[0]))
+                await asyncio.wait_for(pumps[0].ready.wait(), timeout=deadline)
+            except asyncio.TimeoutError:
+                pumps.append(start(backup))
+                live.append(pumps[1])
+                result["backup_started"] = True
+                policy.stats["hedged"] += 1
+
+            while winner is None and live:
+                waiters = {asyncio.ensure_future(pump.ready.wait()): pump for pump in live}
+                done, pending = await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+                for waiter in pending:
+                    waiter.cancel()
+                for pump in [p for p in live if p.ready.is_set()]:
+                    live.remove(pump)
+                    error = pump.failed_early()
+                    if error is not None:
+                        router.release(pump.provider)
+                        yield self._fallback_notice(pump.provider, router.record_failure(pump.provider, error), error)
+                    elif winner is None:
+                        winner = pump
+
+            if winner is None:
+                return
+
+            if len(pumps) > 1:
+                policy.stats["backup_wins" if winner is pumps[1] else "primary_wins"] += 1
+            for loser in live:
+                policy.stats["cancelled_streams"] += 1
+                policy.stats["wasted_chunks"] += loser.chunks
+                await loser.cancel()
+                router.release(loser.provider)
+            live = []
+
+            try:
+                response_parts = []
+                async for chunk in winner.chunks_iter():
+                    response_parts.append(chunk)
+                    yield chunk
+                router.record_success(winner.provider, winner.first_chunk_latency or (time.monotonic() - winner.started))
+                result.update(
+                    success=True,
+                    provider=winner.provider,
+                    model=winner.model_name,
+                    response="".join(response_parts)
+                )
+            except Exception as e:
+                yield self._fallback_notice(winner.provider, router.record_failure(winner.provider, e), e)
+        finally:
+            for pump in pumps:
+                if not pump.task.done():
+                    await pump.cancel()
+                router.release(pump.provider)
+
+    def _fallback_notice(self, provider: str, kind: str, error: Exception) -> str:
+        """Message shown to the user when a provider fails and the next one is tried"""
+        if kind == "quota":
+            return f"⚠️ {provider.upper()} API quota exceeded. Trying next provider...\n\n"
+        elif kind == "rate_limit":
+            return f"⚠️ {provider.upper()} rate limit hit. Trying next provider...\n\n"
+        elif kind == "throttled":
+            return f"⏳ {provider.upper()} is at its request limit. Trying next provider...\n\n"
+        return f"❌ {provider.upper()} error: {str(error)}. Trying next provider...\n\n"
+
+    def _configured_providers(self) -> Dict[str, bool]:
+        """Providers that have a client configured"""
+        return {
+            "openai": self.openai_client is not None,
+            "anthropic": self.anthropic_client is not None,
+            "groq": self.groq_client is not None,
+            "gemini": self.gemini_model is not None,
+        }
+
+    async def _scheduled_stream(
+        self,
+        provider: str,
+        model_name: str,
+        priority: str,
+        message: str,
+        history: List[Dict],
+        system_prompt: Optional[str],
+        tools: Optional[List[Dict]],
+        images: List[Dict]
+    ) -> AsyncGenerator[str, None]:
+        """Stream from a provider, each model call admitted by the provider's scheduler"""
+        prompt_tokens = sum(
+            count_tokens(text or "", provider)
+            for text in [message, system_prompt] + [m["content"] for m in history]
+        )
+
+        def slot(tool_messages: List[Dict] = ()):
+            # Tool rounds resend the prompt plus the calls and results so far
+            extra = count_tokens(json.dumps(tool_messages, ensure_ascii=False, default=str), provider) if tool_messages else 0
+            return self._scheduler_slot(provider, priority, prompt_tokens + extra)
+
+        output = []
+        started = time.perf_counter()
+        outcome = "cancelled"
+        try:
+            async for chunk in self._provider_stream(provider, model_name, message, history, system_prompt, tools, images, slot):
+                if not output:
+                    PROVIDER_TTFT_SECONDS.observe(time.perf_counter() - started, provider)
+                output.append(chunk)
+                yield chunk
+            outcome = "success"
+        except Exception as e:
+            outcome = "error"
+            PROVIDER_ERRORS.inc(provider, classify_error(e))
+            raise
+        finally:
+            PROVIDER_STREAM_SECONDS.observe(time.perf_counter() - started, provider)
+            PROVIDER_OUTPUT_TOKENS.inc(provider, amount=count_tokens("".join(output), provider))
+            PROVIDER_REQUESTS.inc(provider, outcome)
+
+    @asynccontextmanager
+    async def _scheduler_slot(self, provider: str, priority: str, prompt_tokens: int) -> AsyncIterator[List[str]]:
+        """Hold a scheduler slot for one model call.
+
+        Text the call produces goes in the yielded list, which settles the token
+        estimate when the slot is released.
+        """
+        scheduler = self.registry.scheduler(provider)
+        estimated = prompt_tokens + self.expected_output_tokens
+        await scheduler.acquire(estimated, priority)
+        output: List[str] = []
+        try:
+            yield output
+        finally:
+            scheduler.release(estimated, prompt_tokens + count_tokens("".join(output), provider))
+
+    async def _in_slot(self, slot: Callable, stream: AsyncGenerator[str, None]) -> AsyncGenerator[str, None]:
+        """Run a single-call stream inside one scheduler slot"""
+        async with slot() as output:
+            async for text in stream:
+                output.append(text)
+                yield text
+
+    def _provider_stream(
+        self,
+        provider: str,
+        model_name: str,
+        message: str,
+        history: List[Dict],
+        system_prompt: Optional[str],
+        tools: Optional[List[Dict]],
+        images: List[Dict],
+        slot: Callable
+    ) -> AsyncGenerator[str, None]:
+        """Open a response stream on one provider; ``slot(tool_messages)`` admits each model call"""
+        if provider == "openai":
+            return self._stream_openai(message, history, model_name, system_prompt, tools, slot)
+        elif provider == "anthropic":
+            return self._stream_anthropic(message, history, model_name, system_prompt, tools, slot)
+        elif provider == "groq":
+            return self._stream_groq(message, history, model_name, system_prompt, tools, slot)
+        elif provider == "gemini" and images:
+            return self._in_slot(slot, self._stream_gemini_with_images(message, history, model_name, images, system_prompt))
+        elif provider == "gemini":
+            return self._in_slot(slot, self._stream_gemini(message, history, model_name, system_prompt))
+        raise ValueError(f"Unknown provider: {provider}")
+
     async def _stream_openai(
         self,
         message: str,
         history: List[Dict],
         model: str,
         system_prompt: Optional[str],
-        tools: Optional[List[Dict]]
+        tools: Optional[List[Dict]],
+        slot: Callable
     ) -> AsyncGenerator[str, None]:
         """Stream from OpenAI"""
         messages = []
@@ -145,17 +411,9 @@ class AIService:
             messages.append({"role": "system", "content": system_prompt})
         messages.extend(history)
         messages.append({"role": "user", "content": message})
-        
-        stream = await self.openai_client.chat.completions.create(
-            model=model,
-            messages=messages,
-            tools=tools,
-            stream=True
-        )
-        
-        async for chunk in stream:
-            if chunk.choices[0].delta.content:
-                yield chunk.choices[0].delta.content
+
+        async for text in self._stream_chat_completions(self.openai_client, model, messages, tools, slot):
+            yield text
 
     async def _stream_anthropic(
         self,
@@ -163,20 +421,59 @@ class AIService:
         history: List[Dict],
         model: str,
         system_prompt: Optional[str],
-        tools: Optional[List[Dict]]
+        tools: Optional[List[Dict]],
+        slot: Callable
     ) -> AsyncGenerator[str, None]:
         """Stream from Anthropic Claude"""
-        messages = history + [{"role": "user", "content": message}]
-
-        async with self.anthropic_client.messages.stream(
-            model=model,
-            max_tokens=4096,
-            system=system_prompt or "",
-            messages=messages,
-            tools=tools
-        ) as stream:
-            async for text in stream.text_stream:
-                yield text
+        # Anthropic takes system text (e.g. a conversation summary) separately from the turns
+        system_parts = [system_prompt] if system_prompt else []
+        system_parts.extend(m["content"] for m in history if m["role"] == "system")
+        messages = [m for m in history if m["role"] != "system"] + [{"role": "user", "content": message}]
+        tool_specs = anthropic_tools(tools)
+        first_round = len(messages)
+
+        max_rounds = self.tool_runner.max_rounds
+        for round_index in range(max_rounds + 1):
+            options = {}
+            if tool_specs:
+                # Tools stay defined while the conversation holds tool blocks; the last round may not use them
+                options["tools"] = tool_specs
+                if round_index == max_rounds:
+                    options["tool_choice"] = {"type": "none"}
+            # The slot covers this model call only; tools run after it is released
+            async with slot(messages[first_round:]) as output:
+                async with self.anthropic_client.messages.stream(
+                    model=model,
+                    max_tokens=4096,
+                    system="\n\n".join(system_parts),
+                    messages=messages,
+                    **options
+                ) as stream:
+                    async for text in stream.text_stream:
+                        output.append(text)
+                        yield text
+                    final = await stream.get_final_message()
+                uses = [block for block in final.content if block.type == "tool_use"]
+                output.extend(json.dumps(block.input, ensure_ascii=False) for block in uses)
+
+            if not uses:
+                return
+            messages.append({
+                "role": "assistant",
+                "content": [
+                    {"type": "text", "text": block.text} if block.type == "text"
+                    else {"type": "tool_use", "id": block.id, "name": block.name, "input": block.input}
+                    for block in final.content if block.type in ("text", "tool_use")
+                ],
+            })
+            results = await self.tool_runner.run_all([{"name": block.name, "arguments": block.input} for block in uses])
+            messages.append({
+                "role": "user",
+                "content": [
+                    {"type": "tool_result", "tool_use_id": block.id, "content": result}
+                    for block, result in zip(uses, results)
+                ],
+            })
 
     async def _stream_groq(
         self,
@@ -184,7 +481,8 @@ class AIService:
         history: List[Dict],
         model: str,
         system_prompt: Optional[str],
-        tools: Optional[List[Dict]]
+        tools: Optional[List[Dict]],
+        slot: Callable
     ) -> AsyncGenerator[str, None]:
         """Stream from Groq"""
         messages = []
@@ -193,101 +491,183 @@ class AIService:
         messages.extend(history)
         messages.append({"role": "user", "content": message})
 
-        stream = await self.groq_client.chat.completions.create(
-            model=model,
-            messages=messages,
-            tools=tools,
-            stream=True
-        )
+        async for text in self._stream_chat_completions(self.groq_client, model, messages, tools, slot):
+            yield text
 
-        async for chunk in stream:
-            if chunk.choices[0].delta.content:
-                yield chunk.choices[0].delta.content
+    async def _stream_chat_completions(
+        self,
+        client,
+        model: str,
+        messages: List[Dict],
+        tools: Optional[List[Dict]],
+        slot: Callable
+    ) -> AsyncGenerator[str, None]:
+        """Stream an OpenAI-compatible chat completion, running requested tools between rounds"""
+        first_round = len(messages)
+        max_rounds = self.tool_runner.max_rounds
+        for round_index in range(max_rounds + 1):
+            options = {}
+            if tools:
+                options["tools"] = tools
+                if round_index == max_rounds:
+                    # Out of rounds: the model has to answer with what it has
+                    options["tool_choice"] = "none"
+            text_parts = []
+            calls: Dict[int, Dict] = {}
+            # The slot covers this model call only; tools run after it is released
+            async with slot(messages[first_round:]) as output:
+                stream = await client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    stream=True,
+                    **options
+                )
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    if delta.content:
+                        text_parts.append(delta.content)
+                        output.append(delta.content)
+                        yield delta.content
+                    # Tool calls arrive in fragments keyed by index; arguments are streamed JSON text
+                    for fragment in delta.tool_calls or []:
+                        call = calls.setdefault(fragment.index, {"id": "", "name": "", "arguments": ""})
+                        if fragment.id:
+                            call["id"] = fragment.id
+                        if fragment.function and fragment.function.name:
+                            call["name"] += fragment.function.name
+                        if fragment.function and fragment.function.arguments:
+                            call["arguments"] += fragment.function.arguments
+                output.extend(call["arguments"] for call in calls.values())
+            if not calls:
+                return
+
+            ordered = [calls[index] for index in sorted(calls)]
+            messages.append({
+                "role": "assistant",
+                "content": "".join(text_parts) or None,
+                "tool_calls": [
+                    {"id": call["id"], "type": "function", "function": {"name": call["name"], "arguments": call["arguments"]}}
+                    for call in ordered
+                ],
+            })
+            results = await self.tool_runner.run_all(ordered)
+            messages.extend(
+                {"role": "tool", "tool_call_id": call["id"], "content": result}
+                for call, result in zip(ordered, results)
+            )
 
     async def _stream_gemini(
         self,
         message: str,
         history: List[Dict],
+        model_name: str,
         system_prompt: Optional[str]
     ) -> AsyncGenerator[str, None]:
         """Stream from Google Gemini"""
         if not self.gemini_model:
             yield "Gemini model not available. Please check API key."
             return
-        
-        try:
-            # Create a new model instance using the latest available model
-            model_name = 'gemini-2.5-flash'
-            try:
-                current_model = genai.GenerativeModel(model_name)
-            except:
-                try:
-                    current_model = genai.GenerativeModel('gemini-flash-latest')
-                    model_name = 'gemini-flash-latest'
-                except:
-                    # Use the initialized model as fallback
-                    current_model = self.gemini_model
-            
-            # Convert history to Gemini format
-            chat = current_model.start_chat(history=[])
-            
-            full_prompt = message
-            if system_prompt:
-                full_prompt = f"{system_prompt}\n\n{message}"
-            
-            # Gemini streaming (synchronous API)
-            response = chat.send_message(full_prompt, stream=True)
-            
-            for chunk in response:
+
+        # Model handles are cached by the registry; unknown names use the preferred model
+        models = self.registry.models
+        current_model = models.gemini_model(model_name if models.is_available("gemini", model_name) else None)
+
+        # Convert history to Gemini format
+        chat = current_model.start_chat(history=[])
+
+        full_prompt = message
+        if system_prompt:
+            full_prompt = f"{system_prompt}\n\n{message}"
+
+        # Gemini streaming (synchronous API) runs off the event loop; errors propagate
+        # so the router can record them and fall through to the next provider
+        async for text in self._relay_gemini_stream(
+            lambda: chat.send_message(full_prompt, stream=True)
+        ):
+            yield text
+
+    async def _relay_gemini_stream(self, start_stream: Callable[[], Iterable]) -> AsyncGenerator[str, None]:
+        """Relay a synchronous Gemini stream through the bounded Gemini thread pool"""
+        def texts():
+            for chunk in start_stream():
                 if hasattr(chunk, 'text') and chunk.text:
                     yield chunk.text
-        except Exception as e:
-            yield f"Error with Gemini: {str(e)}. Please check your API key and model availability."
 
-    async def _get_conversation_history(self, conversation_id: Optional[int]) -> List[Dict]:
-        """Get conversation history from database"""
+        async for text in iterate_in_thread(
+            texts,
+            self.registry.gemini_executor,
+            self.registry.gemini_stream_buffer
+        ):
+            yield text
+
+    async def get_conversation_history(
+        self,
+        conversation_id: Optional[int],
+        model: str = "gpt-4",
+        system_prompt: Optional[str] = None,
+        message: Optional[str] = None,
+        db: Optional[AsyncSession] = None
+    ) -> List[Dict]:
+        """Get the history that stream_chat would send for a conversation"""
+        return await self._get_conversation_history(conversation_id, model, system_prompt, message, db)
+
+    async def _get_conversation_history(
+        self,
+        conversation_id: Optional[int],
+        model: str = "gpt-4",
+        system_prompt: Optional[str] = None,
+        message: Optional[str] = None,
+        db: Optional[AsyncSession] = None
+    ) -> List[Dict]:
+        """Get the most recent conversation history that fits the token budget"""
         if not conversation_id:
             return []
 
         try:
-            from app.database import SessionLocal
-            from app.models.conversation import Message
-
-            db = SessionLocal()
-            messages = db.query(Message).filter(
-                Message.conversation_id == conversation_id
-            ).order_by(Message.created_at).all()
-
-            history = []
-            for msg in messages:
-                history.append({
-                    "role": msg.role,
-                    "content": msg.content
-                })
-
-            db.close()
-            return history
+            provider = provider_for_model(model) or "openai"
+            return await self.history_builder.build(conversation_id, provider, system_prompt, message, db)
         except Exception as e:
             print(f"Error loading conversation history: {e}")
             return []
 
     async def generate_image(self, prompt: str, model: str = "dall-e-3") -> str:
-        """Generate image from prompt"""
+        """Generate image from prompt.
+
+        Returns a local ``/uploads`` URL; repeated prompts reuse the stored image.
+        """
         if model == "dall-e-3" and self.openai_client:
-            response = await self.openai_client.images.generate(
-                model=model,
-                prompt=prompt,
-                n=1,
-                size="1024x1024"
+            return await self.generated_images.get_or_generate(
+                prompt, model, GENERATED_IMAGE_SIZE, lambda: self._render_image(prompt, model)
             )
-            return response.data[0].url
         else:
             return "Image generation not available"
 
+    async def generate_images(self, prompts: List[str], model: str = "dall-e-3") -> List[Dict]:
+        """Generate several images with bounded concurrency, reporting each prompt's outcome"""
+        if model != "dall-e-3" or not self.openai_client:
+            return [{"prompt": prompt, "status": "error", "error": "Image generation not available"} for prompt in prompts]
+        return await self.generated_images.generate_many(
+            prompts, model, GENERATED_IMAGE_SIZE, lambda prompt: (lambda: self._render_image(prompt, model))
+        )
+
+    async def _render_image(self, prompt: str, model: str) -> bytes:
+        # Image bytes come back inline, so there is no expiring URL to fetch afterwards
+        response = await self.openai_client.images.generate(
+            model=model,
+            prompt=prompt,
+            n=1,
+            size=GENERATED_IMAGE_SIZE,
+            response_format="b64_json"
+        )
+        return base64.b64decode(response.data[0].b64_json)
+
     async def _stream_gemini_with_images(
         self,
         message: str,
         history: List[Dict],
+        model_name: str,
         images: List[Dict],
         system_prompt: Optional[str]
     ) -> AsyncGenerator[str, None]:
@@ -295,63 +675,31 @@ class AIService:
         if not self.gemini_model:
             yield "Gemini model not available. Please check API key."
             return
-        
-        try:
-            from PIL import Image
-            
-            # Use gemini-pro-vision or latest flash model with vision support
-            # Try multiple model names in order of preference
-            vision_model = None
-            model_names = [
-                'gemini-1.5-pro-latest',  # Latest stable with vision
-                'gemini-1.5-flash-latest',  # Flash version with vision
-                'gemini-pro-vision',  # Older vision model
-                'models/gemini-1.5-pro-latest',  # With models/ prefix
-                'models/gemini-1.5-flash-latest',
-            ]
-            
-            for model_name in model_names:
-                try:
-                    vision_model = genai.GenerativeModel(model_name)
-                    break  # If successful, use this model
-                except Exception as model_error:
-                    continue  # Try next model
-            
-            # If no vision model works, use the default gemini model
-            if not vision_model:
-                vision_model = self.gemini_model
-            
-            # Prepare content with images
-            content_parts = []
-            if system_prompt:
-                content_parts.append(system_prompt + "\n\n")
-            content_parts.append(message)
-            
-            for img in images:
-                # Get image path from attachment
-                img_url = img.get("url", "")
-                if img_url.startswith("/uploads/"):
-                    img_path = UPLOAD_DIR / img_url.replace("/uploads/", "")
-                elif img.get("path"):
-                    img_path = Path(img.get("path"))
-                else:
-                    continue
-                
-                if img_path.exists():
-                    img_file = Image.open(img_path)
-                    content_parts.append(img_file)
-            
-            # Generate response
-            response = vision_model.generate_content(
+
+        models = self.registry.models
+        if not (models.info(model_name).vision and models.is_available("gemini", model_name)):
+            model_name = models.preferred("gemini", vision=True)
+        vision_model = models.gemini_model(model_name)
+
+        # Provider-sized copies are made once per upload and reused on later turns
+        content_parts = []
+        if system_prompt:
+            content_parts.append(system_prompt + "\n\n")
+        content_parts.append(message)
+        for img in images:
+            img_path = attachment_path(img)
+            if img_path is not None and img_path.exists():
+                data, mime_type = await self.image_cache.load(img_path, "gemini")
+                content_parts.append({"mime_type": mime_type, "data": data})
+
+        def start_stream():
+            return vision_model.generate_content(
                 content_parts,
                 stream=True
             )
-            
-            for chunk in response:
-                if hasattr(chunk, 'text') and chunk.text:
-                    yield chunk.text
-        except Exception as e:
-            yield f"Error processing image: {str(e)}. Make sure Pillow is installed: pip install Pillow"
+
+        async for text in self._relay_gemini_stream(start_stream):
+            yield text
 
     async def analyze_image(self, image_url: str, prompt: str) -> str:
         """Analyze image with vision model"""
@@ -371,88 +719,77 @@ class AIService:
             return response.choices[0].message.content
         return "Image analysis not available"
 
-    async def text_to_speech(self, text: str, voice: str = "alloy") -> bytes:
-        """Convert text to speech using OpenAI TTS with fallback"""
+    async def text_to_speech(self, text: str, voice: str = "alloy") -> Tuple[str, Optional[Path], Optional[AsyncIterator[bytes]]]:
+        """Convert text to speech using OpenAI TTS with fallback.
+
+        Returns the clip's cache key and either the cached MP3 file or an iterator
+        that relays audio chunks as the provider produces them, storing the clip
+        once it has streamed completely. Provider errors are raised before any
+        audio is returned.
+        """
+        key = audio_key(text, voice, self.tts_model)
+        cached = self.audio_cache.get(key)
+        if cached is not None:
+            return key, cached, None
+
         if not self.openai_client:
             raise Exception("OpenAI client not available for TTS. Please add OPENAI_API_KEY to your .env file.")
 
-        try:
-            response = await self.openai_client.audio.speech.create(
-                model="tts-1",
+        async def speech() -> AsyncIterator[bytes]:
+            # The streaming variant returns once headers arrive instead of buffering the whole clip
+            async with self.openai_client.audio.speech.with_streaming_response.create(
+                model=self.tts_model,
                 voice=voice,
-                input=text
-            )
-            return b''.join([chunk async for chunk in response.aiter_bytes()])
+                input=text,
+                response_format="mp3"
+            ) as response:
+                async for chunk in response.iter_bytes():
+                    yield chunk
+
+        # Start the stream here so provider errors surface before any audio is
+        # returned. The upstream response only lives inside the generator, which
+        # asyncio closes even if the body is never read.
+        stream = speech()
+        try:
+            first = await stream.__anext__()
+        except StopAsyncIteration:
+            first = b""
         except Exception as e:
-            error_msg = str(e).lower()
-            if "quota" in error_msg or "billing" in error_msg or "insufficient" in error_msg:
+            kind = classify_error(e)
+            if kind == "quota":
                 raise Exception("TTS unavailable: OpenAI quota exceeded. Please add credits to your OpenAI account.")
-            elif "rate" in error_msg:
+            elif kind == "rate_limit":
                 raise Exception("TTS rate limit exceeded. Please wait a moment and try again.")
             else:
                 raise Exception(f"TTS failed: {str(e)}")
 
+        async def chunks() -> AsyncIterator[bytes]:
+            try:
+                if first:
+                    yield first
+                async for chunk in stream:
+                    yield chunk
+            finally:
+                await stream.aclose()
+
+        return key, None, self.audio_cache.tee(key, chunks())
+
     async def enhance_image(self, image_path: str, enhancement_type: str = "upscale") -> str:
         """Enhance image using AI"""
         try:
-            from PIL import Image, ImageFilter, ImageEnhance
-            import os
-
-            img = Image.open(image_path)
-
-            if enhancement_type == "upscale":
-                # Use AI-powered upscaling with better quality
-                # First apply some preprocessing
-                img = img.convert('RGB')
-
-                # Apply unsharp mask for better detail
-                unsharp = ImageFilter.UnsharpMask(radius=1, percent=150, threshold=3)
-                img = img.filter(unsharp)
-
-                # Upscale using high-quality resampling
-                new_size = (img.width * 2, img.height * 2)
-                enhanced = img.resize(new_size, Image.Resampling.LANCZOS)
-
-                # Apply slight sharpening after upscale
-                enhancer = ImageEnhance.Sharpness(enhanced)
-                enhanced = enhancer.enhance(1.3)
-
-            elif enhancement_type == "sharpen":
-                # Advanced sharpening with multiple passes
-                enhanced = img.filter(ImageFilter.UnsharpMask(radius=1, percent=200, threshold=2))
-                enhancer = ImageEnhance.Sharpness(enhanced)
-                enhanced = enhancer.enhance(2.5)
-
-            elif enhancement_type == "brighten":
-                # Smart brightness enhancement
-                enhancer = ImageEnhance.Brightness(img)
-                enhanced = enhancer.enhance(1.4)
-                # Also slightly increase contrast for better visibility
-                contrast_enhancer = ImageEnhance.Contrast(enhanced)
-                enhanced = contrast_enhancer.enhance(1.1)
-
-            elif enhancement_type == "hdr":
-                # HDR-like effect
-                enhanced = img.filter(ImageFilter.UnsharpMask(radius=2, percent=300, threshold=1))
-                enhancer = ImageEnhance.Contrast(enhanced)
-                enhanced = enhancer.enhance(1.3)
-                brightness_enhancer = ImageEnhance.Brightness(enhanced)
-                enhanced = brightness_enhancer.enhance(1.1)
+            target, _ = await self.image_enhancer.enhance(Path(image_path), enhancement_type)
+            return self.image_enhancer.url_for(target)
+        except Exception as e:
+            raise Exception(f"Image enhancement failed: {str(e)}")
 
-            else:
-                enhanced = img
 
-            # Save enhanced image with high quality
-            base_name = os.path.basename(image_path)
-            name, ext = os.path.splitext(base_name)
-            enhanced_path = os.path.join(UPLOAD_DIR, f"{name}_enhanced{ext}")
+_ai_service: Optional[AIService] = None
 
-            # Save with high quality settings
-            if ext.lower() in ['.jpg', '.jpeg']:
-                enhanced.save(enhanced_path, quality=95, optimize=True)
-            else:
-                enhanced.save(enhanced_path)
 
-            return f"/uploads/{name}_enhanced{ext}"
-        except Exception as e:
-            raise Exception(f"Image enhancement failed: {str(e)}")
+def get_ai_service() -> AIService:
+    """Return the process-wide AI service bound to the shared provider registry"""
+    global _ai_service
+    registry = get_provider_registry()
+    if _ai_service is None or _ai_service.registry is not registry:
+        _ai_service = AIService(registry)
+    return _ai_service
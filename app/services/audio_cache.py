@@ -0,0 +1,150 @@
+"""
+Audio Cache - Synthesized speech on disk, keyed by what was spoken and how
+"""
+import os
+import json
+import asyncio
+import hashlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional
+from dotenv import load_dotenv
+from app.services.image_cache import UPLOAD_DIR
+
+load_dotenv()
+
+
+def audio_key(text: str, voice: str, model: str) -> str:
+    """Content address of a clip: the same text, voice and model always sound the same"""
+    return hashlib.sha256(json.dumps([model, voice, text], ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    """Size-capped LRU of MP3 files under AUDIO_CACHE_DIR (default ``UPLOAD_DIR/audio``).
+
+    Clips are written while they stream to the first listener and only become
+    visible once complete. Recency is kept in memory and mirrored in file
+    modification times so the LRU order survives restarts.
+    """
+
+    def __init__(self, root: Optional[Path] = None, max_bytes: Optional[int] = None):
+        self.root = Path(root or os.getenv("AUDIO_CACHE_DIR", "") or UPLOAD_DIR / "audio")
+        self.max_bytes = max_bytes if max_bytes is not None else int(float(os.getenv("AUDIO_CACHE_MAX_MB", 256)) * 1024 * 1024)
+        self.enabled = os.getenv("AUDIO_CACHE_ENABLED", "true").lower() == "true"
+        # key -> size in bytes, least recently used first
+        self.entries: "OrderedDict[str, int]" = OrderedDict()
+        self.total_bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        if self.enabled:
+            self._load_index()
+
+    def _load_index(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        for leftover in self.root.glob("*.tmp"):
+            # Interrupted writes from an earlier run
+            leftover.unlink(missing_ok=True)
+        files = []
+        for path in self.root.glob("*.mp3"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, path.stem, stat.st_size))
+        for _, key, size in sorted(files):
+            self.entries[key] = size
+            self.total_bytes += size
+        self._evict()
+
+    def path(self, key: str) -> Path:
+        return self.root / f"{key}.mp3"
+
+    def get(self, key: str) -> Optional[Path]:
+        """Cached clip for ``key``, marked as most recently used"""
+        if not self.enabled:
+            self.stats["misses"] += 1
+            return None
+        path = self.path(key)
+        try:
+            os.utime(path)
+            size = path.stat().st_size
+        except FileNotFoundError:
+            # Never stored, or evicted by another worker sharing the directory
+            self.total_bytes -= self.entries.pop(key, 0)
+            self.stats["misses"] += 1
+            return None
+        if key not in self.entries:
+            # Stored by another worker sharing the directory
+            self.entries[key] = size
+            self.total_bytes += size
+        self.entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return path
+
+    async def tee(self, key: str, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        """Yield ``chunks`` unchanged while writing them to the cache.
+
+        The clip is stored only if the stream completes; a listener that
+        disconnects early leaves nothing behind.
+        """
+        if not self.enabled:
+            async for chunk in chunks:
+                yield chunk
+            return
+
+        target = self.path(key)
+        temporary = target.with_name(f"{target.name}.{os.getpid()}.{id(chunks)}.tmp")
+        handle = await asyncio.to_thread(open, temporary, "wb")
+        size = 0
+        complete = False
+        try:
+            async for chunk in chunks:
+                await asyncio.to_thread(handle.write, chunk)
+                size += len(chunk)
+                yield chunk
+            complete = True
+        finally:
+            await asyncio.to_thread(handle.close)
+            if complete and size:
+                # Rename so a concurrent reader never sees a partial file
+                await asyncio.to_thread(os.replace, temporary, target)
+                self._add(key, size)
+            else:
+                await asyncio.to_thread(temporary.unlink, missing_ok=True)
+
+    def _add(self, key: str, size: int):
+        self.total_bytes -= self.entries.pop(key, 0)
+        self.entries[key] = size
+        self.total_bytes += size
+        self.stats["stores"] += 1
+        self._evict()
+
+    def _evict(self):
+        # Keep the newest clip even if it alone exceeds the cap
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            key, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            self.stats["evictions"] += 1
+            try:
+                self.path(key).unlink()
+            except FileNotFoundError:
+                pass
+
+    def snapshot(self) -> Dict:
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+_audio_cache: Optional[AudioCache] = None
+
+
+def get_audio_cache() -> AudioCache:
+    """Return the process-wide speech cache"""
+    global _audio_cache
+    if _audio_cache is None:
+        _audio_cache = AudioCache()
+    return _audio_cache
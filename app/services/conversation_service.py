@@ -1,43 +1,107 @@
 """
 Conversation Service - Handle conversation and message persistence
 """
-from typing import Optional, List, Dict
-from app.database import SessionLocal
+from typing import Optional, Dict, Tuple
+from app.database import session_scope, run_write
 from app.models.conversation import Conversation, Message
-from sqlalchemy.orm import Session
+from app.services.history_cache import get_history_cache
+from app.services.metrics import DB_OPERATION_SECONDS
+from app.utils.pagination import encode_cursor, decode_cursor
+from sqlalchemy import select, delete, update, func, or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 
+# Characters of the newest message shown under each conversation in the list
+PREVIEW_CHARS = 120
+
+
+def _before(timestamp_column, id_column, key: Tuple[datetime, int]):
+    """Rows ordered before ``key`` in (timestamp, id) order"""
+    timestamp, row_id = key
+    return or_(timestamp_column < timestamp, and_(timestamp_column == timestamp, id_column < row_id))
+
+
+def _after(timestamp_column, id_column, key: Tuple[datetime, int]):
+    """Rows ordered after ``key`` in (timestamp, id) order"""
+    timestamp, row_id = key
+    return or_(timestamp_column > timestamp, and_(timestamp_column == timestamp, id_column > row_id))
+
 
 class ConversationService:
-    """Service for managing conversations and messages"""
-    
-    def create_conversation(self, title: Optional[str] = None, user_id: Optional[int] = None) -> Dict:
+    """Service for managing conversations and messages.
+
+    Pass the request's session to share it across calls; otherwise each call
+    opens its own. Writes go through ``run_write``, which hands them to the
+    SQLite writer task when that is enabled.
+    """
+
+    def __init__(self, db: Optional[AsyncSession] = None):
+        self.db = db
+
+    @DB_OPERATION_SECONDS.time("conversation", "create_conversation")
+    async def create_conversation(self, title: Optional[str] = None, user_id: Optional[int] = None) -> Dict:
         """Create a new conversation"""
-        db = SessionLocal()
-        try:
+        async def create(db: AsyncSession) -> Dict:
             conversation = Conversation(
                 title=title or "New Chat",
                 user_id=user_id
             )
             db.add(conversation)
-            db.commit()
-            db.refresh(conversation)
+            await db.flush()
             return {
                 "id": conversation.id,
                 "title": conversation.title,
                 "created_at": conversation.created_at.isoformat(),
                 "updated_at": conversation.updated_at.isoformat()
             }
-        finally:
-            db.close()
-    
-    def get_conversation(self, conversation_id: int) -> Optional[Dict]:
-        """Get conversation with messages"""
-        db = SessionLocal()
-        try:
-            conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
-            if conversation:
-                messages = [
+
+        return await run_write(create, self.db)
+
+    @DB_OPERATION_SECONDS.time("conversation", "get_conversation")
+    async def get_conversation(
+        self,
+        conversation_id: int,
+        limit: Optional[int] = None,
+        before: Optional[str] = None,
+        after: Optional[str] = None
+    ) -> Optional[Dict]:
+        """Get conversation with messages, oldest first.
+
+        Without a ``limit`` every message is returned. With one, the page holds
+        the newest ``limit`` messages, or those just older than the ``before``
+        cursor or just newer than the ``after`` cursor; ``older_cursor`` and
+        ``newer_cursor`` fetch the neighbouring pages and are None at either end.
+        Raises ValueError for a malformed cursor.
+        """
+        before_key = decode_cursor(before) if before else None
+        after_key = decode_cursor(after) if after else None
+        async with session_scope(self.db) as db:
+            conversation = await db.get(Conversation, conversation_id)
+            if not conversation:
+                return None
+
+            query = select(Message).where(Message.conversation_id == conversation_id)
+            if after_key:
+                query = query.where(_after(Message.created_at, Message.id, after_key))
+                query = query.order_by(Message.created_at, Message.id)
+            else:
+                if before_key:
+                    query = query.where(_before(Message.created_at, Message.id, before_key))
+                query = query.order_by(Message.created_at.desc(), Message.id.desc())
+            if limit is not None:
+                query = query.limit(limit + 1)
+            rows = list(await db.scalars(query))
+            has_more = limit is not None and len(rows) > limit
+            rows = rows[:limit] if limit is not None else rows
+            if not after_key:
+                rows.reverse()
+
+            result = {
+                "id": conversation.id,
+                "title": conversation.title,
+                "created_at": conversation.created_at.isoformat(),
+                "updated_at": conversation.updated_at.isoformat(),
+                "messages": [
                     {
                         "id": m.id,
                         "role": m.role,
@@ -45,43 +109,65 @@ class ConversationService:
                         "model": m.model,
                         "created_at": m.created_at.isoformat()
                     }
-                    for m in conversation.messages
+                    for m in rows
                 ]
-                return {
-                    "id": conversation.id,
-                    "title": conversation.title,
-                    "created_at": conversation.created_at.isoformat(),
-                    "updated_at": conversation.updated_at.isoformat(),
-                    "messages": messages
-                }
-            return None
-        finally:
-            db.close()
-    
-    def get_all_conversations(self, user_id: Optional[int] = None, limit: int = 50) -> List[Dict]:
-        """Get all conversations"""
-        db = SessionLocal()
-        try:
-            query = db.query(Conversation)
+            }
+            if limit is not None:
+                first = encode_cursor(rows[0].created_at, rows[0].id) if rows else None
+                last = encode_cursor(rows[-1].created_at, rows[-1].id) if rows else None
+                if after_key:
+                    result["older_cursor"] = first or after
+                    result["newer_cursor"] = last if has_more else None
+                else:
+                    result["older_cursor"] = first if has_more else None
+                    result["newer_cursor"] = (last or before) if before_key else None
+            return result
+
+    @DB_OPERATION_SECONDS.time("conversation", "get_all_conversations")
+    async def get_all_conversations(
+        self,
+        user_id: Optional[int] = None,
+        limit: int = 50,
+        cursor: Optional[str] = None
+    ) -> Dict:
+        """Get conversations, most recently updated first.
+
+        ``next_cursor`` continues the list and is None on the last page. Raises
+        ValueError for a malformed cursor.
+        """
+        cursor_key = decode_cursor(cursor) if cursor else None
+        async with session_scope(self.db) as db:
+            query = select(Conversation)
             if user_id:
-                query = query.filter(Conversation.user_id == user_id)
-            
-            conversations = query.order_by(Conversation.updated_at.desc()).limit(limit).all()
-            
-            return [
-                {
-                    "id": conv.id,
-                    "title": conv.title or "New Chat",
-                    "created_at": conv.created_at.isoformat(),
-                    "updated_at": conv.updated_at.isoformat(),
-                    "message_count": len(conv.messages)
-                }
-                for conv in conversations
-            ]
-        finally:
-            db.close()
-    
-    def save_message(
+                query = query.where(Conversation.user_id == user_id)
+            if cursor_key:
+                query = query.where(_before(Conversation.updated_at, Conversation.id, cursor_key))
+
+            # Counters may have changed in another session since these rows were loaded
+            rows = list(await db.scalars(
+                query.order_by(Conversation.updated_at.desc(), Conversation.id.desc())
+                .limit(limit + 1)
+                .execution_options(populate_existing=True)
+            ))
+            page = rows[:limit]
+
+            return {
+                "conversations": [
+                    {
+                        "id": conv.id,
+                        "title": conv.title or "New Chat",
+                        "created_at": conv.created_at.isoformat(),
+                        "updated_at": conv.updated_at.isoformat(),
+                        "message_count": conv.message_count,
+                        "last_message_preview": conv.last_message_preview
+                    }
+                    for conv in page
+                ],
+                "next_cursor": encode_cursor(page[-1].updated_at, page[-1].id) if len(rows) > limit else None
+            }
+
+    @DB_OPERATION_SECONDS.time("conversation", "save_message")
+    async def save_message(
         self,
         conversation_id: int,
         role: str,
@@ -90,22 +176,24 @@ class ConversationService:
         metadata: Optional[Dict] = None
     ) -> Dict:
         """Save a message to a conversation"""
-        db = SessionLocal()
-        try:
+        async def save(db: AsyncSession) -> Optional[Message]:
             # Update conversation timestamp
-            conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+            conversation = await db.get(Conversation, conversation_id)
             if not conversation:
-                return {"error": "Conversation not found"}
-            
+                return None
+
             # Auto-generate title from first user message if not set
             if not conversation.title or conversation.title == "New Chat":
                 if role == "user" and len(content) > 0:
                     # Use first 50 chars of first message as title
                     title = content[:50] + ("..." if len(content) > 50 else "")
                     conversation.title = title
-            
+
             conversation.updated_at = datetime.utcnow()
-            
+            # Incremented in SQL so concurrent saves cannot lose a count
+            conversation.message_count = Conversation.message_count + 1
+            conversation.last_message_preview = content[:PREVIEW_CHARS]
+
             # Create message
             message = Message(
                 conversation_id=conversation_id,
@@ -115,81 +203,144 @@ class ConversationService:
                 meta_data=metadata or {}
             )
             db.add(message)
-            db.commit()
-            db.refresh(message)
-            
-            return {
-                "id": message.id,
-                "conversation_id": message.conversation_id,
-                "role": message.role,
-                "content": message.content,
-                "model": message.model,
-                "created_at": message.created_at.isoformat()
-            }
-        finally:
-            db.close()
-    
-    def update_conversation_title(self, conversation_id: int, title: str) -> bool:
+            await db.flush()
+            return message
+
+        message = await run_write(save, self.db)
+        if message is None:
+            return {"error": "Conversation not found"}
+        get_history_cache().append(conversation_id, {
+            "id": message.id,
+            "role": message.role,
+            "content": message.content,
+            "created_at": message.created_at,
+            "meta_data": message.meta_data or {}
+        })
+
+        return {
+            "id": message.id,
+            "conversation_id": message.conversation_id,
+            "role": message.role,
+            "content": message.content,
+            "model": message.model,
+            "created_at": message.created_at.isoformat()
+        }
+
+    @DB_OPERATION_SECONDS.time("conversation", "update_conversation_title")
+    async def update_conversation_title(self, conversation_id: int, title: str) -> bool:
         """Update conversation title"""
-        db = SessionLocal()
-        try:
-            conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+        async def rename(db: AsyncSession) -> bool:
+            conversation = await db.get(Conversation, conversation_id)
             if conversation:
                 conversation.title = title
-                db.commit()
                 return True
             return False
-        finally:
-            db.close()
-    
-    def delete_conversation(self, conversation_id: int) -> bool:
+
+        return await run_write(rename, self.db)
+
+    @DB_OPERATION_SECONDS.time("conversation", "delete_conversation")
+    async def delete_conversation(self, conversation_id: int) -> bool:
         """Delete a conversation"""
-        db = SessionLocal()
-        try:
-            conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
-            if conversation:
-                db.delete(conversation)
-                db.commit()
-                return True
-            return False
-        finally:
-            db.close()
+        async def remove(db: AsyncSession) -> bool:
+            # Bulk deletes; the ORM cascade would lazy-load every message first
+            await db.execute(delete(Message).where(Message.conversation_id == conversation_id))
+            result = await db.execute(delete(Conversation).where(Conversation.id == conversation_id))
+            return result.rowcount > 0
 
-    def update_message_content(self, message_id: int, new_content: str) -> bool:
+        if await run_write(remove, self.db):
+            get_history_cache().evict(conversation_id)
+            return True
+        return False
+
+    @DB_OPERATION_SECONDS.time("conversation", "update_message_content")
+    async def update_message_content(self, message_id: int, new_content: str) -> bool:
         """Update the content of a specific message"""
-        db = SessionLocal()
-        try:
-            message = db.query(Message).filter(Message.id == message_id).first()
-            if message:
-                message.content = new_content
-                message.updated_at = datetime.utcnow()
-                db.commit()
-                return True
+        async def edit(db: AsyncSession):
+            message = await db.get(Message, message_id)
+            if not message:
+                return None
+            message.content = new_content
+            message.updated_at = datetime.utcnow()
+            # Token counts cached by HistoryBuilder were for the old text
+            if "token_counts" in (message.meta_data or {}):
+                message.meta_data = {k: v for k, v in message.meta_data.items() if k != "token_counts"}
+            await db.flush()
+            # The edited message may be the newest one
+            await self._refresh_counters(db, message.conversation_id)
+            return message.conversation_id, await self._invalidate_summary(db, message.conversation_id, message.id)
+
+        edited = await run_write(edit, self.db)
+        if edited is None:
             return False
-        finally:
-            db.close()
+        conversation_id, invalidated = edited
+        if invalidated:
+            get_history_cache().evict(conversation_id)
+        else:
+            get_history_cache().update_content(conversation_id, message_id, new_content)
+        return True
 
-    def remove_messages_after(self, message_id: int, conversation_id: int) -> bool:
+    @DB_OPERATION_SECONDS.time("conversation", "remove_messages_after")
+    async def remove_messages_after(self, message_id: int, conversation_id: int) -> bool:
         """Remove all messages after a specific message in a conversation"""
-        db = SessionLocal()
-        try:
+        async def cut(db: AsyncSession):
             # Find the message to get its creation time
-            message = db.query(Message).filter(
-                Message.id == message_id,
-                Message.conversation_id == conversation_id
-            ).first()
+            message = await db.scalar(
+                select(Message).where(
+                    Message.id == message_id,
+                    Message.conversation_id == conversation_id
+                )
+            )
 
             if not message:
-                return False
+                return None
 
             # Delete all messages in this conversation that were created after this message
-            deleted_count = db.query(Message).filter(
-                Message.conversation_id == conversation_id,
-                Message.created_at > message.created_at
-            ).delete()
+            await db.execute(
+                delete(Message).where(
+                    Message.conversation_id == conversation_id,
+                    Message.created_at > message.created_at
+                )
+            )
 
-            db.commit()
-            return True
-        finally:
-            db.close()
+            await self._refresh_counters(db, conversation_id)
+            return message.created_at, await self._invalidate_summary(db, conversation_id, message.id)
+
+        cut_at = await run_write(cut, self.db)
+        if cut_at is None:
+            return False
+        created_at, invalidated = cut_at
+        if invalidated:
+            get_history_cache().evict(conversation_id)
+        else:
+            get_history_cache().remove_after(conversation_id, created_at)
+        return True
 
+    async def _refresh_counters(self, db: AsyncSession, conversation_id: int):
+        """Recompute message_count and last_message_preview after messages change"""
+        in_conversation = Message.conversation_id == conversation_id
+        await db.execute(
+            update(Conversation)
+            .where(Conversation.id == conversation_id)
+            .values(
+                message_count=select(func.count(Message.id)).where(in_conversation).scalar_subquery(),
+                last_message_preview=select(func.substr(Message.content, 1, PREVIEW_CHARS))
+                .where(in_conversation)
+                .order_by(Message.created_at.desc(), Message.id.desc())
+                .limit(1)
+                .scalar_subquery(),
+                # Edits do not reorder the conversation list
+                updated_at=Conversation.updated_at
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+    async def _invalidate_summary(self, db: AsyncSession, conversation_id: int, message_id: int) -> bool:
+        """Drop the rolling summary if it covers a message that was edited or cut"""
+        conversation = await db.get(Conversation, conversation_id)
+        extra_data = (conversation.extra_data if conversation else None) or {}
+        if extra_data.get("summary") and message_id <= extra_data.get("summary_watermark", 0):
+            conversation.extra_data = {
+                k: v for k, v in extra_data.items() if k not in ("summary", "summary_watermark")
+            }
+            return True
+        return False
@@ -0,0 +1,166 @@
+"""
+Conversation Summarizer - Background compaction of long conversations
+"""
+import os
+import asyncio
+from datetime import datetime
+from typing import Optional, List, Set
+from sqlalchemy import select, update, func, or_
+from dotenv import load_dotenv
+from app.database import AsyncSessionLocal, run_write
+from app.models.conversation import Conversation, Message
+from app.services.history_builder import count_tokens
+from app.services.history_cache import get_history_cache
+
+load_dotenv()
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation below so it can stand in for the full transcript in later turns. "
+    "Keep names, facts, decisions, code details, open questions and user preferences. "
+    "Write plain prose, as briefly as the content allows.\n\n"
+    "Summary so far:\n{summary}\n\n"
+    "New messages:\n{transcript}\n\n"
+    "Updated summary:"
+)
+
+
+class ConversationSummarizer:
+    """Folds older turns into Conversation.extra_data['summary'] off the request path"""
+
+    def __init__(self, ai_service):
+        self.ai_service = ai_service
+        self.enabled = os.getenv("SUMMARY_ENABLED", "true").lower() == "true"
+        self.model = os.getenv("SUMMARY_MODEL", "gemini-2.5-flash")
+        self.keep_recent_tokens = int(os.getenv("SUMMARY_KEEP_RECENT_TOKENS", 3000))
+        self.max_input_tokens = int(os.getenv("SUMMARY_MAX_INPUT_TOKENS", 8000))
+        self.in_flight: Set[int] = set()
+        self.tasks: Set[asyncio.Task] = set()
+
+    def schedule(self, conversation_id: int):
+        """Start compacting a conversation in the background unless it already is"""
+        if not self.enabled or conversation_id in self.in_flight:
+            return
+        self.in_flight.add(conversation_id)
+        task = asyncio.get_running_loop().create_task(self._compact(conversation_id))
+        # Hold a reference so the task is not garbage collected mid-run
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _compact(self, conversation_id: int):
+        try:
+            loaded_at = datetime.utcnow()
+            summary, watermark, messages = await self._load(conversation_id)
+            older = self._older_than_recent_window(messages)
+            # Summarize in pieces so a long backlog never becomes one huge prompt
+            for piece in self._pieces(older):
+                new_summary = await self._summarize(summary, piece)
+                if not new_summary:
+                    break
+                if not await self._save(conversation_id, new_summary, watermark, piece, loaded_at):
+                    # Edited, cut or summarized elsewhere meanwhile; the next schedule starts over
+                    break
+                summary = new_summary
+                watermark = piece[-1]["id"]
+        except Exception as e:
+            print(f"Conversation summary failed for {conversation_id}: {e}")
+        finally:
+            self.in_flight.discard(conversation_id)
+
+    async def _load(self, conversation_id: int):
+        async with AsyncSessionLocal() as db:
+            conversation = await db.get(Conversation, conversation_id)
+            if not conversation:
+                return "", 0, []
+            extra_data = conversation.extra_data or {}
+            watermark = extra_data.get("summary_watermark", 0)
+            rows = await db.scalars(
+                select(Message).where(
+                    Message.conversation_id == conversation_id,
+                    Message.id > watermark
+                ).order_by(Message.created_at, Message.id)
+            )
+            messages = [{"id": m.id, "role": m.role, "content": m.content or ""} for m in rows]
+            return extra_data.get("summary", ""), watermark, messages
+
+    def _older_than_recent_window(self, messages: List[dict]) -> List[dict]:
+        """Messages before the newest ones that stay verbatim"""
+        used = 0
+        for index in range(len(messages) - 1, -1, -1):
+            used += count_tokens(messages[index]["content"], "openai")
+            if used > self.keep_recent_tokens:
+                return messages[:index + 1]
+        return []
+
+    def _pieces(self, messages: List[dict]):
+        piece, used = [], 0
+        for message in messages:
+            tokens = count_tokens(message["content"], "openai")
+            if piece and used + tokens > self.max_input_tokens:
+                yield piece
+                piece, used = [], 0
+            piece.append(message)
+            used += tokens
+        if piece:
+            yield piece
+
+    async def _summarize(self, summary: str, messages: List[dict]) -> Optional[str]:
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        prompt = SUMMARY_PROMPT.format(summary=summary or "(none)", transcript=transcript)
+        outcome = {}
+        async for _ in self.ai_service.stream_chat(
+            prompt,
+            model=self.model,
+            history=[],
+            hedge=False,
+            semantic_cache=False,
+            outcome=outcome,
+            priority="batch"
+        ):
+            pass
+        return outcome.get("response", "").strip() if outcome.get("success") else None
+
+    async def _save(
+        self,
+        conversation_id: int,
+        summary: str,
+        expected_watermark: int,
+        piece: List[dict],
+        loaded_at: datetime
+    ) -> bool:
+        """Store a summary extending the one at ``expected_watermark`` with ``piece``.
+
+        Returns False without writing if the stored summary is no longer the one
+        it extends, or a message in ``piece`` was edited or removed since
+        ``loaded_at``.
+        """
+        watermark = piece[-1]["id"]
+        ids = [m["id"] for m in piece]
+
+        async def save(db) -> bool:
+            conversation = await db.get(Conversation, conversation_id)
+            if not conversation:
+                return False
+            extra_data = conversation.extra_data or {}
+            if extra_data.get("summary_watermark", 0) != expected_watermark:
+                return False
+            unchanged = await db.scalar(
+                select(func.count(Message.id)).where(
+                    Message.id.in_(ids),
+                    or_(Message.updated_at.is_(None), Message.updated_at < loaded_at)
+                )
+            )
+            if unchanged != len(ids):
+                return False
+            extra_data = {**extra_data, "summary": summary, "summary_watermark": watermark}
+            # Background compaction must not reorder the conversation list
+            await db.execute(
+                update(Conversation)
+                .where(Conversation.id == conversation_id)
+                .values(extra_data=extra_data, updated_at=Conversation.updated_at)
+            )
+            return True
+
+        if not await run_write(save):
+            return False
+        get_history_cache().set_summary(conversation_id, summary, watermark)
+        return True
@@ -0,0 +1,208 @@
+"""
+Generated Images - Local, content-addressed copies of generated images and a prompt cache
+"""
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+from dotenv import load_dotenv
+from app.services.image_cache import UPLOAD_DIR
+
+load_dotenv()
+
+INDEX_FILE = "index.json"
+
+
+def make_prompt_key(prompt: str, model: str, size: str) -> str:
+    """Hash everything that determines a generated image"""
+    normalized = re.sub(r"\s+", " ", prompt).strip().lower()
+    return hashlib.sha256(json.dumps([model, size, normalized], ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class GeneratedImageStore:
+    """Generated images stored once under IMAGE_GEN_DIR (default ``UPLOAD_DIR/generated``).
+
+    Files are named by the sha256 of their bytes and served from ``/uploads``, so
+    they outlive the provider's expiring URLs. A prompt cache maps (model, size,
+    normalized prompt) to a file for IMAGE_GEN_CACHE_TTL seconds, within a hard
+    budget of IMAGE_GEN_CACHE_MAX_ENTRIES prompts and IMAGE_GEN_CACHE_MAX_MB of
+    files; the least recently used prompts go first. The index is saved next to
+    the files so it survives restarts. At most IMAGE_GEN_MAX_CONCURRENCY
+    generations run at once across all callers.
+    """
+
+    def __init__(self, root: Optional[Path] = None):
+        self.root = Path(root or os.getenv("IMAGE_GEN_DIR", "") or UPLOAD_DIR / "generated")
+        self.ttl = float(os.getenv("IMAGE_GEN_CACHE_TTL", 7 * 24 * 3600))
+        self.max_entries = int(os.getenv("IMAGE_GEN_CACHE_MAX_ENTRIES", 500))
+        self.max_bytes = int(float(os.getenv("IMAGE_GEN_CACHE_MAX_MB", 512)) * 1024 * 1024)
+        self.semaphore = asyncio.Semaphore(int(os.getenv("IMAGE_GEN_MAX_CONCURRENCY", 4)))
+        # prompt key -> {"file", "size", "expires_at"}, least recently used first
+        self.entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self.pending: Dict[str, asyncio.Future] = {}
+        # Index saves run one at a time, each writing the latest entries
+        self.save_lock = asyncio.Lock()
+        self.stats = {"hits": 0, "misses": 0, "joined": 0, "evictions": 0, "expired": 0}
+        self._load_index()
+
+    def _load_index(self):
+        try:
+            saved = json.loads((self.root / INDEX_FILE).read_text())
+        except (FileNotFoundError, ValueError):
+            return
+        now = time.time()
+        for key, entry in saved:
+            if entry["expires_at"] > now and (self.root / entry["file"]).exists():
+                self.entries[key] = entry
+
+    def _save_index(self, entries: List):
+        """Write a snapshot of the entries; runs on a worker thread"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", dir=self.root, prefix=INDEX_FILE, suffix=".tmp", delete=False) as temporary:
+            temporary.write(json.dumps(entries))
+        try:
+            os.replace(temporary.name, self.root / INDEX_FILE)
+        except OSError:
+            os.unlink(temporary.name)
+            raise
+
+    async def save_index(self):
+        async with self.save_lock:
+            # Snapshot on the event loop, which is the only place entries change
+            entries = [(key, dict(entry)) for key, entry in self.entries.items()]
+            await asyncio.to_thread(self._save_index, entries)
+
+    def url_for(self, file: str) -> str:
+        return "/uploads/" + (self.root / file).relative_to(UPLOAD_DIR).as_posix()
+
+    def lookup(self, key: str) -> Optional[str]:
+        """URL cached for a prompt key, if it is still fresh"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry["expires_at"] <= time.time() or not (self.root / entry["file"]).exists():
+            self.stats["expired"] += 1
+            self._remove(key)
+            return None
+        self.entries.move_to_end(key)
+        return self.url_for(entry["file"])
+
+    async def get_or_generate(
+        self,
+        prompt: str,
+        model: str,
+        size: str,
+        generate: Callable[[], Awaitable[bytes]]
+    ) -> str:
+        """Local URL of the image for a prompt, calling ``generate`` only on a miss"""
+        key = make_prompt_key(prompt, model, size)
+        url = self.lookup(key)
+        if url is not None:
+            self.stats["hits"] += 1
+            return url
+
+        # Concurrent requests for the same prompt share one generation
+        future = self.pending.get(key)
+        if future is None:
+            self.stats["misses"] += 1
+            future = asyncio.ensure_future(self._generate(key, generate))
+            self.pending[key] = future
+            future.add_done_callback(lambda _: self.pending.pop(key, None))
+        else:
+            self.stats["joined"] += 1
+        return await asyncio.shield(future)
+
+    async def _generate(self, key: str, generate: Callable[[], Awaitable[bytes]]) -> str:
+        async with self.semaphore:
+            data = await generate()
+        file = await asyncio.to_thread(self._write, data)
+        self.entries[key] = {"file": file, "size": len(data), "expires_at": time.time() + self.ttl}
+        self._evict()
+        try:
+            await self.save_index()
+        except Exception as e:
+            # The image exists; a stale index only costs a regeneration after a restart
+            print(f"Generated image index save failed: {e}")
+        return self.url_for(file)
+
+    def _write(self, data: bytes) -> str:
+        file = hashlib.sha256(data).hexdigest() + _extension(data)
+        target = self.root / file
+        if not target.exists():
+            self.root.mkdir(parents=True, exist_ok=True)
+            # Write then rename so a concurrent reader never sees a partial file
+            with tempfile.NamedTemporaryFile(dir=self.root, prefix=file, suffix=".tmp", delete=False) as temporary:
+                temporary.write(data)
+            os.replace(temporary.name, target)
+        return file
+
+    def _total_bytes(self) -> int:
+        # Identical images from different prompts share one file
+        return sum({entry["file"]: entry["size"] for entry in self.entries.values()}.values())
+
+    def _evict(self):
+        while len(self.entries) > 1 and (len(self.entries) > self.max_entries or self._total_bytes() > self.max_bytes):
+            self._remove(next(iter(self.entries)))
+            self.stats["evictions"] += 1
+
+    def _remove(self, key: str):
+        entry = self.entries.pop(key)
+        if not any(other["file"] == entry["file"] for other in self.entries.values()):
+            try:
+                (self.root / entry["file"]).unlink()
+            except FileNotFoundError:
+                pass
+
+    async def generate_many(
+        self,
+        prompts: List[str],
+        model: str,
+        size: str,
+        make_generate: Callable[[str], Callable[[], Awaitable[bytes]]]
+    ) -> List[Dict]:
+        """Generate every prompt, at most IMAGE_GEN_MAX_CONCURRENCY at a time, reporting each outcome"""
+        async def one(prompt: str) -> Dict:
+            cached = self.lookup(make_prompt_key(prompt, model, size)) is not None
+            try:
+                url = await self.get_or_generate(prompt, model, size, make_generate(prompt))
+                return {"prompt": prompt, "status": "cached" if cached else "generated", "image_url": url}
+            except Exception as e:
+                return {"prompt": prompt, "status": "error", "error": str(e)}
+
+        return await asyncio.gather(*(one(prompt) for prompt in prompts))
+
+    def snapshot(self) -> Dict:
+        return {
+            **self.stats,
+            "entries": len(self.entries),
+            "bytes": self._total_bytes(),
+            "in_progress": len(self.pending),
+            "directory": str(self.root),
+        }
+
+
+def _extension(data: bytes) -> str:
+    if data.startswith(b"\x89PNG"):
+        return ".png"
+    if data.startswith(b"\xff\xd8"):
+        return ".jpg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return ".webp"
+    return ".png"
+
+
+_generated_images: Optional[GeneratedImageStore] = None
+
+
+def get_generated_images() -> GeneratedImageStore:
+    """Return the process-wide generated image store"""
+    global _generated_images
+    if _generated_images is None:
+        _generated_images = GeneratedImageStore()
+    return _generated_images
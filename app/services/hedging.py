@@ -0,0 +1,94 @@
+"""
+Hedging - Race a backup provider against a slow primary for time-to-first-token
+"""
+import os
+import time
+import asyncio
+from typing import AsyncGenerator, Dict, Optional
+
+_DONE = object()
+
+
+class HedgePolicy:
+    """Decides when to start a backup request and counts what hedging costs"""
+
+    def __init__(self):
+        self.enabled = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+        self.percentile = float(os.getenv("HEDGE_PERCENTILE", 0.9))
+        self.min_samples = int(os.getenv("HEDGE_MIN_SAMPLES", 10))
+        self.default_delay = float(os.getenv("HEDGE_DEFAULT_DELAY", 2.0))
+        self.min_delay = float(os.getenv("HEDGE_MIN_DELAY", 0.3))
+        self.max_delay = float(os.getenv("HEDGE_MAX_DELAY", 10.0))
+        self.stats = {
+            "requests": 0,  # Requests eligible for hedging
+            "hedged": 0,  # Backup requests started
+            "backup_wins": 0,  # Backup produced the first chunk
+            "primary_wins": 0,  # Primary still won after the backup started
+            "cancelled_streams": 0,  # Upstream streams started and then thrown away
+            "wasted_chunks": 0,  # Chunks the cancelled stream had already produced
+        }
+
+    def deadline(self, ttft_samples) -> float:
+        """Time to wait for the primary's first chunk before hedging"""
+        if len(ttft_samples) < self.min_samples:
+            return self.default_delay
+        ordered = sorted(ttft_samples)
+        index = min(len(ordered) - 1, int(self.percentile * len(ordered)))
+        return min(self.max_delay, max(self.min_delay, ordered[index]))
+
+    def snapshot(self) -> Dict:
+        stats = dict(self.stats)
+        stats["hedge_rate"] = stats["hedged"] / stats["requests"] if stats["requests"] else 0.0
+        return stats
+
+
+class StreamPump:
+    """Drains a provider stream in its own task so it can be raced and cancelled"""
+
+    def __init__(self, provider: str, model_name: str, stream: AsyncGenerator[str, None]):
+        self.provider = provider
+        self.model_name = model_name
+        self.started = time.monotonic()
+        self.first_chunk_latency: Optional[float] = None
+        self.chunks = 0
+        self.error: Optional[Exception] = None
+        self.ready = asyncio.Event()  # Set once there is a first chunk, an end, or an error
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=int(os.getenv("HEDGE_STREAM_BUFFER", 64)))
+        self.task = asyncio.create_task(self._run(stream))
+
+    async def _run(self, stream: AsyncGenerator[str, None]):
+        try:
+            async for chunk in stream:
+                if self.first_chunk_latency is None:
+                    self.first_chunk_latency = time.monotonic() - self.started
+                self.chunks += 1
+                await self.queue.put((chunk, None))
+                self.ready.set()
+            await self.queue.put((_DONE, None))
+        except Exception as e:
+            self.error = e
+            await self.queue.put((_DONE, e))
+        finally:
+            self.ready.set()
+            await stream.aclose()
+
+    def failed_early(self) -> Optional[Exception]:
+        """The error raised before any chunk arrived, if that is how the stream ended"""
+        return self.error if not self.chunks else None
+
+    async def chunks_iter(self) -> AsyncGenerator[str, None]:
+        """Yield the stream's chunks, raising its error if it failed"""
+        while True:
+            item, error = await self.queue.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+
+    async def cancel(self):
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
@@ -0,0 +1,200 @@
+"""
+History Builder - Token-budgeted conversation history
+"""
+import os
+import math
+from typing import Optional, Dict, List, Iterable, AsyncIterable, AsyncIterator
+from sqlalchemy import or_, and_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from dotenv import load_dotenv
+from app.database import run_write, session_scope
+from app.models.conversation import Conversation, Message
+from app.services.history_cache import HistoryCache
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+load_dotenv()
+
+# Role markers and separators each message adds on top of its text
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# OpenAI/Groq tokenizer; None until loaded, or for good if it cannot be loaded
+_encoding = None
+_encoding_attempted = False
+
+
+def load_token_encoding():
+    """Load the cl100k_base tokenizer once (at startup, off the event loop).
+
+    The first load may download its BPE file; if that fails, token counts
+    fall back to the character estimate instead of failing requests.
+    """
+    global _encoding, _encoding_attempted
+    if _encoding_attempted:
+        return _encoding
+    _encoding_attempted = True
+    if TIKTOKEN_AVAILABLE:
+        try:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            print(f"Tokenizer unavailable, estimating token counts: {e}")
+    return _encoding
+
+
+def count_tokens(text: str, provider: str) -> int:
+    """Count the tokens a provider will bill for a piece of text"""
+    if not text:
+        return 0
+    # Never loads the tokenizer itself; that can block on a download
+    if provider in ("openai", "groq") and _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    # Without the provider's tokenizer, about four characters per token is close enough for budgeting
+    return math.ceil(len(text) / 4)
+
+
+class HistoryBuilder:
+    """Builds the newest-first slice of a conversation that fits a token budget.
+
+    When a conversation has a rolling summary, only messages after its watermark are
+    loaded and the summary goes first. Overflowing the budget schedules the summarizer.
+    Recent windows are served from the history cache when it holds enough of them.
+    """
+
+    def __init__(self, summarizer=None, cache: Optional[HistoryCache] = None):
+        self.summarizer = summarizer
+        self.cache = cache
+        self.budget = int(os.getenv("HISTORY_TOKEN_BUDGET", 6000))
+        self.min_messages = int(os.getenv("HISTORY_MIN_MESSAGES", 4))
+        self.batch_size = int(os.getenv("HISTORY_BATCH_SIZE", 50))
+
+    def message_tokens(self, message: Dict, provider: str, pending: Dict[int, Dict]) -> int:
+        """Token count for a stored message, cached in its metadata.
+
+        Newly computed counts update the message dict and are added to ``pending``
+        so they can be written back to the database.
+        """
+        counts = (message["meta_data"] or {}).get("token_counts", {})
+        if provider in counts:
+            return counts[provider]
+        tokens = count_tokens(message["content"] or "", provider) + MESSAGE_OVERHEAD_TOKENS
+        message["meta_data"] = {**(message["meta_data"] or {}), "token_counts": {**counts, provider: tokens}}
+        pending[message["id"]] = message["meta_data"]
+        return tokens
+
+    async def _save_token_counts(self, db, pending: Dict[int, Dict]):
+        async def save(session):
+            for message_id, meta_data in pending.items():
+                # Keep updated_at as is; caching a count is not an edit
+                await session.execute(
+                    update(Message)
+                    .where(Message.id == message_id)
+                    .values(meta_data=meta_data, updated_at=Message.updated_at)
+                )
+
+        await run_write(save, db)
+
+    async def _db_messages(self, db, conversation_id: int, watermark: int) -> AsyncIterator[Dict]:
+        """Messages after the watermark, newest first, loaded a batch at a time"""
+        cursor = None
+        while True:
+            query = select(Message).where(
+                Message.conversation_id == conversation_id,
+                Message.id > watermark
+            )
+            if cursor is not None:
+                query = query.where(or_(
+                    Message.created_at < cursor.created_at,
+                    and_(Message.created_at == cursor.created_at, Message.id < cursor.id)
+                ))
+            rows = (await db.scalars(
+                query.order_by(Message.created_at.desc(), Message.id.desc()).limit(self.batch_size)
+            )).all()
+            for row in rows:
+                yield {
+                    "id": row.id,
+                    "role": row.role,
+                    "content": row.content,
+                    "created_at": row.created_at,
+                    "meta_data": row.meta_data or {},
+                }
+            if len(rows) < self.batch_size:
+                return
+            cursor = rows[-1]
+
+    async def _select(self, newest_first: AsyncIterable[Dict], provider: str, budget: int, pending: Dict[int, Dict]):
+        """Take messages until the budget is spent.
+
+        Also returns the first message that no longer fit, or None if the budget
+        never ran out.
+        """
+        selected = []
+        used = 0
+        async for message in newest_first:
+            tokens = self.message_tokens(message, provider, pending)
+            # The latest turns are always kept, even past the budget
+            if len(selected) >= self.min_messages and used + tokens > budget:
+                return selected, message
+            selected.append(message)
+            used += tokens
+        return selected, None
+
+    async def build(
+        self,
+        conversation_id: int,
+        provider: str,
+        system_prompt: Optional[str] = None,
+        message: Optional[str] = None,
+        db: Optional[AsyncSession] = None
+    ) -> List[Dict]:
+        """Load only as many recent messages as fit the budget, oldest first.
+
+        Reads use the caller's session, or one opened here when none is given.
+        """
+        budget = self.budget - count_tokens(system_prompt or "", provider) - count_tokens(message or "", provider)
+        pending = {}
+        selected = None
+
+        entry = self.cache.get(conversation_id) if self.cache is not None else None
+        if entry is not None:
+            summary = entry["summary"]
+            summary_budget = budget - (count_tokens(summary, provider) + MESSAGE_OVERHEAD_TOKENS if summary else 0)
+            selected, overflow = await self._select(
+                _iterate(reversed(entry["messages"])), provider, summary_budget, pending
+            )
+            if overflow is None and not entry["complete"]:
+                # The cached window is shorter than the budget allows
+                self.cache.stats["partial_misses"] += 1
+                selected = None
+
+        if selected is None:
+            async with session_scope(db) as session:
+                conversation = await session.get(Conversation, conversation_id)
+                extra_data = (conversation.extra_data if conversation else None) or {}
+                summary = extra_data.get("summary")
+                watermark = extra_data.get("summary_watermark", 0) if summary else 0
+                summary_budget = budget - (count_tokens(summary, provider) + MESSAGE_OVERHEAD_TOKENS if summary else 0)
+                selected, overflow = await self._select(
+                    self._db_messages(session, conversation_id, watermark), provider, summary_budget, pending
+                )
+            if self.cache is not None:
+                # Keep the message that overflowed so a cache hit can tell the budget ran out
+                window = selected + [overflow] if overflow is not None else selected
+                self.cache.put(conversation_id, summary, watermark, window[::-1], complete=overflow is None)
+
+        history = [{"role": m["role"], "content": m["content"]} for m in reversed(selected)]
+        if summary:
+            history.insert(0, {"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+        if pending:
+            await self._save_token_counts(db, pending)
+        if overflow is not None and self.summarizer is not None:
+            # Older turns were dropped; fold them into the summary for next time
+            self.summarizer.schedule(conversation_id)
+        return history
+
+
+async def _iterate(messages: Iterable[Dict]) -> AsyncIterator[Dict]:
+    for message in messages:
+        yield message
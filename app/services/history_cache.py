@@ -0,0 +1,147 @@
+"""
+History Cache - Recent conversation windows kept in memory with write-through updates
+"""
+import os
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Dict, List
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class HistoryCache:
+    """Bounded LRU of each active conversation's most recent messages.
+
+    An entry holds the conversation's rolling summary, its watermark, and the newest
+    messages after the watermark, oldest first. ``complete`` means no older message
+    after the watermark is missing. ConversationService writes through on every change
+    so active conversations never need a history read. The cache is per process.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("HISTORY_CACHE_ENABLED", "true").lower() == "true"
+        self.max_conversations = int(os.getenv("HISTORY_CACHE_MAX_CONVERSATIONS", 1000))
+        self.max_messages = int(os.getenv("HISTORY_CACHE_MAX_MESSAGES", 200))
+        self.max_chars = int(os.getenv("HISTORY_CACHE_MAX_CHARS", 50_000_000))
+        self.entries: "OrderedDict[int, Dict]" = OrderedDict()
+        self.chars = 0
+        self.stats = {"hits": 0, "misses": 0, "partial_misses": 0, "evictions": 0}
+
+    def get(self, conversation_id: int) -> Optional[Dict]:
+        if not self.enabled:
+            return None
+        entry = self.entries.get(conversation_id)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        self.entries.move_to_end(conversation_id)
+        self.stats["hits"] += 1
+        return entry
+
+    def put(
+        self,
+        conversation_id: int,
+        summary: Optional[str],
+        watermark: int,
+        messages: List[Dict],
+        complete: bool
+    ):
+        """Cache a freshly loaded window, oldest message first"""
+        if not self.enabled:
+            return
+        self.evict(conversation_id)
+        entry = {"summary": summary, "watermark": watermark, "messages": [], "complete": complete, "chars": 0}
+        self.entries[conversation_id] = entry
+        for message in messages:
+            self._add(entry, message)
+        self._trim(entry)
+        self._enforce_limits()
+
+    def append(self, conversation_id: int, message: Dict):
+        """Write-through for a newly saved message"""
+        entry = self.entries.get(conversation_id)
+        if entry is None:
+            return
+        self._add(entry, message)
+        self._trim(entry)
+        self._enforce_limits()
+
+    def update_content(self, conversation_id: int, message_id: int, content: str):
+        """Write-through for an edited message"""
+        entry = self.entries.get(conversation_id)
+        if entry is None:
+            return
+        for message in entry["messages"]:
+            if message["id"] == message_id:
+                self._resize(entry, len(content or "") - len(message["content"] or ""))
+                message["content"] = content
+                # Token counts describe the old text
+                message["meta_data"] = {k: v for k, v in (message["meta_data"] or {}).items() if k != "token_counts"}
+                return
+
+    def remove_after(self, conversation_id: int, created_at: datetime):
+        """Write-through for messages deleted after a point in the conversation"""
+        entry = self.entries.get(conversation_id)
+        if entry is None:
+            return
+        kept = [m for m in entry["messages"] if m["created_at"] <= created_at]
+        self._resize(entry, -sum(len(m["content"] or "") for m in entry["messages"] if m["created_at"] > created_at))
+        entry["messages"] = kept
+
+    def set_summary(self, conversation_id: int, summary: str, watermark: int):
+        """Write-through for a new rolling summary; summarized messages leave the window"""
+        entry = self.entries.get(conversation_id)
+        if entry is None:
+            return
+        dropped = [m for m in entry["messages"] if m["id"] <= watermark]
+        self._resize(entry, -sum(len(m["content"] or "") for m in dropped))
+        entry["messages"] = [m for m in entry["messages"] if m["id"] > watermark]
+        entry["summary"] = summary
+        entry["watermark"] = watermark
+
+    def evict(self, conversation_id: int):
+        entry = self.entries.pop(conversation_id, None)
+        if entry is not None:
+            self.chars -= entry["chars"]
+
+    def _add(self, entry: Dict, message: Dict):
+        entry["messages"].append(message)
+        self._resize(entry, len(message["content"] or ""))
+
+    def _resize(self, entry: Dict, delta: int):
+        entry["chars"] += delta
+        self.chars += delta
+
+    def _trim(self, entry: Dict):
+        excess = len(entry["messages"]) - self.max_messages
+        if excess > 0:
+            self._resize(entry, -sum(len(m["content"] or "") for m in entry["messages"][:excess]))
+            entry["messages"] = entry["messages"][excess:]
+            entry["complete"] = False
+
+    def _enforce_limits(self):
+        while self.entries and (len(self.entries) > self.max_conversations or self.chars > self.max_chars):
+            oldest = next(iter(self.entries))
+            self.evict(oldest)
+            self.stats["evictions"] += 1
+
+    def snapshot(self) -> Dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "conversations": len(self.entries),
+            "chars": self.chars,
+            "hit_rate": (self.stats["hits"] - self.stats["partial_misses"]) / lookups if lookups else 0.0,
+        }
+
+
+_history_cache: Optional[HistoryCache] = None
+
+
+def get_history_cache() -> HistoryCache:
+    """Return the process-wide history cache"""
+    global _history_cache
+    if _history_cache is None:
+        _history_cache = HistoryCache()
+    return _history_cache
@@ -0,0 +1,132 @@
+"""
+Image Cache - Downscaled, re-encoded copies of uploaded images for vision requests
+"""
+import os
+import asyncio
+import hashlib
+import mimetypes
+from pathlib import Path
+from typing import Optional, Dict, Tuple
+from dotenv import load_dotenv
+try:
+    from PIL import Image, ImageOps
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+load_dotenv()
+
+UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", "./uploads"))
+
+# Longest edge, in pixels, beyond which a provider gains nothing from extra resolution
+MAX_EDGES = {
+    "gemini": int(os.getenv("IMAGE_MAX_EDGE_GEMINI", 1536)),
+    "openai": int(os.getenv("IMAGE_MAX_EDGE_OPENAI", 2048)),
+    "anthropic": int(os.getenv("IMAGE_MAX_EDGE_ANTHROPIC", 1568)),
+}
+DEFAULT_MAX_EDGE = 1536
+
+
+def attachment_path(attachment: Dict) -> Optional[Path]:
+    """Local file behind an uploaded attachment"""
+    url = attachment.get("url", "")
+    if url.startswith("/uploads/"):
+        return UPLOAD_DIR / url.replace("/uploads/", "")
+    if attachment.get("path"):
+        return Path(attachment["path"])
+    return None
+
+
+class ImageCache:
+    """Derivatives keyed by the source file's content hash and the target provider.
+
+    Each upload is decoded, EXIF-rotated, shrunk to the provider's useful resolution
+    and re-encoded once, on a worker thread; later turns reuse the file on disk.
+    Derivatives live under IMAGE_DERIVATIVE_DIR (default ``UPLOAD_DIR/derived``).
+    """
+
+    def __init__(self, root: Optional[Path] = None):
+        self.root = Path(root or os.getenv("IMAGE_DERIVATIVE_DIR", "") or UPLOAD_DIR / "derived")
+        self.jpeg_quality = int(os.getenv("IMAGE_JPEG_QUALITY", 85))
+        # (path, size, mtime) -> sha256, so unchanged files are not re-read to be hashed
+        self.digests: Dict[Tuple[str, int, int], str] = {}
+        self.pending: Dict[str, asyncio.Future] = {}
+        self.stats = {"hits": 0, "misses": 0, "passthrough": 0}
+
+    def digest(self, path: Path) -> str:
+        """sha256 of a file's contents, remembered while its size and mtime are unchanged"""
+        stat = path.stat()
+        key = (str(path), stat.st_size, stat.st_mtime_ns)
+        digest = self.digests.get(key)
+        if digest is None:
+            sha = hashlib.sha256()
+            with open(path, "rb") as source:
+                for block in iter(lambda: source.read(1 << 20), b""):
+                    sha.update(block)
+            digest = sha.hexdigest()
+            if len(self.digests) > 10000:
+                self.digests.clear()
+            self.digests[key] = digest
+        return digest
+
+    async def load(self, path: Path, provider: str) -> Tuple[bytes, str]:
+        """Bytes and MIME type of the image to send to ``provider``"""
+        derived = await self.derive(path, provider)
+        return await asyncio.to_thread(derived.read_bytes), mimetypes.guess_type(derived.name)[0] or "image/jpeg"
+
+    async def derive(self, path: Path, provider: str) -> Path:
+        """Path of the provider-sized copy of ``path``, creating it if needed"""
+        if not PIL_AVAILABLE:
+            self.stats["passthrough"] += 1
+            return path
+        digest = await asyncio.to_thread(self.digest, path)
+        max_edge = MAX_EDGES.get(provider, DEFAULT_MAX_EDGE)
+        stem = f"{digest}-{max_edge}"
+        for suffix in (".jpg", ".png"):
+            candidate = self.root / (stem + suffix)
+            if candidate.exists():
+                self.stats["hits"] += 1
+                return candidate
+
+        # Concurrent turns with the same image share one conversion
+        future = self.pending.get(stem)
+        if future is None:
+            self.stats["misses"] += 1
+            future = asyncio.ensure_future(asyncio.to_thread(self._convert, path, stem, max_edge))
+            self.pending[stem] = future
+            future.add_done_callback(lambda _: self.pending.pop(stem, None))
+        return await asyncio.shield(future)
+
+    def _convert(self, path: Path, stem: str, max_edge: int) -> Path:
+        self.root.mkdir(parents=True, exist_ok=True)
+        with Image.open(path) as source:
+            image = ImageOps.exif_transpose(source)
+            image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+            if has_alpha:
+                target = self.root / (stem + ".png")
+                image = image.convert("RGBA")
+                save_args = {"format": "PNG", "optimize": True}
+            else:
+                target = self.root / (stem + ".jpg")
+                image = image.convert("RGB")
+                save_args = {"format": "JPEG", "quality": self.jpeg_quality, "optimize": True, "progressive": True}
+            # Write then rename so a concurrent reader never sees a partial file
+            temporary = target.with_name(target.name + f".{os.getpid()}.tmp")
+            image.save(temporary, **save_args)
+            os.replace(temporary, target)
+        return target
+
+    def snapshot(self) -> Dict:
+        return {**self.stats, "pillow": PIL_AVAILABLE, "directory": str(self.root)}
+
+
+_image_cache: Optional[ImageCache] = None
+
+
+def get_image_cache() -> ImageCache:
+    """Return the process-wide image derivative cache"""
+    global _image_cache
+    if _image_cache is None:
+        _image_cache = ImageCache()
+    return _image_cache
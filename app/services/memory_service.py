@@ -2,14 +2,20 @@
 Memory Service - Long-term memory management
 """
 from typing import List, Dict, Optional
-from app.database import SessionLocal
+from app.database import session_scope, run_write
 from app.models.memory import Memory
-from sqlalchemy import or_
+from app.services.metrics import DB_OPERATION_SECONDS
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 
 class MemoryService:
     """Service for managing AI agent memory"""
-    
+
+    def __init__(self, db: Optional[AsyncSession] = None):
+        self.db = db
+
+    @DB_OPERATION_SECONDS.time("memory", "create_memory")
     async def create_memory(
         self,
         key: str,
@@ -18,8 +24,7 @@ class MemoryService:
         user_id: Optional[int] = None
     ) -> Dict:
         """Create a new memory"""
-        db = SessionLocal()
-        try:
+        async def create(db: AsyncSession) -> Dict:
             memory = Memory(
                 key=key,
                 value=value,
@@ -27,17 +32,17 @@ class MemoryService:
                 user_id=user_id
             )
             db.add(memory)
-            db.commit()
-            db.refresh(memory)
+            await db.flush()
             return {
                 "id": memory.id,
                 "key": memory.key,
                 "value": memory.value,
                 "importance": memory.importance
             }
-        finally:
-            db.close()
+
+        return await run_write(create, self.db)
     
+    @DB_OPERATION_SECONDS.time("memory", "search_memories")
     async def search_memories(
         self,
         query: str,
@@ -45,20 +50,19 @@ class MemoryService:
         user_id: Optional[int] = None
     ) -> List[Dict]:
         """Search memories by query"""
-        db = SessionLocal()
-        try:
-            memories = db.query(Memory).filter(
+        async with session_scope(self.db) as db:
+            statement = select(Memory).where(
                 or_(
                     Memory.key.contains(query),
                     Memory.value.contains(query)
                 )
             )
-            
+
             if user_id:
-                memories = memories.filter(Memory.user_id == user_id)
-            
-            memories = memories.order_by(Memory.importance.desc()).limit(limit).all()
-            
+                statement = statement.where(Memory.user_id == user_id)
+
+            memories = await db.scalars(statement.order_by(Memory.importance.desc()).limit(limit))
+
             return [
                 {
                     "id": m.id,
@@ -68,14 +72,12 @@ class MemoryService:
                 }
                 for m in memories
             ]
-        finally:
-            db.close()
     
+    @DB_OPERATION_SECONDS.time("memory", "get_memory")
     async def get_memory(self, memory_id: int) -> Optional[Dict]:
         """Get specific memory"""
-        db = SessionLocal()
-        try:
-            memory = db.query(Memory).filter(Memory.id == memory_id).first()
+        async with session_scope(self.db) as db:
+            memory = await db.get(Memory, memory_id)
             if memory:
                 return {
                     "id": memory.id,
@@ -84,6 +86,4 @@ class MemoryService:
                     "importance": memory.importance
                 }
             return None
-        finally:
-            db.close()
 
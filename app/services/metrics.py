@@ -0,0 +1,235 @@
+"""
+Metrics - Counters, gauges and histograms rendered in the Prometheus text format
+"""
+import time
+import asyncio
+import functools
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Seconds; covers fast cache hits through slow provider streams
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_metrics: List["_Metric"] = []
+_collectors: List[Callable[[], Iterable[Tuple]]] = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Tuple, object] = {}
+        _metrics.append(self)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        # Copy first; other code may add a label set while this renders
+        for labels, value in list(self.values.items()):
+            lines.extend(self._render_one(labels, value))
+        return lines
+
+    def _render_one(self, labels: Tuple, value) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    """Monotonic count per label set.
+
+    Updates are plain dict arithmetic on the event loop thread, so recording
+    costs a dict lookup and no locking.
+    """
+
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    """Current value per label set"""
+
+    kind = "gauge"
+
+    def set(self, value: float, *labels):
+        self.values[labels] = value
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+
+class _Series:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size: int):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(_Metric):
+    """Bucketed distribution per label set.
+
+    ``observe`` finds the bucket with a binary search and bumps one slot; the
+    cumulative counts Prometheus expects are only computed when rendering.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = _Series(len(self.buckets) + 1)
+        series.counts[bisect_left(self.buckets, value)] += 1
+        series.sum += value
+        series.count += 1
+
+    def time(self, *labels) -> "_Timer":
+        """Time a block (``with``) or every call of a function (decorator)"""
+        return _Timer(self, labels)
+
+    def _render_one(self, labels: Tuple, series: _Series) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), series.counts):
+            cumulative += count
+            label_text = _format_labels(self.labelnames, labels, f'le="{_format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{label_text} {cumulative}")
+        label_text = _format_labels(self.labelnames, labels)
+        lines.append(f"{self.name}_sum{label_text} {_format_value(series.sum)}")
+        lines.append(f"{self.name}_count{label_text} {series.count}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Tuple):
+        self.histogram = histogram
+        self.labels = labels
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+        return False
+
+    def __call__(self, func: Callable) -> Callable:
+        histogram, labels = self.histogram, self.labels
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - started, *labels)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, *labels)
+        return wrapper
+
+
+def register_collector(collector: Callable[[], Iterable[Tuple]]):
+    """Add a callable that yields (name, kind, help, labels dict, value) at scrape time.
+
+    Used to export numbers other components already keep, such as cache and
+    breaker snapshots, without double bookkeeping on the hot path.
+    """
+    _collectors.append(collector)
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+
+    families: Dict[str, Tuple[str, str, List[str]]] = {}
+    for collector in _collectors:
+        try:
+            samples = list(collector())
+        except Exception as e:
+            print(f"Metrics collector failed: {e}")
+            continue
+        for name, kind, help, labels, value in samples:
+            if value is None:
+                continue
+            _, _, family = families.setdefault(name, (kind, help, []))
+            names = tuple(labels)
+            family.append(f"{name}{_format_labels(names, tuple(labels[n] for n in names))} {_format_value(value)}")
+    for name, (kind, help, family) in families.items():
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(family)
+    return "\n".join(lines) + "\n"
+
+
+# Provider streams (recorded by AIService)
+PROVIDER_TTFT_SECONDS = Histogram(
+    "ai_provider_ttft_seconds", "Time from sending a provider request to its first chunk", ("provider",)
+)
+PROVIDER_STREAM_SECONDS = Histogram(
+    "ai_provider_stream_duration_seconds", "Total duration of provider streams", ("provider",)
+)
+PROVIDER_OUTPUT_TOKENS = Counter(
+    "ai_provider_output_tokens_total", "Tokens streamed back by providers", ("provider",)
+)
+PROVIDER_REQUESTS = Counter(
+    "ai_provider_requests_total", "Provider streams by how they ended", ("provider", "outcome")
+)
+PROVIDER_ERRORS = Counter(
+    "ai_provider_errors_total", "Provider errors by class", ("provider", "kind")
+)
+SCHEDULER_WAIT_SECONDS = Histogram(
+    "ai_scheduler_queue_wait_seconds", "Time calls waited for a provider slot", ("provider",)
+)
+
+# WebSockets (recorded by WebSocketManager and StreamWriter)
+WS_CONNECTIONS = Gauge("ws_connections", "Open WebSocket connections")
+WS_STREAMS_IN_FLIGHT = Gauge("ws_streams_in_flight", "WebSocket responses currently streaming")
+WS_SEND_SECONDS = Histogram(
+    "ws_send_seconds", "Time to send one WebSocket frame",
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+)
+
+# Database and tools
+DB_OPERATION_SECONDS = Histogram(
+    "db_operation_seconds", "Latency of persistence operations", ("service", "operation")
+)
+TOOL_EXECUTION_SECONDS = Histogram(
+    "tool_execution_seconds", "Time spent running tools", ("tool",)
+)
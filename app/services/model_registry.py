@@ -0,0 +1,201 @@
+"""
+Model Registry - Available models, their capabilities and cached model handles
+"""
+import os
+import asyncio
+from typing import Optional, Dict, List
+from dotenv import load_dotenv
+try:
+    import google.generativeai as genai
+    GOOGLE_AVAILABLE = True
+except ImportError:
+    GOOGLE_AVAILABLE = False
+
+load_dotenv()
+
+# Known capabilities by model-name prefix, longest prefix wins:
+# (provider, vision, tools, context length)
+CAPABILITIES = {
+    "gpt-4o": ("openai", True, True, 128000),
+    "gpt-4-turbo": ("openai", True, True, 128000),
+    "gpt-4.1": ("openai", True, True, 1000000),
+    "gpt-4": ("openai", False, True, 8192),
+    "gpt-3.5-turbo": ("openai", False, True, 16385),
+    "o1": ("openai", True, True, 200000),
+    "o3": ("openai", True, True, 200000),
+    "o4": ("openai", True, True, 200000),
+    "claude-3": ("anthropic", True, True, 200000),
+    "claude-": ("anthropic", True, True, 200000),
+    "gemini-pro-vision": ("gemini", True, False, 12288),
+    "gemini-1.0": ("gemini", False, True, 30720),
+    "gemini-pro": ("gemini", False, True, 30720),
+    "gemini-1.5": ("gemini", True, True, 1000000),
+    "gemini-2": ("gemini", True, True, 1000000),
+    "gemini-flash": ("gemini", True, True, 1000000),
+    "gemini-": ("gemini", True, True, 1000000),
+    "llama": ("groq", False, True, 8192),
+    "mixtral": ("groq", False, True, 32768),
+}
+
+# Gemini models to use when the request does not name one, in order of preference
+GEMINI_PREFERENCE = ["gemini-2.5-flash", "gemini-flash-latest", "gemini-1.5-flash-latest", "gemini-pro-latest"]
+
+
+class ModelInfo:
+    """What a model can do"""
+
+    __slots__ = ("name", "provider", "vision", "tools", "streaming", "context_length")
+
+    def __init__(self, name: str, provider: Optional[str], vision: bool, tools: bool, context_length: int, streaming: bool = True):
+        self.name = name
+        self.provider = provider
+        self.vision = vision
+        self.tools = tools
+        self.streaming = streaming
+        self.context_length = context_length
+
+    def to_dict(self) -> Dict:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+def describe(name: str, context_length: Optional[int] = None) -> ModelInfo:
+    """Capabilities of a model from the prefix table"""
+    short = name.split("/")[-1]
+    prefix = max((p for p in CAPABILITIES if short.startswith(p)), key=len, default=None)
+    if prefix is None:
+        return ModelInfo(short, None, False, False, context_length or 8192)
+    provider, vision, tools, default_context = CAPABILITIES[prefix]
+    return ModelInfo(short, provider, vision, tools, context_length or default_context)
+
+
+class ModelRegistry:
+    """Resolves which models each configured provider offers, once and then on a timer.
+
+    Lookups never call a provider: they read the table built by the last refresh.
+    Until the first refresh succeeds, or for providers that cannot list models, the
+    preferred models are assumed available. Gemini model handles are created once
+    per name and reused by every request.
+    """
+
+    def __init__(self, provider_registry):
+        self.providers = provider_registry
+        self.refresh_interval = float(os.getenv("MODEL_REGISTRY_REFRESH", 3600))
+        # Listing is retried by the next refresh, so each call fails fast instead of retrying
+        self.list_timeout = float(os.getenv("MODEL_REGISTRY_LIST_TIMEOUT", 10))
+        self.models: Dict[str, ModelInfo] = {}
+        self.listed: Dict[str, bool] = {}
+        self.gemini_handles: Dict[str, object] = {}
+        self.refresh_task: Optional[asyncio.Task] = None
+        self.last_refresh: Optional[float] = None
+
+    def info(self, model: str) -> ModelInfo:
+        """Capabilities of a model, discovered or from the prefix table"""
+        return self.models.get(model) or describe(model)
+
+    def is_available(self, provider: str, model: str) -> bool:
+        if not self.listed.get(provider):
+            # Without a listing, trust the caller's choice
+            return True
+        return model in self.models
+
+    def preferred(self, provider: str, vision: bool = False) -> Optional[str]:
+        """Best available model for a provider, optionally one that reads images"""
+        if provider != "gemini":
+            return None
+        for name in GEMINI_PREFERENCE:
+            if self.is_available("gemini", name) and (not vision or self.info(name).vision):
+                return name
+        candidates = [m for m in self.models.values() if m.provider == "gemini" and (not vision or m.vision)]
+        return candidates[0].name if candidates else None
+
+    def gemini_model(self, name: Optional[str] = None):
+        """Cached GenerativeModel for ``name``, or for the preferred Gemini model"""
+        if not GOOGLE_AVAILABLE:
+            return None
+        name = name or self.preferred("gemini") or GEMINI_PREFERENCE[0]
+        handle = self.gemini_handles.get(name)
+        if handle is None:
+            handle = self.gemini_handles[name] = genai.GenerativeModel(name)
+        return handle
+
+    async def refresh(self):
+        """Re-list each configured provider's models; keep the old table on failure"""
+        models: Dict[str, ModelInfo] = {}
+        listed: Dict[str, bool] = {}
+
+        if self.providers.gemini_model is not None:
+            try:
+                for model in await asyncio.to_thread(self._list_gemini):
+                    methods = getattr(model, "supported_generation_methods", None) or []
+                    if "generateContent" in methods:
+                        info = describe(model.name, getattr(model, "input_token_limit", None))
+                        info.provider = "gemini"
+                        models[info.name] = info
+                listed["gemini"] = True
+            except Exception as e:
+                print(f"Model listing failed for gemini: {e}")
+
+        for provider, client in (("openai", self.providers.openai_client), ("groq", self.providers.groq_client)):
+            if client is None:
+                continue
+            try:
+                async for model in client.with_options(max_retries=0, timeout=self.list_timeout).models.list():
+                    info = describe(model.id)
+                    # OpenAI also lists embedding, image and audio models; Groq serves chat models only
+                    if info.provider == provider or (provider == "groq" and info.provider is None):
+                        info.provider = provider
+                        models[info.name] = info
+                listed[provider] = True
+            except Exception as e:
+                print(f"Model listing failed for {provider}: {e}")
+
+        anthropic_client = self.providers.anthropic_client
+        if anthropic_client is not None and hasattr(anthropic_client, "models"):
+            try:
+                async for model in anthropic_client.with_options(max_retries=0, timeout=self.list_timeout).models.list():
+                    models[model.id] = describe(model.id)
+                listed["anthropic"] = True
+            except Exception as e:
+                print(f"Model listing failed for anthropic: {e}")
+
+        # Providers that failed to list keep what the previous refresh found
+        for name, info in self.models.items():
+            if not listed.get(info.provider) and name not in models:
+                models[name] = info
+        for provider, ok in self.listed.items():
+            listed[provider] = listed.get(provider) or ok
+
+        self.models = models
+        self.listed = listed
+        self.last_refresh = asyncio.get_running_loop().time()
+
+    def _list_gemini(self) -> List:
+        return list(genai.list_models(request_options={"timeout": self.list_timeout, "retry": None}))
+
+    def start(self):
+        """Refresh every MODEL_REGISTRY_REFRESH seconds from now on"""
+        if self.refresh_task is None and self.refresh_interval > 0:
+            self.refresh_task = asyncio.get_running_loop().create_task(self._refresh_loop())
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Model registry refresh failed: {e}")
+
+    async def stop(self):
+        if self.refresh_task is not None:
+            self.refresh_task.cancel()
+            try:
+                await self.refresh_task
+            except asyncio.CancelledError:
+                pass
+            self.refresh_task = None
+
+    def snapshot(self) -> Dict:
+        return {
+            "listed": self.listed,
+            "models": {name: info.to_dict() for name, info in sorted(self.models.items())},
+        }
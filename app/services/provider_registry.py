@@ -0,0 +1,160 @@
+"""
+Provider Registry - App-lifetime AI provider clients with pooled connections
+"""
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any
+import httpx
+import openai
+import anthropic
+from openai import AsyncOpenAI
+from anthropic import AsyncAnthropic
+try:
+    import google.generativeai as genai
+    GOOGLE_AVAILABLE = True
+except ImportError:
+    GOOGLE_AVAILABLE = False
+from dotenv import load_dotenv
+from app.services.provider_router import ProviderRouter
+from app.services.hedging import HedgePolicy
+from app.services.provider_scheduler import ProviderScheduler, make_scheduler
+from app.services.model_registry import ModelRegistry
+
+load_dotenv()
+
+GROQ_BASE_URL = "https://api.groq.com/openai/v1"
+
+
+def _base_url(provider: str) -> Optional[str]:
+    """Optional endpoint override, e.g. OPENAI_BASE_URL pointing at a local fake provider"""
+    return os.getenv(f"{provider.upper()}_BASE_URL") or None
+
+
+def _make_http_client(sdk) -> Any:
+    """Create a keep-alive HTTP pool sized from the environment for the given SDK"""
+    client_cls = getattr(sdk, "DefaultAsyncHttpxClient", httpx.AsyncClient)
+    # Newer SDK releases are built on their own httpx fork, so use whichever one the SDK expects
+    base = next(c for c in client_cls.__mro__ if c.__name__ == "AsyncClient")
+    http = sys.modules[base.__module__.split(".")[0]]
+    limits = http.Limits(
+        max_connections=int(os.getenv("PROVIDER_MAX_CONNECTIONS", 100)),
+        max_keepalive_connections=int(os.getenv("PROVIDER_MAX_KEEPALIVE", 20)),
+        keepalive_expiry=float(os.getenv("PROVIDER_KEEPALIVE_EXPIRY", 60)),
+    )
+    timeout = http.Timeout(
+        float(os.getenv("PROVIDER_TIMEOUT", 600)),
+        connect=float(os.getenv("PROVIDER_CONNECT_TIMEOUT", 10)),
+    )
+    return client_cls(limits=limits, timeout=timeout)
+
+
+class ProviderRegistry:
+    """Owns one set of provider clients shared by every request in the process"""
+
+    def __init__(self):
+        # One pool per provider so a slow provider cannot starve the others
+        self.http_clients: Dict[str, Any] = {}
+        # Provider health is shared so every request benefits from what others learned
+        self.router = ProviderRouter()
+        self.hedging = HedgePolicy()
+        # Every upstream call waits for its provider's scheduler, so bursts queue here instead of drawing 429s
+        self.schedulers: Dict[str, ProviderScheduler] = {}
+
+        self.openai_client = None
+        if os.getenv("OPENAI_API_KEY"):
+            self.openai_client = AsyncOpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                base_url=_base_url("openai"),
+                http_client=self._http_client("openai", openai)
+            )
+
+        self.anthropic_client = None
+        if os.getenv("ANTHROPIC_API_KEY"):
+            self.anthropic_client = AsyncAnthropic(
+                api_key=os.getenv("ANTHROPIC_API_KEY"),
+                base_url=_base_url("anthropic"),
+                http_client=self._http_client("anthropic", anthropic)
+            )
+
+        self.groq_client = None
+        if os.getenv("GROQ_API_KEY"):
+            self.groq_client = AsyncOpenAI(
+                api_key=os.getenv("GROQ_API_KEY"),
+                base_url=_base_url("groq") or GROQ_BASE_URL,
+                http_client=self._http_client("groq", openai)
+            )
+
+        # The Gemini SDK streams synchronously, so it runs on its own bounded thread pool
+        gemini_concurrency = int(os.getenv("GEMINI_MAX_CONCURRENCY", 16))
+        self.gemini_executor = ThreadPoolExecutor(
+            max_workers=gemini_concurrency,
+            thread_name_prefix="gemini-stream"
+        )
+        # The scheduler's in-flight limit keeps waiting streams from piling up on the pool
+        self.schedulers["gemini"] = make_scheduler("gemini", gemini_concurrency)
+        self.gemini_stream_buffer = int(os.getenv("GEMINI_STREAM_BUFFER", 16))
+
+        # Available models and their capabilities; refreshed in the background
+        self.models = ModelRegistry(self)
+
+        self.gemini_model = None
+        if GOOGLE_AVAILABLE and os.getenv("GOOGLE_API_KEY"):
+            genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+            self.gemini_model = self.models.gemini_model()
+
+    def scheduler(self, provider: str) -> ProviderScheduler:
+        """Return the scheduler that admits calls to a provider"""
+        if provider not in self.schedulers:
+            self.schedulers[provider] = make_scheduler(provider)
+        return self.schedulers[provider]
+
+    def _http_client(self, provider: str, sdk) -> Any:
+        if provider not in self.http_clients:
+            self.http_clients[provider] = _make_http_client(sdk)
+        return self.http_clients[provider]
+
+    async def warm_up(self):
+        """Open a pooled connection to each configured provider ahead of the first request"""
+        targets = []
+        if self.openai_client:
+            targets.append(("openai", str(self.openai_client.base_url)))
+        if self.anthropic_client:
+            targets.append(("anthropic", str(self.anthropic_client.base_url)))
+        if self.groq_client:
+            targets.append(("groq", str(self.groq_client.base_url)))
+
+        for provider, url in targets:
+            try:
+                # Any response means the TLS handshake is done and the connection is pooled
+                await self.http_clients[provider].get(url)
+                print(f"Warmed up {provider} connection")
+            except Exception as e:
+                print(f"Warm-up failed for {provider}: {e}")
+
+    async def aclose(self):
+        """Close every pooled connection and worker thread"""
+        await self.models.stop()
+        for client in self.http_clients.values():
+            await client.aclose()
+        self.http_clients.clear()
+        self.gemini_executor.shutdown(wait=False, cancel_futures=True)
+
+
+_registry: Optional[ProviderRegistry] = None
+
+
+def get_provider_registry() -> ProviderRegistry:
+    """Return the process-wide provider registry, creating it on first use"""
+    global _registry
+    if _registry is None:
+        _registry = ProviderRegistry()
+    return _registry
+
+
+async def close_provider_registry():
+    """Shut down the process-wide provider registry"""
+    global _registry
+    if _registry is not None:
+        await _registry.aclose()
+        _registry = None
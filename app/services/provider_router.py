@@ -0,0 +1,240 @@
+"""
+Provider Router - Health-aware provider selection with circuit breakers
+"""
+import os
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+from app.services.provider_scheduler import QueueTimeout
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Model used when a provider serves as a fallback for another provider's model
+FALLBACK_MODELS = {
+    "gemini": "gemini-2.5-flash",
+    "openai": "gpt-3.5-turbo",
+    "anthropic": "claude-3-haiku",
+}
+
+
+def provider_for_model(model: str) -> Optional[str]:
+    """Return the provider that serves a model name"""
+    name = model.lower()
+    if "gpt" in name:
+        return "openai"
+    if "claude" in name:
+        return "anthropic"
+    if "gemini" in name:
+        return "gemini"
+    return None
+
+
+# Message phrases, checked only after the status code and exception type
+QUOTA_PHRASES = ("insufficient_quota", "exceeded your current quota", "quota exceeded", "credit balance", "billing")
+RATE_LIMIT_PHRASES = ("rate limit", "rate_limit", "ratelimit", "too many requests")
+AUTH_PHRASES = ("api key", "api_key", "invalid x-api-key")
+
+
+def classify_error(error: Exception) -> str:
+    """Classify a provider exception as quota, rate_limit, auth, timeout, throttled or error"""
+    if isinstance(error, QueueTimeout):
+        return "throttled"
+    code = getattr(error, "code", None)
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if status is None and isinstance(code, int):
+        # google.api_core exceptions carry the HTTP status as ``code``
+        status = code
+    code = code.lower() if isinstance(code, str) else ""
+    name = type(error).__name__.lower()
+    text = str(error).lower()
+
+    if status == 429 or "ratelimit" in name or "resourceexhausted" in name:
+        # Exhausted quotas and plan limits also come back as 429
+        if code == "insufficient_quota" or any(phrase in text for phrase in QUOTA_PHRASES):
+            return "quota"
+        return "rate_limit"
+    if status == 402 or code == "insufficient_quota":
+        return "quota"
+    if status in (401, 403) or "authentication" in name or "permissiondenied" in name:
+        return "auth"
+    if "timeout" in name:
+        return "timeout"
+
+    if any(phrase in text for phrase in QUOTA_PHRASES):
+        return "quota"
+    if any(phrase in text for phrase in RATE_LIMIT_PHRASES):
+        return "rate_limit"
+    if any(phrase in text for phrase in AUTH_PHRASES):
+        return "auth"
+    if "timed out" in text:
+        return "timeout"
+    return "error"
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Read a Retry-After header from a provider error, if the SDK exposes one"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class ProviderHealth:
+    """Rolling health and breaker state for one provider"""
+
+    def __init__(self, window: int, latency_samples: int):
+        self.outcomes = deque(maxlen=window)  # True for success, False for failure
+        self.latency_ewma: Optional[float] = None
+        self.latency_samples = deque(maxlen=latency_samples)
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.cooldown = 0.0
+        self.consecutive_failures = 0
+        self.probe_in_flight = False
+        self.last_error: Optional[str] = None
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+
+class ProviderRouter:
+    """Chooses which providers to try for a request, skipping ones known to be failing"""
+
+    def __init__(self):
+        self.window = int(os.getenv("ROUTER_WINDOW", 20))
+        self.min_requests = int(os.getenv("ROUTER_MIN_REQUESTS", 5))
+        self.error_threshold = float(os.getenv("ROUTER_ERROR_THRESHOLD", 0.5))
+        self.max_consecutive_failures = int(os.getenv("ROUTER_MAX_CONSECUTIVE_FAILURES", 3))
+        self.ewma_alpha = float(os.getenv("ROUTER_LATENCY_ALPHA", 0.2))
+        self.latency_sample_size = int(os.getenv("ROUTER_LATENCY_SAMPLES", 200))
+        self.cooldowns = {
+            "error": float(os.getenv("ROUTER_ERROR_COOLDOWN", 30)),
+            "timeout": float(os.getenv("ROUTER_ERROR_COOLDOWN", 30)),
+            "rate_limit": float(os.getenv("ROUTER_RATE_LIMIT_COOLDOWN", 20)),
+            "quota": float(os.getenv("ROUTER_QUOTA_COOLDOWN", 600)),
+            "auth": float(os.getenv("ROUTER_AUTH_COOLDOWN", 600)),
+        }
+        self.max_cooldown = float(os.getenv("ROUTER_MAX_COOLDOWN", 1800))
+        self.health: Dict[str, ProviderHealth] = {}
+
+    def _health(self, provider: str) -> ProviderHealth:
+        if provider not in self.health:
+            self.health[provider] = ProviderHealth(self.window, self.latency_sample_size)
+        return self.health[provider]
+
+    def is_available(self, provider: str, now: Optional[float] = None) -> bool:
+        """Check whether a request may be sent to a provider right now"""
+        health = self._health(provider)
+        now = now or time.monotonic()
+        if health.state == OPEN and now - health.opened_at >= health.cooldown:
+            health.state = HALF_OPEN
+        if health.state == HALF_OPEN:
+            return not health.probe_in_flight
+        return health.state == CLOSED
+
+    def latency_samples(self, provider: str):
+        """Recent time-to-first-chunk samples for a provider"""
+        return self._health(provider).latency_samples
+
+    def _score(self, provider: str) -> float:
+        """Lower is healthier"""
+        health = self._health(provider)
+        latency = health.latency_ewma if health.latency_ewma is not None else 1.0
+        return health.error_rate * 10 + latency
+
+    def plan(self, model: str, configured: Dict[str, bool]) -> List[Tuple[str, str]]:
+        """Return the (provider, model) pairs to try, requested model first and healthiest fallbacks after"""
+        now = time.monotonic()
+        candidates = []
+
+        primary = provider_for_model(model)
+        if primary and configured.get(primary) and self.is_available(primary, now):
+            candidates.append((primary, model))
+
+        fallbacks = [
+            (provider, fallback_model)
+            for provider, fallback_model in FALLBACK_MODELS.items()
+            if configured.get(provider)
+            and (provider, fallback_model) not in candidates
+            and self.is_available(provider, now)
+        ]
+        fallbacks.sort(key=lambda candidate: self._score(candidate[0]))
+        candidates.extend(fallbacks)
+        return candidates
+
+    def begin(self, provider: str):
+        """Mark a request as started; a half-open provider admits a single probe"""
+        health = self._health(provider)
+        if health.state == HALF_OPEN:
+            health.probe_in_flight = True
+
+    def release(self, provider: str):
+        """Mark a request as finished, however it ended"""
+        self._health(provider).probe_in_flight = False
+
+    def record_success(self, provider: str, latency: float):
+        """Record a successful request and its time to first chunk"""
+        health = self._health(provider)
+        health.outcomes.append(True)
+        health.consecutive_failures = 0
+        health.latency_samples.append(latency)
+        if health.latency_ewma is None:
+            health.latency_ewma = latency
+        else:
+            health.latency_ewma += self.ewma_alpha * (latency - health.latency_ewma)
+        if health.state != CLOSED:
+            health.state = CLOSED
+            health.cooldown = 0.0
+            print(f"Circuit closed for {provider}")
+
+    def record_failure(self, provider: str, error: Exception) -> str:
+        """Record a failed request, opening the breaker when needed, and return the error class"""
+        health = self._health(provider)
+        kind = classify_error(error)
+        if kind == "throttled":
+            # Our own scheduler held the request back; the provider did nothing wrong
+            return kind
+        health.outcomes.append(False)
+        health.consecutive_failures += 1
+        health.last_error = f"{kind}: {str(error)[:200]}"
+
+        should_open = (
+            health.state == HALF_OPEN
+            or kind in ("quota", "rate_limit", "auth")
+            or health.consecutive_failures >= self.max_consecutive_failures
+            or (len(health.outcomes) >= self.min_requests and health.error_rate >= self.error_threshold)
+        )
+        if should_open:
+            cooldown = _retry_after(error) or self.cooldowns[kind]
+            if health.state == HALF_OPEN:
+                # A failed probe backs off further than the last cooldown
+                cooldown = max(cooldown, health.cooldown * 2)
+            health.state = OPEN
+            health.opened_at = time.monotonic()
+            health.cooldown = min(cooldown, self.max_cooldown)
+            print(f"Circuit opened for {provider} ({kind}) for {health.cooldown:.0f}s")
+        return kind
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Current health of every provider seen so far"""
+        now = time.monotonic()
+        return {
+            provider: {
+                "state": health.state,
+                "error_rate": round(health.error_rate, 3),
+                "latency_ewma": health.latency_ewma,
+                "consecutive_failures": health.consecutive_failures,
+                "cooldown_remaining": max(0.0, health.cooldown - (now - health.opened_at)) if health.state == OPEN else 0.0,
+                "last_error": health.last_error,
+            }
+            for provider, health in self.health.items()
+        }
@@ -0,0 +1,166 @@
+"""
+Provider Scheduler - Per-provider concurrency limits, rate limits and request priorities
+"""
+import os
+import time
+import heapq
+import asyncio
+import itertools
+from collections import deque
+from typing import Optional, Dict, List
+from dotenv import load_dotenv
+from app.services.metrics import SCHEDULER_WAIT_SECONDS
+
+load_dotenv()
+
+# Lower runs first; interactive chat goes ahead of agent and background work
+PRIORITIES = {"interactive": 0, "default": 5, "batch": 10}
+
+
+class QueueTimeout(Exception):
+    """A request waited longer than allowed for a provider slot"""
+
+
+class TokenBucket:
+    """Refills ``per_minute`` units a minute up to one minute's worth"""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until ``amount`` can be taken"""
+        self._refill(now)
+        # A request larger than the bucket only waits for a full bucket
+        needed = min(amount, self.capacity) - self.level
+        return needed / self.rate if needed > 0 else 0.0
+
+    def take(self, amount: float):
+        self.level -= amount
+
+    def give_back(self, amount: float):
+        """Correct an estimate; a negative amount leaves the bucket in debt"""
+        self.level = min(self.capacity, self.level + amount)
+
+
+class _Waiter:
+    def __init__(self, tokens: int, future: asyncio.Future):
+        self.tokens = tokens
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class ProviderScheduler:
+    """Admits upstream calls to one provider in priority order.
+
+    A call needs a free in-flight slot, a request from the requests-per-minute bucket
+    and its estimated tokens from the tokens-per-minute bucket. The head of the queue
+    blocks everything behind it so large batch calls are not starved by small ones
+    of the same priority. A limit of 0 disables that limit.
+    """
+
+    def __init__(self, provider: str, max_in_flight: int, rpm: float, tpm: float, queue_timeout: float):
+        self.provider = provider
+        self.max_in_flight = max_in_flight
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.queue_timeout = queue_timeout
+        self.queue: List = []
+        self.sequence = itertools.count()
+        self.in_flight = 0
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.wait_samples = deque(maxlen=200)
+        self.stats = {"admitted": 0, "queued": 0, "timeouts": 0, "max_wait": 0.0}
+
+    async def acquire(self, tokens: int, priority: str = "interactive"):
+        """Wait for a slot; raises QueueTimeout if none frees up in time"""
+        waiter = _Waiter(tokens, asyncio.get_running_loop().create_future())
+        heapq.heappush(self.queue, (PRIORITIES.get(priority, PRIORITIES["default"]), next(self.sequence), waiter))
+        self._dispatch()
+        if not waiter.future.done():
+            self.stats["queued"] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=self.queue_timeout or None)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Admitted just as the wait ended; hand the slot back
+                self.release(tokens, tokens)
+            else:
+                waiter.future.cancel()
+                self._dispatch()
+            if isinstance(e, asyncio.TimeoutError):
+                self.stats["timeouts"] += 1
+                raise QueueTimeout(
+                    f"{self.provider} scheduler queue wait exceeded {self.queue_timeout:g}s"
+                ) from None
+            raise
+
+    def release(self, estimated_tokens: int, used_tokens: int):
+        """Free a slot and settle the token estimate against what was used"""
+        self.in_flight -= 1
+        if self.tokens is not None:
+            self.tokens.give_back(estimated_tokens - used_tokens)
+        self._dispatch()
+
+    def _dispatch(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        while self.queue:
+            _, _, waiter = self.queue[0]
+            if waiter.future.cancelled():
+                heapq.heappop(self.queue)
+                continue
+            if self.max_in_flight and self.in_flight >= self.max_in_flight:
+                return  # release() dispatches again
+            now = time.monotonic()
+            delay = max(
+                self.requests.wait_time(1, now) if self.requests else 0.0,
+                self.tokens.wait_time(waiter.tokens, now) if self.tokens else 0.0
+            )
+            if delay > 0:
+                self.timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+            heapq.heappop(self.queue)
+            if self.requests:
+                self.requests.take(1)
+            if self.tokens:
+                self.tokens.take(waiter.tokens)
+            self.in_flight += 1
+            wait = now - waiter.enqueued_at
+            self.wait_samples.append(wait)
+            SCHEDULER_WAIT_SECONDS.observe(wait, self.provider)
+            self.stats["admitted"] += 1
+            self.stats["max_wait"] = max(self.stats["max_wait"], wait)
+            waiter.future.set_result(None)
+
+    def snapshot(self) -> Dict:
+        samples = sorted(self.wait_samples)
+        return {
+            **self.stats,
+            "in_flight": self.in_flight,
+            "queue_depth": sum(1 for _, _, waiter in self.queue if not waiter.future.cancelled()),
+            "wait_p50": samples[len(samples) // 2] if samples else 0.0,
+            "wait_p95": samples[int(len(samples) * 0.95)] if samples else 0.0,
+            "max_in_flight": self.max_in_flight,
+            "request_bucket": round(self.requests.level, 1) if self.requests else None,
+            "token_bucket": round(self.tokens.level, 1) if self.tokens else None,
+        }
+
+
+def make_scheduler(provider: str, default_max_in_flight: int = 32) -> ProviderScheduler:
+    """Build a provider's scheduler from SCHEDULER_<PROVIDER>_* settings"""
+    prefix = f"SCHEDULER_{provider.upper()}_"
+    return ProviderScheduler(
+        provider,
+        max_in_flight=int(os.getenv(prefix + "MAX_IN_FLIGHT", default_max_in_flight)),
+        rpm=float(os.getenv(prefix + "RPM", 0)),
+        tpm=float(os.getenv(prefix + "TPM", 0)),
+        queue_timeout=float(os.getenv("SCHEDULER_QUEUE_TIMEOUT", 30)),
+    )
@@ -0,0 +1,200 @@
+"""
+Response Cache - Exact-match cache for non-streaming chat completions
+"""
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, List, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def make_cache_key(
+    model: str,
+    system_prompt: Optional[str],
+    message: str,
+    history: List[Dict]
+) -> str:
+    """Hash everything that determines a completion into a cache key"""
+    normalized = re.sub(r"\s+", " ", message).strip()
+    payload = json.dumps(
+        {
+            "model": model,
+            "system_prompt": system_prompt or "",
+            "message": normalized,
+            "history": [(m.get("role"), m.get("content")) for m in history],
+        },
+        ensure_ascii=False,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _DiskTier:
+    """SQLite-backed second tier that survives restarts and is shared by workers"""
+
+    def __init__(self, path: str, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.writes = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            "key TEXT PRIMARY KEY, response TEXT, size INTEGER, expires_at REAL, accessed_at REAL)"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_response_cache_accessed_at ON response_cache (accessed_at)"
+        )
+        self.conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT response, expires_at FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self.conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                self.conn.commit()
+                return None
+            self.conn.execute("UPDATE response_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            return row[0]
+
+    def set(self, key: str, response: str, expires_at: float):
+        size = len(response.encode("utf-8"))
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?, ?, ?)",
+                (key, response, size, expires_at, time.time())
+            )
+            self.writes += 1
+            # Checking the total size on every write would cost a full scan each time
+            if self.writes % 100 == 0:
+                self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        self.conn.execute("DELETE FROM response_cache WHERE expires_at < ?", (time.time(),))
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM response_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        freed = 0
+        victims = []
+        for key, size in self.conn.execute("SELECT key, size FROM response_cache ORDER BY accessed_at"):
+            victims.append((key,))
+            freed += size
+            if total - freed <= self.max_bytes:
+                break
+        self.conn.executemany("DELETE FROM response_cache WHERE key = ?", victims)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class ResponseCache:
+    """In-memory LRU with TTL and size limits, optionally backed by an on-disk tier"""
+
+    def __init__(self):
+        self.enabled = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+        self.ttl = float(os.getenv("RESPONSE_CACHE_TTL", 3600))
+        self.max_entries = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 1000))
+        self.max_bytes = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+        self.entries: "OrderedDict[str, Tuple[float, str, int]]" = OrderedDict()
+        self.size = 0
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+        self.disk: Optional[_DiskTier] = None
+        disk_path = os.getenv("RESPONSE_CACHE_DB", "")
+        if self.enabled and disk_path:
+            self.disk = _DiskTier(disk_path, int(os.getenv("RESPONSE_CACHE_DISK_MAX_BYTES", 256 * 1024 * 1024)))
+
+    async def get(self, key: str) -> Optional[str]:
+        """Look up a cached response, promoting disk hits into memory"""
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires_at, response, _ = entry
+            if expires_at >= time.time():
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return response
+            self._remove(key)
+
+        if self.disk is not None:
+            response = await asyncio.to_thread(self.disk.get, key)
+            if response is not None:
+                self.stats["disk_hits"] += 1
+                self._put_memory(key, response, time.time() + self.ttl)
+                return response
+
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, response: str):
+        """Store a response in every tier"""
+        expires_at = time.time() + self.ttl
+        self._put_memory(key, response, expires_at)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, response, expires_at)
+
+    def _put_memory(self, key: str, response: str, expires_at: float):
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = (expires_at, response, size)
+        self.size += size
+        while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+            oldest = next(iter(self.entries))
+            self._remove(oldest)
+            self.stats["evictions"] += 1
+
+    def _remove(self, key: str):
+        _, _, size = self.entries.pop(key)
+        self.size -= size
+
+    def snapshot(self) -> Dict:
+        lookups = self.stats["hits"] + self.stats["disk_hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "hit_rate": (self.stats["hits"] + self.stats["disk_hits"]) / lookups if lookups else 0.0,
+            "disk_enabled": self.disk is not None,
+        }
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
+            self.disk = None
+
+
+_response_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    """Return the process-wide response cache"""
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache()
+    return _response_cache
+
+
+def close_response_cache():
+    """Close the process-wide response cache"""
+    global _response_cache
+    if _response_cache is not None:
+        _response_cache.close()
+        _response_cache = None
@@ -0,0 +1,171 @@
+"""
+Semantic Cache - Reuse answers for near-duplicate prompts
+"""
+import os
+import re
+import time
+import zlib
+import hashlib
+import importlib
+from typing import Optional, Dict, List
+from dotenv import load_dotenv
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+load_dotenv()
+
+_WORD = re.compile(r"[a-z0-9]+")
+_REPLAY_CHUNK = re.compile(r"(?:\S+\s*){1,4}|\s+")
+
+
+class HashingEmbedder:
+    """Offline embedder: hashed word unigrams, bigrams and character trigrams"""
+
+    def __init__(self, dimensions: int = 512):
+        self.dimensions = dimensions
+
+    def _features(self, text: str) -> List[str]:
+        words = _WORD.findall(text.lower())
+        features = list(words)
+        features.extend(f"{a} {b}" for a, b in zip(words, words[1:]))
+        for word in words:
+            padded = f"#{word}#"
+            features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def embed(self, text: str) -> "np.ndarray":
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for feature in self._features(text):
+            # crc32 is stable across processes, unlike hash()
+            digest = zlib.crc32(feature.encode("utf-8"))
+            sign = 1.0 if digest & 0x80000000 else -1.0
+            vector[digest % self.dimensions] += sign
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class _VectorIndex:
+    """Prompt vectors and answers for one model, oldest first"""
+
+    def __init__(self, dimensions: int):
+        # Rows beyond len(answers) are spare capacity so adds do not copy the matrix
+        self.vectors = np.zeros((16, dimensions), dtype=np.float32)
+        self.answers: List[str] = []
+        self.created_at: List[float] = []
+
+    def search(self, vector: "np.ndarray"):
+        if not self.answers:
+            return None, 0.0
+        scores = self.vectors[:len(self.answers)] @ vector
+        best = int(np.argmax(scores))
+        return best, float(scores[best])
+
+    def add(self, vector: "np.ndarray", answer: str, now: float):
+        size = len(self.answers)
+        if size == self.vectors.shape[0]:
+            grown = np.zeros((size * 2, self.vectors.shape[1]), dtype=np.float32)
+            grown[:size] = self.vectors
+            self.vectors = grown
+        self.vectors[size] = vector
+        self.answers.append(answer)
+        self.created_at.append(now)
+
+    def evict(self, oldest_allowed: float, max_entries: int) -> int:
+        """Drop expired entries and the oldest ones beyond the size limit"""
+        keep_from = 0
+        while keep_from < len(self.created_at) and self.created_at[keep_from] < oldest_allowed:
+            keep_from += 1
+        keep_from = max(keep_from, len(self.answers) - max_entries)
+        if keep_from <= 0:
+            return 0
+        size = len(self.answers)
+        self.vectors[:size - keep_from] = self.vectors[keep_from:size]
+        self.answers = self.answers[keep_from:]
+        self.created_at = self.created_at[keep_from:]
+        return keep_from
+
+
+class SemanticCache:
+    """Per-model similarity cache over standalone prompts"""
+
+    def __init__(self, embedder=None):
+        self.enabled = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+        self.available = NUMPY_AVAILABLE
+        self.threshold = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.92))
+        self.ttl = float(os.getenv("SEMANTIC_CACHE_TTL", 86400))
+        self.max_entries = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 5000))
+        self.indexes: Dict[str, _VectorIndex] = {}
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self.embedder = embedder
+        if self.embedder is None and self.available:
+            self.embedder = self._load_embedder()
+
+    def _load_embedder(self):
+        """Use SEMANTIC_CACHE_EMBEDDER ("module:Class") if set, else the hashing embedder"""
+        path = os.getenv("SEMANTIC_CACHE_EMBEDDER", "")
+        if path:
+            module_name, class_name = path.split(":")
+            return getattr(importlib.import_module(module_name), class_name)()
+        return HashingEmbedder(int(os.getenv("SEMANTIC_CACHE_DIMENSIONS", 512)))
+
+    def _namespace(self, model: str, system_prompt: Optional[str]) -> str:
+        # Answers never cross models or system prompts
+        return model + ":" + hashlib.sha1((system_prompt or "").encode("utf-8")).hexdigest()
+
+    def _index(self, namespace: str, dimensions: int) -> _VectorIndex:
+        if namespace not in self.indexes:
+            self.indexes[namespace] = _VectorIndex(dimensions)
+        return self.indexes[namespace]
+
+    def lookup(self, model: str, system_prompt: Optional[str], message: str) -> Optional[str]:
+        """Return a cached answer for a sufficiently similar prompt"""
+        index = self.indexes.get(self._namespace(model, system_prompt))
+        if index is None or not index.answers:
+            self.stats["misses"] += 1
+            return None
+
+        best, score = index.search(self.embedder.embed(message))
+        if best is not None and score >= self.threshold and index.created_at[best] >= time.time() - self.ttl:
+            self.stats["hits"] += 1
+            return index.answers[best]
+        self.stats["misses"] += 1
+        return None
+
+    def store(self, model: str, system_prompt: Optional[str], message: str, answer: str):
+        """Remember the answer for a prompt"""
+        if not answer:
+            return
+        now = time.time()
+        vector = self.embedder.embed(message)
+        index = self._index(self._namespace(model, system_prompt), vector.shape[0])
+        index.add(vector, answer, now)
+        self.stats["stores"] += 1
+        self.stats["evictions"] += index.evict(now - self.ttl, self.max_entries)
+
+    def snapshot(self) -> Dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "enabled": self.enabled and self.available,
+            "entries": sum(len(index.answers) for index in self.indexes.values()),
+            "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+        }
+
+
+def replay_chunks(answer: str) -> List[str]:
+    """Split a cached answer into stream-sized chunks of a few words"""
+    return _REPLAY_CHUNK.findall(answer)
+
+
+_semantic_cache: Optional[SemanticCache] = None
+
+
+def get_semantic_cache() -> SemanticCache:
+    """Return the process-wide semantic cache"""
+    global _semantic_cache
+    if _semantic_cache is None:
+        _semantic_cache = SemanticCache()
+    return _semantic_cache
@@ -0,0 +1,146 @@
+"""
+Single Flight - Share one upstream stream between identical concurrent requests
+"""
+import os
+import json
+import asyncio
+import hashlib
+from typing import AsyncIterator, Callable, Optional, Dict, List
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def make_flight_key(
+    model: str,
+    system_prompt: Optional[str],
+    message: str,
+    history: List[Dict],
+    tools: Optional[List[Dict]]
+) -> str:
+    """Fingerprint everything that determines an upstream stream"""
+    payload = json.dumps(
+        {
+            "model": model,
+            "system_prompt": system_prompt or "",
+            "message": message,
+            "history": [(m.get("role"), m.get("content")) for m in history],
+            "tools": tools or [],
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    """One upstream stream, its chunks so far, and the subscribers reading it"""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.outcome: Dict = {}
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        # Replaced after every chunk so each waiter wakes exactly once per change
+        self.changed = asyncio.Event()
+
+    def notify(self):
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class SingleFlight:
+    """Coalesces identical in-flight streams into one upstream call.
+
+    The first request for a key starts the upstream stream in a background task;
+    requests with the same key that arrive while it runs replay the chunks produced
+    so far and then follow the live tail. The flight is forgotten once it finishes,
+    so this never serves stale answers. If every subscriber leaves, the upstream
+    stream is cancelled.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+        self.flights: Dict[str, _Flight] = {}
+        self.stats = {"leaders": 0, "joined": 0, "replayed_chunks": 0, "cancelled": 0}
+
+    async def stream(
+        self,
+        key: str,
+        start: Callable[[Dict], AsyncIterator[str]],
+        outcome: Optional[Dict] = None
+    ) -> AsyncIterator[str]:
+        """Stream the flight for ``key``, starting it with ``start(outcome)`` if needed"""
+        flight = self.flights.get(key)
+        joined = flight is not None
+        if not joined:
+            flight = _Flight()
+            self.flights[key] = flight
+            flight.task = asyncio.get_running_loop().create_task(self._run(key, flight, start))
+            self.stats["leaders"] += 1
+        else:
+            self.stats["joined"] += 1
+            self.stats["replayed_chunks"] += len(flight.chunks)
+
+        flight.subscribers += 1
+        position = 0
+        try:
+            while True:
+                changed = flight.changed
+                while position < len(flight.chunks):
+                    yield flight.chunks[position]
+                    position += 1
+                if flight.done:
+                    break
+                await changed.wait()
+            if flight.error is not None:
+                raise flight.error
+            if outcome is not None:
+                # Joiners are told so that per-request side effects happen once per flight
+                outcome.update(flight.outcome, shared=joined)
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                # Nobody is listening any more; stop paying for the upstream stream
+                self.stats["cancelled"] += 1
+                flight.task.cancel()
+                if self.flights.get(key) is flight:
+                    del self.flights[key]
+
+    async def _run(self, key: str, flight: _Flight, start: Callable[[Dict], AsyncIterator[str]]):
+        try:
+            async for chunk in start(flight.outcome):
+                flight.chunks.append(chunk)
+                flight.notify()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            flight.notify()
+            if self.flights.get(key) is flight:
+                del self.flights[key]
+
+    def snapshot(self) -> Dict:
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "in_flight": len(self.flights),
+            "subscribers": sum(flight.subscribers for flight in self.flights.values()),
+        }
+
+
+_single_flight: Optional[SingleFlight] = None
+
+
+def get_single_flight() -> SingleFlight:
+    """Return the process-wide single-flight group"""
+    global _single_flight
+    if _single_flight is None:
+        _single_flight = SingleFlight()
+    return _single_flight
@@ -0,0 +1,119 @@
+"""
+Stream Writer - Coalesce streamed chunks into fewer WebSocket frames
+"""
+import os
+import math
+import time
+import asyncio
+from typing import Any, Optional, List
+from fastapi import WebSocket
+from dotenv import load_dotenv
+from app.services.metrics import WS_SEND_SECONDS
+
+load_dotenv()
+
+DEFAULT_WINDOW_MS = float(os.getenv("WS_STREAM_WINDOW_MS", 30))
+DEFAULT_MAX_CHARS = int(os.getenv("WS_STREAM_MAX_CHARS", 2048))
+
+# Bounds for client-supplied settings
+MAX_WINDOW_MS = 1000.0
+MAX_CHARS_LIMIT = 65536
+
+
+def _number(value: Any) -> Optional[float]:
+    """``value`` as a finite, non-negative number, or None"""
+    if isinstance(value, bool):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) and number >= 0 else None
+
+
+def window_ms_setting(value: Any) -> float:
+    """A client's stream_window_ms clamped to 0..MAX_WINDOW_MS; the server default if invalid"""
+    number = _number(value)
+    return DEFAULT_WINDOW_MS if number is None else min(number, MAX_WINDOW_MS)
+
+
+def max_chars_setting(value: Any) -> int:
+    """A client's stream_max_chars clamped to 1..MAX_CHARS_LIMIT; the server default if invalid"""
+    number = _number(value)
+    return DEFAULT_MAX_CHARS if number is None or number < 1 else min(int(number), MAX_CHARS_LIMIT)
+
+
+class StreamWriter:
+    """Buffers chunks and sends them as one "chunk" frame per window.
+
+    A frame goes out when the oldest buffered chunk is ``window_ms`` old or the
+    buffer reaches ``max_chars``, whichever comes first; a timer covers the case
+    where the provider pauses mid-window. A window of 0 sends every chunk as is.
+    The whole response is kept as a list of parts and joined once in ``text``.
+    """
+
+    def __init__(self, websocket: WebSocket, window_ms: Any = None, max_chars: Any = None):
+        self.websocket = websocket
+        # Settings may come straight from a client message
+        self.window = window_ms_setting(window_ms) / 1000
+        self.max_chars = max_chars_setting(max_chars)
+        self.parts: List[str] = []
+        self.pending: List[str] = []
+        self.pending_chars = 0
+        self.pending_since = 0.0
+        self.timer: Optional[asyncio.Task] = None
+        self.lock = asyncio.Lock()
+        self.error: Optional[Exception] = None
+        self.frames = 0
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    async def write(self, chunk: str):
+        if self.error is not None:
+            # A timed flush failed, most likely because the client went away
+            raise self.error
+        if not chunk:
+            return
+        self.parts.append(chunk)
+        if not self.pending:
+            self.pending_since = time.monotonic()
+        self.pending.append(chunk)
+        self.pending_chars += len(chunk)
+
+        if (
+            self.window <= 0
+            or self.pending_chars >= self.max_chars
+            or time.monotonic() - self.pending_since >= self.window
+        ):
+            await self.flush()
+        elif self.timer is None:
+            self.timer = asyncio.create_task(self._flush_after_window())
+
+    async def _flush_after_window(self):
+        await asyncio.sleep(self.window)
+        self.timer = None
+        try:
+            await self.flush()
+        except Exception as e:
+            self.error = e
+
+    async def flush(self):
+        """Send whatever is buffered as a single frame"""
+        if self.timer is not None and self.timer is not asyncio.current_task():
+            self.timer.cancel()
+            self.timer = None
+        async with self.lock:
+            if not self.pending:
+                return
+            content = "".join(self.pending)
+            self.pending.clear()
+            self.pending_chars = 0
+            self.frames += 1
+            with WS_SEND_SECONDS.time():
+                await self.websocket.send_json({"type": "chunk", "content": content})
+
+    async def close(self):
+        """Flush the tail of the stream"""
+        await self.flush()
@@ -0,0 +1,123 @@
+"""
+Tool Runner - Built-in tools the chat models can call, executed concurrently
+"""
+import os
+import json
+import asyncio
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+from app.services.tools.web_search import WebSearchTool
+from app.services.tools.code_executor import CodeExecutor
+
+load_dotenv()
+
+# OpenAI function-calling schemas; Anthropic definitions are derived from these
+TOOL_DEFINITIONS = {
+    "web_search": {
+        "type": "function",
+        "function": {
+            "name": "web_search",
+            "description": "Search the web and return the top results with titles, links and snippets",
+            "parameters": {
+                "type": "object",
+                "properties": {"query": {"type": "string", "description": "Search query"}},
+                "required": ["query"],
+            },
+        },
+    },
+    "code_execute": {
+        "type": "function",
+        "function": {
+            "name": "code_execute",
+            "description": "Run a short Python or JavaScript program and return its output",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "code": {"type": "string", "description": "Program source"},
+                    "language": {"type": "string", "enum": ["python", "javascript"]},
+                },
+                "required": ["code"],
+            },
+        },
+    },
+    "image_generate": {
+        "type": "function",
+        "function": {
+            "name": "image_generate",
+            "description": "Generate an image from a text description and return its URL",
+            "parameters": {
+                "type": "object",
+                "properties": {"prompt": {"type": "string", "description": "What the image shows"}},
+                "required": ["prompt"],
+            },
+        },
+    },
+}
+
+
+def tool_definitions(names: Optional[List[str]]) -> Optional[List[Dict]]:
+    """OpenAI-format definitions for the named built-in tools (None if there are none)"""
+    definitions = [TOOL_DEFINITIONS[name] for name in names or [] if name in TOOL_DEFINITIONS]
+    return definitions or None
+
+
+def anthropic_tools(tools: Optional[List[Dict]]) -> Optional[List[Dict]]:
+    """Convert OpenAI-format tool definitions to Anthropic's format"""
+    if not tools:
+        return None
+    converted = []
+    for tool in tools:
+        function = tool.get("function", tool)
+        converted.append({
+            "name": function["name"],
+            "description": function.get("description", ""),
+            "input_schema": function.get("parameters", {"type": "object", "properties": {}}),
+        })
+    return converted
+
+
+class ToolRunner:
+    """Executes tool calls returned by a model.
+
+    Calls from one model turn are independent, so ``run_all`` starts them
+    together and waits for the slowest rather than the sum. Each call is bounded
+    by TOOL_TIMEOUT_<NAME> (default TOOL_TIMEOUT) seconds, and failures come back
+    as an error result for the model to read instead of ending the turn.
+    """
+
+    def __init__(self, ai_service):
+        self.ai_service = ai_service
+        self.default_timeout = float(os.getenv("TOOL_TIMEOUT", 30))
+        self.max_rounds = int(os.getenv("TOOL_MAX_ROUNDS", 4))
+        self.code_execution = os.getenv("ENABLE_CODE_EXECUTION", "true").lower() == "true"
+
+    def timeout(self, name: str) -> float:
+        return float(os.getenv(f"TOOL_TIMEOUT_{name.upper()}", self.default_timeout))
+
+    async def run_all(self, calls: List[Dict]) -> List[str]:
+        """Run every {"name", "arguments"} call concurrently; results keep the calls' order"""
+        return await asyncio.gather(*(self.run(call["name"], call["arguments"]) for call in calls))
+
+    async def run(self, name: str, arguments: Any) -> str:
+        """Run one tool call and return its result as JSON text"""
+        try:
+            if isinstance(arguments, str):
+                arguments = json.loads(arguments or "{}")
+            result = await asyncio.wait_for(self._dispatch(name, arguments), timeout=self.timeout(name))
+        except asyncio.TimeoutError:
+            result = {"error": f"{name} timed out after {self.timeout(name):g}s"}
+        except Exception as e:
+            result = {"error": f"{name} failed: {e}"}
+        return json.dumps(result, ensure_ascii=False, default=str)
+
+    async def _dispatch(self, name: str, arguments: Dict) -> Any:
+        if name == "web_search":
+            return await WebSearchTool().search(arguments.get("query", ""))
+        elif name == "code_execute":
+            if not self.code_execution:
+                return {"error": "Code execution is disabled"}
+            return await CodeExecutor().execute(arguments.get("code", ""), arguments.get("language", "python"))
+        elif name == "image_generate":
+            from app.services.tools.image_generator import ImageGeneratorTool
+            return await ImageGeneratorTool(self.ai_service).generate(arguments.get("prompt", ""))
+        return {"error": f"Unknown tool: {name}"}
@@ -6,11 +6,13 @@ import tempfile
 import os
 from typing import Dict, Any
 import asyncio
+from app.services.metrics import TOOL_EXECUTION_SECONDS
 
 
 class CodeExecutor:
     """Tool for executing code in a sandboxed environment"""
     
+    @TOOL_EXECUTION_SECONDS.time("code_executor")
     async def execute(self, code: str, language: str = "python") -> Dict[str, Any]:
         """Execute code and return result"""
         try:
@@ -1,15 +1,15 @@
 """
 Image Generator Tool
 """
-from app.services.ai_service import AIService
-from typing import Dict
+from app.services.ai_service import AIService, get_ai_service
+from typing import Dict, Optional
 
 
 class ImageGeneratorTool:
     """Tool for generating images"""
     
-    def __init__(self):
-        self.ai_service = AIService()
+    def __init__(self, ai_service: Optional[AIService] = None):
+        self.ai_service = ai_service or get_ai_service()
     
     async def generate(self, prompt: str, model: str = "dall-e-3") -> Dict:
         """Generate image from prompt"""
@@ -4,11 +4,13 @@ Web Search Tool
 from duckduckgo_search import DDGS
 from typing import List, Dict
 import httpx
+from app.services.metrics import TOOL_EXECUTION_SECONDS
 
 
 class WebSearchTool:
     """Tool for searching the web"""
     
+    @TOOL_EXECUTION_SECONDS.time("web_search")
     async def search(self, query: str, max_results: int = 5) -> List[Dict]:
         """Search the web and return results"""
         try:
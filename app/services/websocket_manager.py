@@ -2,26 +2,46 @@
 WebSocket manager for real-time communication
 """
 from fastapi import WebSocket
-from typing import List, Dict
+from typing import List, Dict, Optional
 import json
 import asyncio
+from app.services.stream_writer import StreamWriter, window_ms_setting, max_chars_setting
+from app.services.metrics import WS_CONNECTIONS, WS_STREAMS_IN_FLIGHT, WS_SEND_SECONDS
+from app.services.tool_runner import tool_definitions
+from app.database import AsyncSessionLocal
+from sqlalchemy.ext.asyncio import AsyncSession
 
 
 class WebSocketManager:
     def __init__(self):
         self.active_connections: List[WebSocket] = []
         self.user_connections: Dict[str, WebSocket] = {}
+        # Per-connection stream coalescing, set with a "configure" message
+        self.stream_settings: Dict[WebSocket, Dict] = {}
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
         self.active_connections.append(websocket)
+        WS_CONNECTIONS.set(len(self.active_connections))
 
     def disconnect(self, websocket: WebSocket):
         if websocket in self.active_connections:
             self.active_connections.remove(websocket)
+        WS_CONNECTIONS.set(len(self.active_connections))
+        self.stream_settings.pop(websocket, None)
+
+    def stream_writer(self, websocket: WebSocket, data: dict) -> StreamWriter:
+        """Writer for one response, using the message's or the connection's coalescing window"""
+        settings = self.stream_settings.get(websocket, {})
+        return StreamWriter(
+            websocket,
+            window_ms=data.get("stream_window_ms", settings.get("stream_window_ms")),
+            max_chars=data.get("stream_max_chars", settings.get("stream_max_chars"))
+        )
 
     async def send_personal_message(self, message: dict, websocket: WebSocket):
-        await websocket.send_json(message)
+        with WS_SEND_SECONDS.time():
+            await websocket.send_json(message)
 
     async def broadcast(self, message: dict):
         for connection in self.active_connections:
@@ -32,21 +52,43 @@ class WebSocketManager:
 
     async def handle_message(self, websocket: WebSocket, data: dict):
         """Handle incoming WebSocket messages"""
+        if data.get("type") not in ("chat", "edit"):
+            return await self._handle_message(websocket, data)
+        # Both stream a model response back
+        WS_STREAMS_IN_FLIGHT.inc()
+        try:
+            # One session for the message's reads and writes; it only holds a
+            # connection while a query runs, not while the response streams
+            async with AsyncSessionLocal() as db:
+                await self._handle_message(websocket, data, db)
+        finally:
+            WS_STREAMS_IN_FLIGHT.dec()
+
+    async def _handle_message(self, websocket: WebSocket, data: dict, db: Optional[AsyncSession] = None):
         message_type = data.get("type")
-        
-        if message_type == "chat":
+
+        if message_type == "configure":
+            # e.g. {"type": "configure", "stream_window_ms": 50, "stream_max_chars": 4096}
+            settings = self.stream_settings.setdefault(websocket, {})
+            if "stream_window_ms" in data:
+                settings["stream_window_ms"] = window_ms_setting(data["stream_window_ms"])
+            if "stream_max_chars" in data:
+                settings["stream_max_chars"] = max_chars_setting(data["stream_max_chars"])
+            await self.send_personal_message({"type": "configured", **settings}, websocket)
+
+        elif message_type == "chat":
             # Handle chat message
-            from app.services.ai_service import AIService
+            from app.services.ai_service import get_ai_service
             from app.services.conversation_service import ConversationService
             
-            ai_service = AIService()
-            conv_service = ConversationService()
+            ai_service = get_ai_service()
+            conv_service = ConversationService(db)
             
             # Get or create conversation
             conversation_id = data.get("conversation_id")
             if not conversation_id:
                 # Create new conversation
-                conv = conv_service.create_conversation()
+                conv = await conv_service.create_conversation()
                 conversation_id = conv["id"]
                 # Send conversation ID to client
                 await self.send_personal_message({
@@ -63,7 +105,7 @@ class WebSocketManager:
             if attachments:
                 message_metadata["attachments"] = attachments
             
-            conv_service.save_message(
+            await conv_service.save_message(
                 conversation_id=conversation_id,
                 role="user",
                 content=user_message,
@@ -79,25 +121,27 @@ class WebSocketManager:
             
             # Stream response - use gpt-3.5-turbo as default for better reliability
             requested_model = data.get("model", "gpt-3.5-turbo")
-            full_response = ""
+            writer = self.stream_writer(websocket, data)
             try:
                 async for chunk in ai_service.stream_chat(
                     message=user_message,
                     conversation_id=conversation_id,
                     model=requested_model,
-                    attachments=attachments
+                    attachments=attachments,
+                    hedge=data.get("hedge"),
+                    semantic_cache=data.get("semantic_cache"),
+                    coalesce=data.get("coalesce"),
+                    tools=tool_definitions(data.get("tools")),
+                    db=db
                 ):
-                    full_response += chunk
-                    await self.send_personal_message({
-                        "type": "chunk",
-                        "content": chunk
-                    }, websocket)
+                    await writer.write(chunk)
+                await writer.close()
                 
                 # Save assistant response
-                conv_service.save_message(
+                await conv_service.save_message(
                     conversation_id=conversation_id,
                     role="assistant",
-                    content=full_response,
+                    content=writer.text,
                     model=requested_model
                 )
                 
@@ -106,6 +150,8 @@ class WebSocketManager:
                     "conversation_id": conversation_id
                 }, websocket)
             except Exception as e:
+                # Deliver what was streamed before the failure ahead of the error
+                await writer.close()
                 error_message = str(e)
                 if "quota" in error_message.lower() or "billing" in error_message.lower():
                     user_friendly_error = "⚠️ API Quota Exceeded\n\nYour AI provider has run out of credits. Please:\n\n1. Add billing/credits to your OpenAI account\n2. Or switch to Gemini model\n3. Check your API key is valid\n\n💡 Try sending a message again after adding credits!"
@@ -127,11 +173,11 @@ class WebSocketManager:
 
         elif message_type == "edit":
             # Handle message editing
-            from app.services.ai_service import AIService
+            from app.services.ai_service import get_ai_service
             from app.services.conversation_service import ConversationService
 
-            ai_service = AIService()
-            conv_service = ConversationService()
+            ai_service = get_ai_service()
+            conv_service = ConversationService(db)
 
             message_id = data.get("message_id")
             new_content = data.get("new_content", "")
@@ -146,7 +192,7 @@ class WebSocketManager:
                 return
 
             # Update the user message in database
-            success = conv_service.update_message_content(message_id, new_content)
+            success = await conv_service.update_message_content(message_id, new_content)
             if not success:
                 await self.send_personal_message({
                     "type": "error",
@@ -155,7 +201,7 @@ class WebSocketManager:
                 return
 
             # Remove all messages after the edited message
-            conv_service.remove_messages_after(message_id, conversation_id)
+            await conv_service.remove_messages_after(message_id, conversation_id)
 
             # Send acknowledgment
             await self.send_personal_message({
@@ -164,9 +210,10 @@ class WebSocketManager:
             }, websocket)
 
             # Regenerate AI response based on edited conversation
+            writer = self.stream_writer(websocket, data)
             try:
                 # Get the conversation history up to the edited message
-                conversation = conv_service.get_conversation(conversation_id)
+                conversation = await conv_service.get_conversation(conversation_id)
                 if not conversation or not conversation.get("messages"):
                     await self.send_personal_message({
                         "type": "error",
@@ -200,23 +247,23 @@ class WebSocketManager:
                     conversation_text += f"{role}: {content}\n"
 
                 # Generate new AI response
-                full_response = ""
                 async for chunk in ai_service.stream_chat(
                     message=conversation_text,
                     conversation_id=conversation_id,
-                    model=model
+                    model=model,
+                    hedge=data.get("hedge"),
+                    coalesce=data.get("coalesce"),
+                    tools=tool_definitions(data.get("tools")),
+                    db=db
                 ):
-                    full_response += chunk
-                    await self.send_personal_message({
-                        "type": "chunk",
-                        "content": chunk
-                    }, websocket)
+                    await writer.write(chunk)
+                await writer.close()
 
                 # Save the new AI response
-                conv_service.save_message(
+                await conv_service.save_message(
                     conversation_id=conversation_id,
                     role="assistant",
-                    content=full_response,
+                    content=writer.text,
                     model=model
                 )
 
@@ -225,6 +272,8 @@ class WebSocketManager:
                     "conversation_id": conversation_id
                 }, websocket)
             except Exception as e:
+                # Deliver what was streamed before the failure ahead of the error
+                await writer.close()
                 error_message = str(e)
                 if "quota" in error_message.lower() or "billing" in error_message.lower():
                     user_friendly_error = "⚠️ API Quota Exceeded\n\nYour AI provider has run out of credits. Please:\n\n1. Add billing/credits to your OpenAI account\n2. Or switch to Gemini model\n3. Check your API key is valid\n\n💡 Try sending a message again after adding credits!"
@@ -0,0 +1,93 @@
+"""
+Ranged file responses - Serve files with HTTP range support
+"""
+import os
+import asyncio
+from pathlib import Path
+from typing import AsyncGenerator, Dict, Optional, Tuple
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+CHUNK_SIZE = 64 * 1024
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Inclusive (start, end) of a single ``bytes=`` range.
+
+    Returns None when the whole file should be sent: no header, a unit other
+    than bytes, or several ranges. Raises ValueError if the range cannot be
+    satisfied.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, _, end_text = header[len("bytes="):].strip().partition("-")
+    if not (start_text or end_text).isdigit() or not (end_text or "0").isdigit():
+        # Malformed; ignore it like any other range we do not understand
+        return None
+    if not start_text:
+        # Suffix range: the last N bytes
+        length = int(end_text)
+        if length <= 0 or size == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(start_text)
+    end = int(end_text) if end_text else size - 1
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, min(end, size - 1)
+
+
+async def _read_file(path: Path, start: int, length: int) -> AsyncGenerator[bytes, None]:
+    handle = await asyncio.to_thread(open, path, "rb")
+    try:
+        await asyncio.to_thread(handle.seek, start)
+        while length > 0:
+            block = await asyncio.to_thread(handle.read, min(CHUNK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+    finally:
+        await asyncio.to_thread(handle.close)
+
+
+def ranged_file_response(
+    path: Path,
+    request: Request,
+    media_type: str,
+    headers: Optional[Dict[str, str]] = None,
+    etag: Optional[str] = None
+) -> Response:
+    """Whole file (200), one byte range of it (206) or 416 for an unsatisfiable range.
+
+    With an ``etag``, a matching If-None-Match is answered with 304, and an
+    If-Range that does not match makes the range be ignored.
+    """
+    size = os.stat(path).st_size
+    headers = {"Accept-Ranges": "bytes", **(headers or {})}
+    if etag:
+        headers["ETag"] = f'"{etag}"'
+        if request.headers.get("if-none-match") == headers["ETag"]:
+            return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range and if_range != headers.get("ETag"):
+        range_header = None
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(_read_file(path, 0, size), media_type=media_type, headers=headers)
+    start, end = byte_range
+    headers["Content-Length"] = str(end - start + 1)
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return StreamingResponse(
+        _read_file(path, start, end - start + 1),
+        status_code=206,
+        media_type=media_type,
+        headers=headers
+    )
@@ -0,0 +1,66 @@
+"""
+Thread stream bridge - Consume blocking iterators from async code
+"""
+import asyncio
+import threading
+import concurrent.futures
+from concurrent.futures import Executor
+from typing import AsyncGenerator, Callable, Iterable, Optional, TypeVar
+
+T = TypeVar("T")
+
+_DONE = object()
+
+
+async def iterate_in_thread(
+    make_iterable: Callable[[], Iterable[T]],
+    executor: Optional[Executor] = None,
+    max_buffer: int = 16
+) -> AsyncGenerator[T, None]:
+    """Run a blocking iterator on a worker thread and yield its items without blocking the loop.
+
+    Items are handed over through a bounded queue, so a slow consumer pauses the
+    producer thread instead of buffering the whole stream. Closing or cancelling the
+    consumer stops the producer at its next item.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max_buffer)
+    stopped = threading.Event()
+
+    def put(item) -> bool:
+        try:
+            future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+        except RuntimeError:
+            # Event loop already closed
+            return False
+        while True:
+            try:
+                future.result(timeout=0.1)
+                return True
+            except concurrent.futures.TimeoutError:
+                if stopped.is_set():
+                    future.cancel()
+                    return False
+
+    def produce():
+        try:
+            # The iterable is created here because starting the request is blocking too
+            for item in make_iterable():
+                if stopped.is_set() or not put((item, None)):
+                    return
+            put((_DONE, None))
+        except BaseException as e:
+            put((_DONE, e))
+
+    loop.run_in_executor(executor, produce)
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        # The worker notices this at its next item; no need to wait for it here
+        stopped.set()
@@ -0,0 +1,293 @@
+"""
+Fake Provider - Local OpenAI- and Anthropic-compatible streaming server for load tests
+
+Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:9100/v1 and
+ANTHROPIC_BASE_URL=http://127.0.0.1:9100 (any non-empty API keys work).
+
+    python -m bench.fake_provider --port 9100 --ttft-ms 300 --tokens-per-sec 60
+
+Timing and fault injection can be changed while running with POST /_fake/config.
+"""
+import json
+import time
+import zlib
+import base64
+import struct
+import uuid
+import random
+import asyncio
+import argparse
+from typing import Dict, AsyncIterator
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+WORDS = (
+    "the model streams a steady reply so the benchmark can measure first token latency "
+    "inter token gaps and throughput under load without spending real credits on any provider"
+).split()
+
+config = {
+    "ttft_ms": 300.0,  # Delay before the first token
+    "tokens_per_sec": 60.0,  # Output rate after the first token
+    "tokens": 120,  # Tokens per response
+    "jitter": 0.2,  # +/- fraction applied to every delay
+    "error_rate": 0.0,  # Fraction of requests answered with a 500
+    "rate_limit_rate": 0.0,  # Fraction of requests answered with a 429
+    "retry_after": 1,  # Retry-After seconds sent with injected 429s
+    "tool_calls": 0,  # Parallel tool calls requested before answering, when tools are offered
+}
+stats = {"requests": 0, "streams": 0, "errors": 0, "rate_limited": 0, "in_flight": 0, "max_in_flight": 0}
+
+app = FastAPI(title="Fake AI Provider")
+
+
+def _delay(seconds: float) -> float:
+    jitter = config["jitter"]
+    return max(0.0, seconds * random.uniform(1 - jitter, 1 + jitter))
+
+
+def _fault(kind: str):
+    """Return an injected error response for this request, if one is due"""
+    roll = random.random()
+    if roll < config["rate_limit_rate"]:
+        stats["rate_limited"] += 1
+        if kind == "anthropic":
+            body = {"type": "error", "error": {"type": "rate_limit_error", "message": "Injected rate limit"}}
+        else:
+            body = {"error": {"message": "Injected rate limit", "type": "requests", "code": "rate_limit_exceeded"}}
+        return JSONResponse(body, status_code=429, headers={"retry-after": str(config["retry_after"])})
+    if roll < config["rate_limit_rate"] + config["error_rate"]:
+        stats["errors"] += 1
+        if kind == "anthropic":
+            body = {"type": "error", "error": {"type": "api_error", "message": "Injected server error"}}
+        else:
+            body = {"error": {"message": "Injected server error", "type": "server_error", "code": None}}
+        return JSONResponse(body, status_code=500)
+    return None
+
+
+async def _tokens() -> AsyncIterator[str]:
+    """Yield the configured number of tokens at the configured pace"""
+    stats["in_flight"] += 1
+    stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+    try:
+        await asyncio.sleep(_delay(config["ttft_ms"] / 1000))
+        interval = 1.0 / config["tokens_per_sec"] if config["tokens_per_sec"] > 0 else 0.0
+        for index in range(int(config["tokens"])):
+            if index:
+                await asyncio.sleep(_delay(interval))
+            yield random.choice(WORDS) + " "
+    finally:
+        stats["in_flight"] -= 1
+
+
+def _sse(data: Dict, event: str = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    """OpenAI-compatible chat completions, streaming or not"""
+    body = await request.json()
+    stats["requests"] += 1
+    fault = _fault("openai")
+    if fault is not None:
+        return fault
+
+    model = body.get("model", "fake-model")
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    created = int(time.time())
+
+    if not body.get("stream"):
+        text = "".join([token async for token in _tokens()])
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": int(config["tokens"]), "total_tokens": int(config["tokens"])},
+        }
+
+    def chunk(delta: Dict, finish_reason=None) -> str:
+        return _sse({
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        })
+
+    wants_tools = (
+        config["tool_calls"] > 0 and body.get("tools") and body.get("tool_choice") != "none"
+        and not any(m.get("role") == "tool" for m in body.get("messages", []))
+    )
+
+    async def stream():
+        stats["streams"] += 1
+        yield chunk({"role": "assistant", "content": ""})
+        if wants_tools:
+            await asyncio.sleep(_delay(config["ttft_ms"] / 1000))
+            name = body["tools"][0]["function"]["name"]
+            for index in range(int(config["tool_calls"])):
+                call_id = f"call_{uuid.uuid4().hex[:12]}"
+                arguments = json.dumps({"query": f"fake {index}", "code": f"print({index})", "prompt": f"fake {index}"})
+                # Split the arguments the way real streams do
+                yield chunk({"tool_calls": [{"index": index, "id": call_id, "type": "function", "function": {"name": name, "arguments": arguments[:10]}}]})
+                yield chunk({"tool_calls": [{"index": index, "function": {"arguments": arguments[10:]}}]})
+            yield chunk({}, "tool_calls")
+            yield "data: [DONE]\n\n"
+            return
+        async for token in _tokens():
+            yield chunk({"content": token})
+        yield chunk({}, "stop")
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+@app.post("/v1/messages")
+async def messages(request: Request):
+    """Anthropic-compatible messages endpoint, streaming or not"""
+    body = await request.json()
+    stats["requests"] += 1
+    fault = _fault("anthropic")
+    if fault is not None:
+        return fault
+
+    model = body.get("model", "fake-model")
+    message_id = f"msg_{uuid.uuid4().hex[:24]}"
+
+    if not body.get("stream"):
+        text = "".join([token async for token in _tokens()])
+        return {
+            "id": message_id,
+            "type": "message",
+            "role": "assistant",
+            "model": model,
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": 0, "output_tokens": int(config["tokens"])},
+        }
+
+    async def stream():
+        stats["streams"] += 1
+        yield _sse({
+            "type": "message_start",
+            "message": {
+                "id": message_id, "type": "message", "role": "assistant", "model": model, "content": [],
+                "stop_reason": None, "stop_sequence": None, "usage": {"input_tokens": 0, "output_tokens": 0},
+            },
+        }, "message_start")
+        yield _sse({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}, "content_block_start")
+        async for token in _tokens():
+            yield _sse({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": token}}, "content_block_delta")
+        yield _sse({"type": "content_block_stop", "index": 0}, "content_block_stop")
+        yield _sse({
+            "type": "message_delta",
+            "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+            "usage": {"output_tokens": int(config["tokens"])},
+        }, "message_delta")
+        yield _sse({"type": "message_stop"}, "message_stop")
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+@app.post("/v1/audio/speech")
+async def speech(request: Request):
+    """OpenAI-compatible text to speech; streams filler bytes at the token pace"""
+    await request.json()
+    stats["requests"] += 1
+    fault = _fault("openai")
+    if fault is not None:
+        return fault
+
+    async def stream():
+        stats["streams"] += 1
+        async for token in _tokens():
+            yield token.encode() * 64
+
+    return StreamingResponse(stream(), media_type="audio/mpeg")
+
+
+@app.post("/v1/images/generations")
+async def image_generations(request: Request):
+    """OpenAI-compatible image generation; returns a distinct tiny PNG per prompt"""
+    body = await request.json()
+    stats["requests"] += 1
+    fault = _fault("openai")
+    if fault is not None:
+        return fault
+
+    stats["in_flight"] += 1
+    stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+    try:
+        await asyncio.sleep(_delay(config["ttft_ms"] / 1000))
+    finally:
+        stats["in_flight"] -= 1
+    # A valid 1x1 PNG whose text chunk carries the prompt, so each prompt hashes differently
+    text = zlib.crc32(body.get("prompt", "").encode()).to_bytes(4, "big")
+    png = (
+        b"\x89PNG\r\n\x1a\n" + _png_chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 0, 0, 0, 0))
+        + _png_chunk(b"tEXt", b"prompt\x00" + text.hex().encode())
+        + _png_chunk(b"IDAT", zlib.compress(b"\x00\x00")) + _png_chunk(b"IEND", b"")
+    )
+    return {"created": int(time.time()), "data": [{"b64_json": base64.b64encode(png).decode()}]}
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+@app.get("/v1/models")
+async def models():
+    return {"object": "list", "data": [{"id": "fake-model", "object": "model", "owned_by": "bench"}]}
+
+
+@app.get("/_fake/config")
+async def get_config():
+    return {"config": config, "stats": stats}
+
+
+@app.post("/_fake/config")
+async def set_config(request: Request):
+    """Change timing or fault injection without restarting"""
+    updates = await request.json()
+    for key, value in updates.items():
+        if key in config:
+            config[key] = type(config[key])(value)
+    return {"config": config}
+
+
+@app.post("/_fake/reset")
+async def reset_stats():
+    for key in stats:
+        if key != "in_flight":
+            stats[key] = 0
+    return {"stats": stats}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI/Anthropic streaming provider")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--ttft-ms", type=float, default=config["ttft_ms"])
+    parser.add_argument("--tokens-per-sec", type=float, default=config["tokens_per_sec"])
+    parser.add_argument("--tokens", type=int, default=config["tokens"])
+    parser.add_argument("--jitter", type=float, default=config["jitter"])
+    parser.add_argument("--error-rate", type=float, default=config["error_rate"])
+    parser.add_argument("--rate-limit-rate", type=float, default=config["rate_limit_rate"])
+    parser.add_argument("--retry-after", type=int, default=config["retry_after"])
+    parser.add_argument("--tool-calls", type=int, default=config["tool_calls"])
+    args = parser.parse_args()
+
+    for key in config:
+        config[key] = getattr(args, key)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+"""
+Load Benchmark - Drive concurrent WebSocket chats and POST /api/chat/ calls against the app
+
+By default it starts the fake provider and the app itself (pointed at the fake
+provider, with a throwaway database), runs the load, and writes a JSON report:
+
+    python -m bench.run_benchmark --sessions 50 --messages 3 --http-requests 100 --workers 2
+
+Use --target http://host:port to load an already running app instead, and
+--compare bench/results/<earlier>.json to print the change against an earlier run.
+
+The fake provider speaks the OpenAI and Anthropic APIs only, so the default
+model is gpt-3.5-turbo. The app's own default, Gemini, is only exercised with
+--target pointing at an app that has a real GOOGLE_API_KEY and e.g.
+--model gemini-2.5-flash.
+
+Provider failures reach clients as ordinary response text, so a response is
+counted as an error when it is the app's "all providers failed" message;
+per-provider error notices that a fallback recovered from are counted as
+fallbacks.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import asyncio
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+import httpx
+import websockets
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Text AIService streams in place of an answer (see ai_service.py)
+ALL_PROVIDERS_FAILED = "All AI providers failed"
+PROVIDER_NOTICE = "Trying next provider"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _summary(samples: List[float]) -> Dict:
+    """Percentiles of a list of milliseconds"""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 2)
+
+    return {
+        "count": len(ordered),
+        "mean": round(statistics.fmean(ordered), 2),
+        "p50": pick(0.50),
+        "p90": pick(0.90),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": round(ordered[-1], 2),
+    }
+
+
+class Recorder:
+    def __init__(self):
+        self.ttft_ms: List[float] = []
+        self.itl_ms: List[float] = []
+        self.ws_duration_ms: List[float] = []
+        self.http_latency_ms: List[float] = []
+        self.ws_messages = 0
+        self.ws_errors = 0
+        self.ws_fallbacks = 0
+        self.http_requests = 0
+        self.http_errors = 0
+        self.http_fallbacks = 0
+        self.frames = 0
+        self.chars = 0
+        self.workers: Dict[int, Dict] = {}
+
+
+def _prompt(args, session: int, index: int) -> str:
+    if args.identical_prompts:
+        return "Write a short note about load testing."
+    # Unique prompts so caches and request coalescing do not hide provider load
+    return f"[{uuid.uuid4().hex[:8]}] Session {session} message {index}: write a short note about load testing."
+
+
+async def ws_session(args, base_url: str, session: int, recorder: Recorder):
+    url = base_url.replace("http", "ws", 1) + "/ws"
+    conversation_id = None
+    try:
+        async with websockets.connect(url, max_size=None) as ws:
+            if args.stream_window_ms is not None:
+                await ws.send(json.dumps({"type": "configure", "stream_window_ms": args.stream_window_ms}))
+                await ws.recv()
+            for index in range(args.messages):
+                payload = {"type": "chat", "message": _prompt(args, session, index), "model": args.model}
+                if conversation_id:
+                    payload["conversation_id"] = conversation_id
+                sent = time.perf_counter()
+                await ws.send(json.dumps(payload))
+                first = last = None
+                failed = False
+                text = []
+                while True:
+                    frame = json.loads(await ws.recv())
+                    kind = frame.get("type")
+                    if kind == "conversation_created":
+                        conversation_id = frame["conversation_id"]
+                    elif kind == "chunk":
+                        now = time.perf_counter()
+                        if first is None:
+                            first = now
+                            recorder.ttft_ms.append((now - sent) * 1000)
+                        else:
+                            recorder.itl_ms.append((now - last) * 1000)
+                        last = now
+                        recorder.frames += 1
+                        recorder.chars += len(frame.get("content", ""))
+                        text.append(frame.get("content", ""))
+                    elif kind == "error":
+                        failed = True
+                    elif kind == "complete":
+                        break
+                recorder.ws_duration_ms.append((time.perf_counter() - sent) * 1000)
+                recorder.ws_messages += 1
+                response = "".join(text)
+                if failed or first is None or ALL_PROVIDERS_FAILED in response:
+                    recorder.ws_errors += 1
+                elif PROVIDER_NOTICE in response:
+                    recorder.ws_fallbacks += 1
+    except Exception as e:
+        recorder.ws_errors += 1
+        print(f"WebSocket session {session} failed: {e}", file=sys.stderr)
+
+
+async def http_calls(args, client: httpx.AsyncClient, queue: asyncio.Queue, recorder: Recorder):
+    while True:
+        try:
+            index = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        started = time.perf_counter()
+        try:
+            response = await client.post("/api/chat/", json={
+                "message": _prompt(args, -1, index),
+                "model": args.model,
+                "stream": False,
+            })
+            text = response.json().get("response", "") if response.status_code == 200 else ""
+            if response.status_code != 200 or ALL_PROVIDERS_FAILED in text:
+                recorder.http_errors += 1
+            elif PROVIDER_NOTICE in text:
+                recorder.http_fallbacks += 1
+        except Exception as e:
+            recorder.http_errors += 1
+            print(f"POST /api/chat/ failed: {e}", file=sys.stderr)
+        recorder.http_latency_ms.append((time.perf_counter() - started) * 1000)
+        recorder.http_requests += 1
+
+
+async def sample_worker(client: httpx.AsyncClient, recorder: Recorder):
+    """Read /health/runtime once; with several workers each poll lands on one of them"""
+    try:
+        sample = (await client.get("/health/runtime")).json()
+    except Exception:
+        return
+    worker = recorder.workers.setdefault(sample["pid"], {
+        "rss_mb_max": 0.0,
+        "db_queries_start": sample["db_queries"],
+        "db_seconds_start": sample["db_seconds"],
+    })
+    worker["rss_mb_max"] = max(worker["rss_mb_max"], round(sample["rss_bytes"] / 2 ** 20, 1))
+    worker["rss_mb_last"] = round(sample["rss_bytes"] / 2 ** 20, 1)
+    worker["db_queries"] = sample["db_queries"] - worker["db_queries_start"]
+    worker["db_seconds"] = round(sample["db_seconds"] - worker["db_seconds_start"], 4)
+
+
+async def sample_workers(client: httpx.AsyncClient, recorder: Recorder, stop: asyncio.Event):
+    while not stop.is_set():
+        await sample_worker(client, recorder)
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=0.5)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_load(args, base_url: str) -> Dict:
+    recorder = Recorder()
+    stop = asyncio.Event()
+    limits = httpx.Limits(max_connections=args.http_concurrency + 4)
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits) as client:
+        # Baseline counters for each worker before any load
+        for _ in range(max(4, 4 * args.workers)):
+            await sample_worker(client, recorder)
+        sampler = asyncio.create_task(sample_workers(client, recorder, stop))
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for index in range(args.http_requests):
+            queue.put_nowait(index)
+
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(ws_session(args, base_url, session, recorder) for session in range(args.sessions)),
+            *(http_calls(args, client, queue, recorder) for _ in range(min(args.http_concurrency, args.http_requests)))
+        )
+        wall = time.perf_counter() - started
+
+        stop.set()
+        await sampler
+        # A few more polls so every worker's final counters are seen
+        for _ in range(max(4, 4 * len(recorder.workers))):
+            await sample_worker(client, recorder)
+
+    for worker in recorder.workers.values():
+        worker.pop("db_queries_start", None)
+        worker.pop("db_seconds_start", None)
+
+    return {
+        "wall_seconds": round(wall, 3),
+        "websocket": {
+            "sessions": args.sessions,
+            "messages": recorder.ws_messages,
+            "errors": recorder.ws_errors,
+            "fallbacks": recorder.ws_fallbacks,
+            "frames": recorder.frames,
+            "chars": recorder.chars,
+            "ttft_ms": _summary(recorder.ttft_ms),
+            "inter_token_ms": _summary(recorder.itl_ms),
+            "response_ms": _summary(recorder.ws_duration_ms),
+            "messages_per_sec": round(recorder.ws_messages / wall, 2) if wall else 0.0,
+            "chars_per_sec": round(recorder.chars / wall, 1) if wall else 0.0,
+        },
+        "http": {
+            "requests": recorder.http_requests,
+            "errors": recorder.http_errors,
+            "fallbacks": recorder.http_fallbacks,
+            "latency_ms": _summary(recorder.http_latency_ms),
+            "requests_per_sec": round(recorder.http_requests / wall, 2) if wall else 0.0,
+        },
+        "workers": {str(pid): stats for pid, stats in sorted(recorder.workers.items())},
+    }
+
+
+def _wait_for(url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+
+def spawn_stack(args, workdir: str):
+    """Start the fake provider and the app; returns (base_url, processes)"""
+    provider_port = _free_port()
+    app_port = _free_port()
+    provider = subprocess.Popen(
+        [
+            sys.executable, "-m", "bench.fake_provider",
+            "--port", str(provider_port),
+            "--ttft-ms", str(args.ttft_ms),
+            "--tokens-per-sec", str(args.tokens_per_sec),
+            "--tokens", str(args.tokens),
+            "--error-rate", str(args.error_rate),
+            "--rate-limit-rate", str(args.rate_limit_rate),
+        ],
+        cwd=ROOT
+    )
+    processes = [provider]
+    _wait_for(f"http://127.0.0.1:{provider_port}/v1/models", provider)
+
+    env = {
+        key: value for key, value in os.environ.items()
+        if not key.endswith("_API_KEY") and not key.endswith("_BASE_URL")
+    }
+    env.update({
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{provider_port}/v1",
+        "ANTHROPIC_API_KEY": "bench",
+        "ANTHROPIC_BASE_URL": f"http://127.0.0.1:{provider_port}",
+        "DATABASE_URL": f"sqlite:///{Path(workdir) / 'bench.db'}",
+        "UPLOAD_DIR": str(Path(workdir) / "uploads"),
+        "AUDIO_CACHE_DIR": str(Path(workdir) / "audio"),
+        # Summaries would add provider calls the load generator did not ask for
+        "SUMMARY_ENABLED": "false",
+    })
+    env.update(dict(item.split("=", 1) for item in args.env))
+    server = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--host", "127.0.0.1",
+            "--port", str(app_port),
+            "--workers", str(args.workers),
+            "--log-level", "warning",
+        ],
+        cwd=ROOT,
+        env=env
+    )
+    processes.append(server)
+    _wait_for(f"http://127.0.0.1:{app_port}/health", server)
+    return f"http://127.0.0.1:{app_port}", processes
+
+
+def compare(current: Dict, previous: Dict):
+    """Print key metrics next to an earlier run"""
+    rows = [
+        ("websocket", "ttft_ms", "p50"), ("websocket", "ttft_ms", "p95"),
+        ("websocket", "inter_token_ms", "p50"), ("websocket", "inter_token_ms", "p95"),
+        ("websocket", "response_ms", "p95"), ("websocket", "messages_per_sec", None),
+        ("websocket", "frames", None), ("websocket", "errors", None),
+        ("http", "latency_ms", "p50"), ("http", "latency_ms", "p95"),
+        ("http", "requests_per_sec", None), ("http", "errors", None),
+    ]
+    print(f"\n{'metric':<34}{'previous':>12}{'current':>12}{'change':>10}")
+    for section, name, stat in rows:
+        def value(report):
+            item = report["results"][section].get(name)
+            return item.get(stat) if stat and isinstance(item, dict) else item
+        before, after = value(previous), value(current)
+        label = f"{section}.{name}" + (f".{stat}" if stat else "")
+        change = f"{(after - before) / before * 100:+.1f}%" if before and after is not None else ""
+        print(f"{label:<34}{before if before is not None else '-':>12}{after if after is not None else '-':>12}{change:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end load benchmark")
+    parser.add_argument("--target", help="Base URL of a running app; omit to start the fake stack")
+    parser.add_argument("--sessions", type=int, default=20, help="Concurrent WebSocket chat sessions")
+    parser.add_argument("--messages", type=int, default=3, help="Chat messages per WebSocket session")
+    parser.add_argument("--http-requests", type=int, default=20, help="Total POST /api/chat/ calls")
+    parser.add_argument("--http-concurrency", type=int, default=10)
+    parser.add_argument(
+        "--model", default="gpt-3.5-turbo",
+        help="Model to request; Gemini models need --target with a real GOOGLE_API_KEY (the fake provider has no Gemini API)"
+    )
+    parser.add_argument("--identical-prompts", action="store_true", help="Send the same prompt everywhere")
+    parser.add_argument("--stream-window-ms", type=float, help="Per-connection WebSocket coalescing window")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the spawned app")
+    parser.add_argument("--ttft-ms", type=float, default=300)
+    parser.add_argument("--tokens-per-sec", type=float, default=60)
+    parser.add_argument("--tokens", type=int, default=120)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--env", action="append", default=[], help="Extra KEY=VALUE for the spawned app")
+    parser.add_argument("--label", default="", help="Name stored with the results")
+    parser.add_argument("--output", default=str(ROOT / "bench" / "results"))
+    parser.add_argument("--compare", help="Earlier results JSON to compare against")
+    args = parser.parse_args()
+    if not args.target and args.model.startswith("gemini"):
+        parser.error("the fake provider cannot serve Gemini models; use --target with a real GOOGLE_API_KEY")
+
+    processes = []
+    with tempfile.TemporaryDirectory(prefix="bench-") as workdir:
+        try:
+            base_url = args.target.rstrip("/") if args.target else None
+            if base_url is None:
+                base_url, processes = spawn_stack(args, workdir)
+            results = asyncio.run(run_load(args, base_url))
+        finally:
+            for process in reversed(processes):
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+    report = {
+        "label": args.label,
+        "started_at": datetime.utcnow().isoformat(),
+        "git_commit": subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip(),
+        "python": platform.python_version(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "results": results,
+    }
+    output = Path(args.output)
+    output.mkdir(parents=True, exist_ok=True)
+    path = output / f"{datetime.utcnow():%Y%m%d-%H%M%S}{'-' + args.label if args.label else ''}.json"
+    path.write_text(json.dumps(report, indent=2))
+    print(json.dumps(results, indent=2))
+    print(f"\nSaved {path}")
+
+    if args.compare:
+        compare(report, json.loads(Path(args.compare).read_text()))
+
+
+if __name__ == "__main__":
+    main()
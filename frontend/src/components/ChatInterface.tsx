@@ -42,7 +42,10 @@ export default function ChatInterface({ conversationId, model = 'gpt-3.5-turbo',
   const [continuousListening, setContinuousListening] = useState(false)
   const [editingMessageId, setEditingMessageId] = useState<string | null>(null)
   const [editedContent, setEditedContent] = useState('')
+  const [olderCursor, setOlderCursor] = useState<string | null>(null)  // next page of older messages, if any
+  const prependingRef = useRef(false)
   const messagesEndRef = useRef<HTMLDivElement>(null)
+  const audioIds = useRef<Record<string, string>>({})  // messageId -> cached speech id
   const currentMessageRef = useRef<string>('')
   const fileInputRef = useRef<HTMLInputElement>(null)
   const imageInputRef = useRef<HTMLInputElement>(null)
@@ -217,9 +220,39 @@ export default function ChatInterface({ conversationId, model = 'gpt-3.5-turbo',
   }, []) // Remove conversationId dependency to prevent reconnections
 
   useEffect(() => {
+    // Loading older messages should not jump to the bottom
+    if (prependingRef.current) {
+      prependingRef.current = false
+      return
+    }
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' })
   }, [messages])
 
+  // Convert database messages to UI format
+  const toMessages = (rows: any[]): Message[] => rows.map((msg: any) => ({
+    id: msg.id.toString(),
+    role: msg.role as 'user' | 'assistant',
+    content: msg.content,
+    timestamp: new Date(msg.created_at),
+    attachments: msg.meta_data?.attachments || undefined
+  }))
+
+  const loadOlderMessages = async () => {
+    if (!conversationId || !olderCursor) return
+    const API_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000'
+    try {
+      const response = await fetch(`${API_URL}/api/chat/conversations/${conversationId}?before=${encodeURIComponent(olderCursor)}`)
+      if (response.ok) {
+        const data = await response.json()
+        prependingRef.current = true
+        setMessages(prev => [...toMessages(data.messages), ...prev])
+        setOlderCursor(data.older_cursor)
+      }
+    } catch (error) {
+      console.error('Error loading older messages:', error)
+    }
+  }
+
   // Load conversation messages when conversation ID changes
   useEffect(() => {
     // Use environment variable for API URL with fallback
@@ -231,15 +264,9 @@ export default function ChatInterface({ conversationId, model = 'gpt-3.5-turbo',
           const response = await fetch(`${API_URL}/api/chat/conversations/${conversationId}`)
           if (response.ok) {
             const data = await response.json()
-            // Convert database messages to UI format
-            const loadedMessages: Message[] = data.messages.map((msg: any) => ({
-              id: msg.id.toString(),
-              role: msg.role as 'user' | 'assistant',
-              content: msg.content,
-              timestamp: new Date(msg.created_at),
-              attachments: msg.meta_data?.attachments || undefined
-            }))
-            setMessages(loadedMessages)
+            // The newest page; older messages load on demand
+            setMessages(toMessages(data.messages))
+            setOlderCursor(data.older_cursor)
           }
         } catch (error) {
           console.error('Error loading conversation:', error)
@@ -247,6 +274,7 @@ export default function ChatInterface({ conversationId, model = 'gpt-3.5-turbo',
       } else {
         // New conversation - clear messages
         setMessages([])
+        setOlderCursor(null)
         setInput('')
         currentMessageRef.current = ''
         setIsLoading(false)
@@ -435,6 +463,20 @@ export default function ChatInterface({ conversationId, model = 'gpt-3.5-turbo',
       return
     }
 
+    const cachedId = audioIds.current[messageId]
+    if (cachedId) {
+      // Replays stream from the server's audio cache, with seeking via range requests
+      setPlayingAudio(messageId)
+      const audio = new Audio(`http://localhost:8000/api/chat/tts/${cachedId}`)
+      audio.onended = () => setPlayingAudio(null)
+      audio.onerror = () => {
+        delete audioIds.current[messageId]
+        setPlayingAudio(null)
+      }
+      audio.play()
+      return
+    }
+
     try {
       setPlayingAudio(messageId)
       const response = await fetch('http://localhost:8000/api/chat/tts', {
@@ -444,6 +486,8 @@ export default function ChatInterface({ conversationId, model = 'gpt-3.5-turbo',
       })
 
       if (response.ok) {
+        const audioId = response.headers.get('X-Audio-Id')
+        if (audioId) audioIds.current[messageId] = audioId
         const audioBlob = await response.blob()
         const audioUrl = URL.createObjectURL(audioBlob)
         const audio = new Audio(audioUrl)
@@ -712,6 +756,17 @@ export default function ChatInterface({ conversationId, model = 'gpt-3.5-turbo',
             </div>
           )}
 
+          {olderCursor && (
+            <div className="flex justify-center">
+              <button
+                onClick={loadOlderMessages}
+                className="text-xs sm:text-sm text-muted-foreground hover:text-primary transition-colors"
+              >
+                Load older messages
+              </button>
+            </div>
+          )}
+
           {messages.map((message) => (
             <div
               key={message.id}
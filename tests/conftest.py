@@ -0,0 +1,18 @@
+import os
+import tempfile
+
+import pytest
+
+# Point the app at a throwaway database and upload directory before any app module loads
+_data_dir = tempfile.mkdtemp(prefix="ai-agent-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_data_dir}/test.db"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ["UPLOAD_DIR"] = os.path.join(_data_dir, "uploads")
+os.environ["AUDIO_CACHE_DIR"] = os.path.join(_data_dir, "audio_cache")
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    from app.database import init_db
+
+    init_db()
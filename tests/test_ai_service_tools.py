@@ -0,0 +1,63 @@
+import asyncio
+from types import SimpleNamespace
+
+from app.services.ai_service import AIService
+from app.services.provider_registry import ProviderRegistry
+
+
+def chunk(content=None, tool_calls=None):
+    delta = SimpleNamespace(content=content, tool_calls=tool_calls)
+    return SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+
+def tool_call(index, id, name, arguments):
+    return SimpleNamespace(index=index, id=id, function=SimpleNamespace(name=name, arguments=arguments))
+
+
+class FakeCompletions:
+    """First round asks for a tool, the second answers"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        if self.calls == 1:
+            frames = [chunk(tool_calls=[tool_call(0, "call_1", "web_search", '{"query": "x"}')])]
+        else:
+            frames = [chunk("done")]
+
+        async def stream():
+            for frame in frames:
+                yield frame
+
+        return stream()
+
+
+def test_scheduler_slot_is_released_while_tools_run():
+    async def test():
+        service = AIService(ProviderRegistry())
+        completions = FakeCompletions()
+        service.openai_client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        scheduler = service.registry.scheduler("openai")
+        in_flight_during_tools = []
+
+        async def run_all(calls):
+            in_flight_during_tools.append(scheduler.in_flight)
+            return ["result"]
+
+        service.tool_runner.run_all = run_all
+        admitted = scheduler.stats["admitted"]
+        text = [
+            chunk async for chunk in service._scheduled_stream(
+                "openai", "gpt-4o", "interactive", "hi", [], None, [{"type": "function"}], []
+            )
+        ]
+
+        assert text == ["done"]
+        assert in_flight_during_tools == [0]
+        # Each model round is admitted on its own
+        assert scheduler.stats["admitted"] - admitted == 2
+        assert scheduler.in_flight == 0
+
+    asyncio.run(test())
@@ -0,0 +1,109 @@
+import asyncio
+
+from app.database import AsyncSessionLocal, close_db, run_write
+from app.models.conversation import Conversation
+from app.services.conversation_service import ConversationService
+from app.services.conversation_summarizer import ConversationSummarizer
+
+
+class FakeAIService:
+    """Stands in for AIService, running ``during`` while a summary is generated"""
+
+    def __init__(self, during=None):
+        self.during = during
+
+    async def stream_chat(self, prompt, outcome, **kwargs):
+        if self.during:
+            await self.during()
+        outcome.update(success=True, response="new summary")
+        yield "new summary"
+
+
+def run(test):
+    async def main():
+        try:
+            await test()
+        finally:
+            await close_db()
+
+    asyncio.run(main())
+
+
+async def make_conversation(messages: int = 4, summary_through: int = 0):
+    service = ConversationService()
+    conversation_id = (await service.create_conversation())["id"]
+    ids = [
+        (await service.save_message(conversation_id, "user", f"message {i}"))["id"]
+        for i in range(messages)
+    ]
+    if summary_through:
+        async def set_summary(db):
+            conversation = await db.get(Conversation, conversation_id)
+            conversation.extra_data = {"summary": "old summary", "summary_watermark": ids[summary_through - 1]}
+
+        await run_write(set_summary)
+    return service, conversation_id, ids
+
+
+async def extra_data(conversation_id: int) -> dict:
+    async with AsyncSessionLocal() as db:
+        return (await db.get(Conversation, conversation_id)).extra_data or {}
+
+
+async def compact(conversation_id: int, during=None):
+    summarizer = ConversationSummarizer(FakeAIService(during))
+    summarizer.keep_recent_tokens = 0
+    await summarizer._compact(conversation_id)
+
+
+def test_compaction_saves_summary():
+    async def test():
+        _, conversation_id, ids = await make_conversation()
+        await compact(conversation_id)
+        saved = await extra_data(conversation_id)
+        assert saved["summary"] == "new summary"
+        assert saved["summary_watermark"] == ids[-1]
+
+    run(test)
+
+
+def test_summary_invalidated_during_summarize_is_not_restored():
+    async def test():
+        service, conversation_id, ids = await make_conversation(summary_through=2)
+
+        # Editing a summarized message drops the summary the compaction extends
+        async def edit():
+            assert await service.update_message_content(ids[0], "edited")
+
+        await compact(conversation_id, during=edit)
+        saved = await extra_data(conversation_id)
+        assert "summary" not in saved
+        assert "summary_watermark" not in saved
+
+    run(test)
+
+
+def test_message_edited_during_summarize_is_not_summarized():
+    async def test():
+        service, conversation_id, ids = await make_conversation()
+
+        async def edit():
+            assert await service.update_message_content(ids[1], "edited")
+
+        await compact(conversation_id, during=edit)
+        assert "summary" not in await extra_data(conversation_id)
+
+    run(test)
+
+
+def test_messages_cut_during_summarize_are_not_summarized():
+    async def test():
+        service, conversation_id, ids = await make_conversation()
+
+        async def cut():
+            assert await service.remove_messages_after(ids[1], conversation_id)
+
+        await compact(conversation_id, during=cut)
+        assert "summary" not in await extra_data(conversation_id)
+
+    run(test)
@@ -0,0 +1,35 @@
+import asyncio
+
+from app.services import generated_images
+from app.services.generated_images import GeneratedImageStore, INDEX_FILE
+
+PNG = b"\x89PNG\r\n\x1a\n"
+
+
+def test_concurrent_generations_all_succeed_and_are_indexed(tmp_path, monkeypatch):
+    monkeypatch.setattr(generated_images, "UPLOAD_DIR", tmp_path)
+    monkeypatch.setenv("IMAGE_GEN_MAX_CONCURRENCY", "16")
+
+    def make_generate(prompt):
+        async def generate():
+            await asyncio.sleep(0)
+            return PNG + prompt.encode()
+        return generate
+
+    async def run():
+        store = GeneratedImageStore(tmp_path / "generated")
+        prompts = [f"image {i}" for i in range(64)]
+        batches = await asyncio.gather(*(
+            store.generate_many(prompts[i::16], "dall-e-3", "1024x1024", make_generate) for i in range(16)
+        ))
+        return store, [result for batch in batches for result in batch]
+
+    store, results = asyncio.run(run())
+
+    assert [r for r in results if r["status"] == "error"] == []
+    assert len(store.entries) == 64
+    root = tmp_path / "generated"
+    assert list(root.glob("*.tmp")) == []
+    reloaded = GeneratedImageStore(root)
+    assert set(reloaded.entries) == set(store.entries)
+    assert (root / INDEX_FILE).exists()
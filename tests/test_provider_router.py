@@ -0,0 +1,55 @@
+import pytest
+
+from app.services.provider_router import classify_error
+from app.services.provider_scheduler import QueueTimeout
+
+
+class APIStatusError(Exception):
+    def __init__(self, message, status_code=None, code=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.code = code
+
+
+class NotFound(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+        self.code = 404
+
+
+class ResourceExhausted(Exception):
+    pass
+
+
+class RateLimitError(APIStatusError):
+    pass
+
+
+class APITimeoutError(Exception):
+    pass
+
+
+@pytest.mark.parametrize("error, kind", [
+    # Words that merely contain "rate" or "insufficient"
+    (NotFound("404 models/gemini-x is not found for API version v1beta, or is not supported for generateContent"), "error"),
+    (APIStatusError("Please provide a more accurate description of the tool", 400), "error"),
+    (APIStatusError("Use separate messages for each tool result", 400), "error"),
+    (APIStatusError("max_tokens is insufficient for the requested output", 400), "error"),
+    (Exception("Failed to generate a response"), "error"),
+    # Status codes and exception types
+    (RateLimitError("Rate limit reached for gpt-4o", 429, "rate_limit_exceeded"), "rate_limit"),
+    (RateLimitError("You exceeded your current quota", 429, "insufficient_quota"), "quota"),
+    (ResourceExhausted("429 Resource has been exhausted (e.g. check quota)."), "rate_limit"),
+    (ResourceExhausted("429 You exceeded your current quota, please check your plan and billing details."), "quota"),
+    (APIStatusError("Incorrect API key provided", 401), "auth"),
+    (APIStatusError("Forbidden", 403), "auth"),
+    (APITimeoutError("Request timed out."), "timeout"),
+    (QueueTimeout("queue full"), "throttled"),
+    # Exact phrases when there is no status
+    (Exception("Your credit balance is too low to access the Anthropic API"), "quota"),
+    (Exception("rate limit exceeded, retry later"), "rate_limit"),
+    (Exception("API key not valid. Please pass a valid API key."), "auth"),
+    (Exception("The read operation timed out"), "timeout"),
+])
+def test_classify_error(error, kind):
+    assert classify_error(error) == kind